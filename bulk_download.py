@@ -0,0 +1,208 @@
+"""Downloads the error logs of a report as one archive
+
+Reading each error log with its own request costs a round trip per file.
+Instead, a bulk download ticket is created for all the error logs of the
+report and the tar archive of the ticket is read as a stream, keeping the
+content of each error log by container id and file name. The members of bulk
+archives are named {container type}/{container id}/{file name}.
+
+ArchiveAdapter is a requests transport adapter serving bulk downloads from a
+local directory, to run bulk downloads offline against a recording.
+"""
+import io
+import json
+import logging
+import os
+import tarfile
+import threading
+import urllib.parse
+import uuid
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+log = logging.getLogger('grp-2')
+
+
+class BulkErrorLogs(object):
+    """The content of the error logs read from a bulk archive, by container
+    id and file name. Error logs are removed once they are taken, so that
+    the archive content is only held until each container is read.
+    """
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def add(self, container_id, filename, data):
+        with self._lock:
+            self._data[(container_id, filename)] = data
+
+    def pop(self, container_id, filename):
+        """Takes the content of an error log
+
+        Args:
+            container_id (str): The id of the container of the error log
+            filename (str): The name of the error log
+
+        Returns:
+            bytes|None: The content, None if the error log was not in the
+                archive
+        """
+        with self._lock:
+            return self._data.pop((container_id, filename), None)
+
+
+def get_file_refs(error_containers, error_log_files):
+    """Returns the bulk download references of the error logs
+
+    Args:
+        error_containers (list): container dictionaries (_id and type)
+        error_log_files (dict): The error log file names by container id
+
+    Returns:
+        list: A dictionary per error log, with its container type, container
+            id and file name
+    """
+    return [
+        {
+            'container_name': error_container['type'],
+            'container_id': error_container['_id'],
+            'filename': filename
+        }
+        for error_container in error_containers
+        for filename in error_log_files.get(error_container['_id']) or []
+    ]
+
+
+def read_archive(archive_file, file_refs, max_size=None):
+    """Reads the error logs of a bulk archive one member at a time
+
+    Args:
+        archive_file (file): The tar archive, read as a stream
+        file_refs (list): The references the archive was requested with,
+            other members are skipped
+        max_size (int): Optional size in bytes above which members are
+            skipped, so that large error logs are streamed from their
+            container instead of held in memory
+
+    Returns:
+        BulkErrorLogs: The content of the error logs
+    """
+    requested = {(file_ref['container_id'], file_ref['filename'])
+                 for file_ref in file_refs}
+    bulk_error_logs = BulkErrorLogs()
+    with tarfile.open(fileobj=archive_file, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            key = tuple(member.name.split('/')[-2:])
+            if key not in requested:
+                continue
+            if max_size is not None and member.size > max_size:
+                log.info('Skipping %s of %s in bulk archive, %d bytes',
+                         key[1], key[0], member.size)
+                continue
+            bulk_error_logs.add(*key, archive.extractfile(member).read())
+    return bulk_error_logs
+
+
+def download_error_logs(client, file_refs, max_size=None):
+    """Downloads error logs with a single bulk download
+
+    Args:
+        client (Client): Flywheel Api client
+        file_refs (list): The error logs, as returned by get_file_refs
+        max_size (int): Optional size in bytes above which error logs are
+            not kept, see read_archive
+
+    Returns:
+        BulkErrorLogs: The content of the error logs
+    """
+    if not file_refs:
+        return BulkErrorLogs()
+    summary = client.create_download_ticket({'files': file_refs}, type='bulk')
+    response = client.files_api.download_ticket_with_http_info(
+        summary.ticket, _return_http_data_only=True, _preload_content=False
+    )
+    try:
+        bulk_error_logs = read_archive(response.raw, file_refs,
+                                       max_size=max_size)
+    finally:
+        response.close()
+    log.info('Read %d of %d error logs from bulk archive',
+             len(bulk_error_logs), len(file_refs))
+    return bulk_error_logs
+
+
+class ArchiveAdapter(requests.adapters.BaseAdapter):
+    """Serves bulk download tickets from a local directory holding the
+    files of each container in {container id}/{file name}, e.g. the files
+    directory of a snapshot. Other requests are sent with another adapter.
+
+    Args:
+        files_dir (str): The directory of the files
+        adapter (BaseAdapter): The adapter sending the other requests, e.g.
+            a replay.ReplayAdapter
+    """
+    def __init__(self, files_dir, adapter):
+        super(ArchiveAdapter, self).__init__()
+        self.files_dir = files_dir
+        self.adapter = adapter
+        self.tickets = {}
+        self.archive_count = 0
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        parts = urllib.parse.urlsplit(request.url)
+        query = dict(urllib.parse.parse_qsl(parts.query))
+        if not parts.path.endswith('/download'):
+            return self.adapter.send(request, **kwargs)
+        if request.method == 'POST' and query.get('type') == 'bulk':
+            return self._create_ticket(request)
+        if request.method == 'GET' and query.get('ticket') in self.tickets:
+            return self._download_ticket(request, query['ticket'])
+        return self.adapter.send(request, **kwargs)
+
+    def _create_ticket(self, request):
+        file_refs = json.loads(request.body)['files']
+        ticket = uuid.uuid4().hex
+        with self._lock:
+            self.tickets[ticket] = file_refs
+        return self._response(request, 'application/json', json.dumps({
+            'ticket': ticket,
+            'file_cnt': len(file_refs),
+            'size': 0
+        }).encode())
+
+    def _download_ticket(self, request, ticket):
+        with self._lock:
+            file_refs = self.tickets.pop(ticket)
+            self.archive_count += 1
+        content = io.BytesIO()
+        with tarfile.open(fileobj=content, mode='w') as archive:
+            for file_ref in file_refs:
+                path = os.path.join(self.files_dir, file_ref['container_id'],
+                                    file_ref['filename'])
+                if os.path.exists(path):
+                    archive.add(path, '{container_name}/{container_id}/{filename}'.format(
+                        **file_ref
+                    ))
+        return self._response(request, 'application/octet-stream',
+                              content.getvalue())
+
+    def _response(self, request, content_type, content):
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict({'Content-Type': content_type})
+        response.raw = io.BytesIO(content)
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        self.adapter.close()
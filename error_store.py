@@ -0,0 +1,112 @@
+"""Sorts report records that may not fit in memory
+
+Records are buffered in memory, each full buffer is sorted and spilled to a
+temporary file as one json record per line, and the sorted records are read
+back by merging the spilled runs (k-way merge).
+"""
+import heapq
+import json
+import os
+import tempfile
+
+
+# Records held in memory before a sorted run is spilled to disk
+DEFAULT_BUFFER_SIZE = 100000
+
+
+def get_report_sort_key(record):
+    """Orders report records by path, then container type"""
+    return record.get('path') or '', record.get('type') or ''
+
+
+class SortedErrorStore(object):
+    """Collects records and yields them sorted, with at most buffer_size
+    records in memory while collecting and one record per spilled run while
+    merging. Records with equal keys keep the order they were added in.
+
+    Args:
+        key (callable): Returns the sort key of a record
+        buffer_size (int): Records held in memory before spilling
+    """
+    def __init__(self, key=get_report_sort_key, buffer_size=DEFAULT_BUFFER_SIZE):
+        self.key = key
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._run_paths = []
+        self._tmp_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def spilled_runs(self):
+        return len(self._run_paths)
+
+    def add(self, record):
+        self._buffer.append(record)
+        if len(self._buffer) >= self.buffer_size:
+            self._spill()
+
+    def extend(self, records):
+        for record in records:
+            self.add(record)
+
+    def _spill(self):
+        if self._tmp_dir is None:
+            self._tmp_dir = tempfile.TemporaryDirectory(prefix='grp-2-errors-')
+        # sort is stable, equal records stay in insertion order
+        self._buffer.sort(key=self.key)
+        run_path = os.path.join(self._tmp_dir.name,
+                                'run-{}.jsonl'.format(len(self._run_paths)))
+        with open(run_path, 'w') as run_file:
+            for record in self._buffer:
+                run_file.write(json.dumps(record) + '\n')
+        self._run_paths.append(run_path)
+        self._buffer = []
+
+    def _read_run(self, run_path):
+        with open(run_path) as run_file:
+            for line in run_file:
+                yield json.loads(line)
+
+    def __iter__(self):
+        """Yields the records in key order, the store is closed once they are
+        all read
+
+        Yields:
+            dict: The records
+        """
+        try:
+            self._buffer.sort(key=self.key)
+            # Runs are merged in the order they were spilled, and the buffer
+            # holds the last records, so that ties keep insertion order
+            runs = [self._read_run(run_path) for run_path in self._run_paths]
+            yield from heapq.merge(*runs, self._buffer, key=self.key)
+        finally:
+            self.close()
+
+    def close(self):
+        self._buffer = []
+        self._run_paths = []
+        if self._tmp_dir is not None:
+            self._tmp_dir.cleanup()
+            self._tmp_dir = None
+
+
+def sort_errors(errors, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Sorts report records by path and container type without holding more
+    than buffer_size of them in memory
+
+    Args:
+        errors (iterable): The records, can be a generator
+        buffer_size (int): Records held in memory before spilling
+
+    Returns:
+        iterable: The sorted records
+    """
+    store = SortedErrorStore(buffer_size=buffer_size)
+    store.extend(errors)
+    return iter(store)
@@ -0,0 +1,212 @@
+"""Direct python checks for the simple schemas most error logs carry
+
+compile_simple_schema turns a schema that only uses type, enum, pattern,
+required, minimum/maximum (and a few other keywords that do not descend into
+subschemas) into a function returning the same messages as
+jsonschema.Draft7Validator, without building a validator for every error.
+"""
+import numbers
+import re
+
+import jsonschema
+
+
+# Keywords jsonschema ignores, e.g. description, are ignored here too
+DRAFT7_KEYWORDS = set(jsonschema.Draft7Validator.VALIDATORS)
+
+
+def _is_integer(instance):
+    if isinstance(instance, bool):
+        return False
+    # Draft 6 and later consider 1.0 an integer
+    return (
+        isinstance(instance, int) or
+        isinstance(instance, float) and instance.is_integer()
+    )
+
+
+def _is_number(instance):
+    return (
+        not isinstance(instance, bool) and
+        isinstance(instance, numbers.Number)
+    )
+
+
+TYPE_CHECKS = {
+    'array': lambda instance: isinstance(instance, list),
+    'boolean': lambda instance: isinstance(instance, bool),
+    'integer': _is_integer,
+    'null': lambda instance: instance is None,
+    'number': _is_number,
+    'object': lambda instance: isinstance(instance, dict),
+    'string': lambda instance: isinstance(instance, str)
+}
+
+
+def _is_schema_number(value):
+    return _is_number(value) and not isinstance(value, complex)
+
+
+def _compile_type(types):
+    if isinstance(types, str):
+        types = [types]
+    if (
+        not isinstance(types, list) or not types or
+        any(type_ not in TYPE_CHECKS for type_ in types)
+    ):
+        return None
+    checks = [TYPE_CHECKS[type_] for type_ in types]
+    types_repr = ', '.join(repr(type_) for type_ in types)
+
+    def check_type(instance):
+        if not any(check(instance) for check in checks):
+            yield '%r is not of type %s' % (instance, types_repr)
+    return check_type
+
+
+def _compile_enum(enums):
+    if not isinstance(enums, list):
+        return None
+    try:
+        enum_set = frozenset(enums)
+    except TypeError:
+        enum_set = None
+
+    def check_enum(instance):
+        if instance == 0 or instance == 1:
+            # 0/1 must not match False/True and vice versa
+            if not any(
+                isinstance(instance, bool) == isinstance(each, bool) and
+                instance == each
+                for each in enums
+            ):
+                yield '%r is not one of %r' % (instance, enums)
+            return
+        try:
+            found = instance in enum_set if enum_set is not None else instance in enums
+        except TypeError:
+            # Unhashable instance
+            found = instance in enums
+        if not found:
+            yield '%r is not one of %r' % (instance, enums)
+    return check_enum
+
+
+def _compile_pattern(pattern):
+    if not isinstance(pattern, str):
+        return None
+    try:
+        regex = re.compile(pattern)
+    except re.error:
+        return None
+
+    def check_pattern(instance):
+        if isinstance(instance, str) and not regex.search(instance):
+            yield '%r does not match %r' % (instance, pattern)
+    return check_pattern
+
+
+def _compile_required(required):
+    if (
+        not isinstance(required, list) or
+        not all(isinstance(property_, str) for property_ in required)
+    ):
+        return None
+
+    def check_required(instance):
+        if isinstance(instance, dict):
+            for property_ in required:
+                if property_ not in instance:
+                    yield '%r is a required property' % property_
+    return check_required
+
+
+def _compile_bound(message, failed):
+    def compile_bound(bound):
+        if not _is_schema_number(bound):
+            return None
+
+        def check_bound(instance):
+            if _is_number(instance) and failed(instance, bound):
+                yield message % (instance, bound)
+        return check_bound
+    return compile_bound
+
+
+def _compile_length(message, failed):
+    def compile_length(length):
+        if not _is_integer(length):
+            return None
+
+        def check_length(instance):
+            if isinstance(instance, str) and failed(len(instance), length):
+                yield message % (instance,)
+        return check_length
+    return compile_length
+
+
+def _compile_format(format_):
+    # Draft7Validator(schema) has no format checker, format never fails
+    def check_format(instance):
+        return ()
+    return check_format
+
+
+KEYWORD_COMPILERS = {
+    'type': _compile_type,
+    'enum': _compile_enum,
+    'pattern': _compile_pattern,
+    'required': _compile_required,
+    'minimum': _compile_bound('%r is less than the minimum of %r',
+                              lambda instance, bound: instance < bound),
+    'maximum': _compile_bound('%r is greater than the maximum of %r',
+                              lambda instance, bound: instance > bound),
+    'exclusiveMinimum': _compile_bound(
+        '%r is less than or equal to the minimum of %r',
+        lambda instance, bound: instance <= bound
+    ),
+    'exclusiveMaximum': _compile_bound(
+        '%r is greater than or equal to the maximum of %r',
+        lambda instance, bound: instance >= bound
+    ),
+    'minLength': _compile_length('%r is too short',
+                                 lambda length, bound: length < bound),
+    'maxLength': _compile_length('%r is too long',
+                                 lambda length, bound: length > bound),
+    'format': _compile_format
+}
+
+
+def compile_simple_schema(schema):
+    """Compiles a simple schema into a function returning its validation error
+    messages
+
+    Args:
+        schema (dict): jsonschema object
+
+    Returns:
+        function|None: function taking a value and returning the list of the
+            validation error messages jsonschema would return, unsorted.
+            None if the schema uses keywords (or values) that are not
+            supported, the schema must then be validated with jsonschema
+    """
+    if not isinstance(schema, dict):
+        return None
+    checks = []
+    for keyword, value in schema.items():
+        if keyword not in DRAFT7_KEYWORDS:
+            continue
+        compile_keyword = KEYWORD_COMPILERS.get(keyword)
+        if compile_keyword is None:
+            return None
+        check = compile_keyword(value)
+        if check is None:
+            return None
+        checks.append(check)
+
+    def check_schema(instance):
+        messages = []
+        for check in checks:
+            messages.extend(check(instance))
+        return messages
+    return check_schema
@@ -0,0 +1,139 @@
+"""Processes the error containers subtree by subtree
+
+Discovery lists the error subjects, then the error sessions, then the error
+acquisitions, so consecutive containers rarely share their parents.
+schedule_by_subtree orders the containers so that each subject is followed by
+its sessions and each session by its acquisitions. SubtreeCache then only
+holds the containers of the current subtree, which serve almost all the
+parent lookups. restore_order puts the errors back in the discovery order
+for the report.
+"""
+import logging
+import threading
+
+
+log = logging.getLogger('grp-2')
+
+LEVELS = ['group', 'project', 'subject', 'session', 'acquisition']
+
+
+def get_subtree(container, container_type):
+    """Returns the subject and session a container belongs to
+
+    Args:
+        container (Container): A flywheel container
+        container_type (str): The type of the container
+
+    Returns:
+        tuple: the subject id and session id, None if the container is not
+            under a subject or session
+    """
+    parents = container.parents or {}
+    subject_id = container.id if container_type == 'subject' else parents.get('subject')
+    session_id = container.id if container_type == 'session' else parents.get('session')
+    return subject_id, session_id
+
+
+def schedule_by_subtree(error_containers, subtrees):
+    """Orders the containers by subject, then session, each subtree in the
+    order of its first container in the discovery order
+
+    Args:
+        error_containers (list): container dictionaries (_id and type)
+        subtrees (dict): The subject and session id of the containers by
+            container id, see get_subtree. Containers missing from it are
+            scheduled first, in their discovery order
+
+    Returns:
+        list: The container dictionaries in processing order
+    """
+    subject_ranks = {}
+    session_ranks = {}
+    keys = {}
+    for index, error_container in enumerate(error_containers):
+        subject_id, session_id = subtrees.get(error_container['_id'], (None, None))
+        subject_rank = subject_ranks.setdefault(subject_id, len(subject_ranks))
+        # Subjects come before their sessions
+        session_rank = -1
+        if session_id is not None:
+            session_rank = session_ranks.setdefault(session_id, len(session_ranks))
+        keys[index] = (subject_rank, session_rank,
+                       LEVELS.index(error_container['type']), index)
+    return [error_containers[index] for index in sorted(keys, key=keys.get)]
+
+
+def restore_order(errors, error_containers):
+    """Orders the errors by the order of their containers
+
+    Args:
+        errors (iterable): The errors, those of each container together
+        error_containers (list): container dictionaries in report order
+
+    Returns:
+        list: The errors in report order
+    """
+    errors_by_id = {}
+    for error in errors:
+        errors_by_id.setdefault(error['_id'], []).append(error)
+    ordered_errors = []
+    for error_container in error_containers:
+        ordered_errors += errors_by_id.pop(error_container['_id'], [])
+    return ordered_errors
+
+
+class SubtreeCache(object):
+    """Wraps a client, caching the containers fetched with get or
+    get_container and the site config. At most one container of each level
+    (group, project, subject, session and acquisition) is kept: fetching a
+    container releases the containers of the subtree that was left.
+
+    Args:
+        client (Client): Flywheel Api client
+    """
+    def __init__(self, client):
+        self._client = client
+        self._containers = [None] * len(LEVELS)
+        self._config = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, _id):
+        with self._lock:
+            for container in self._containers:
+                if container is not None and container.id == _id:
+                    self.hits += 1
+                    return container
+            self.misses += 1
+        container = self._client.get(_id)
+        container_type = getattr(container, 'container_type', None)
+        if container_type in LEVELS:
+            self._enter(container, LEVELS.index(container_type))
+        return container
+
+    def get_container(self, _id):
+        return self.get(_id)
+
+    def _enter(self, container, level):
+        with self._lock:
+            self._containers[level] = container
+            # Keep the children of the new container, e.g. the acquisition
+            # whose session is fetched for its resolver path
+            for child_level in range(level + 1, len(LEVELS)):
+                child = self._containers[child_level]
+                if (
+                    child is not None and
+                    (child.parents or {}).get(LEVELS[level]) != container.id
+                ):
+                    self._containers[child_level] = None
+
+    def get_config(self):
+        if self._config is None:
+            self._config = self._client.get_config()
+        return self._config
+
+    def log_stats(self):
+        log.info('Container cache: %d hits, %d misses', self.hits, self.misses)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
@@ -0,0 +1,123 @@
+"""Runs report stages concurrently, connected by bounded queues"""
+import contextlib
+import queue
+import threading
+
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+class _Failure(object):
+    """Carries an exception raised in a stage thread to the consumer"""
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class _Stopped(Exception):
+    """Raised in a stage thread when the pipeline was shut down"""
+
+
+def run_pipeline(source, stages, queue_size=100, tracer=None):
+    """Runs the source and each stage in its own thread, connected by queues
+    of at most queue_size items, and yields the output of the last stage in
+    order. Because the queues are bounded, at most queue_size items are held
+    between two stages, and a slow stage applies backpressure upstream
+    instead of letting items pile up in memory.
+
+    Args:
+        source (tuple): (name, iterable) of the items fed to the first stage
+        stages (list): list of (name, function) tuples, each function takes
+            one item and returns an iterable of items for the next stage
+        queue_size (int): Maximum number of items waiting between two stages
+        tracer (tracing.Tracer): Optional tracer to time each stage with
+
+    Yields:
+        object: The items returned by the last stage
+    """
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+
+    def put(output_queue, item):
+        while True:
+            if stop.is_set():
+                raise _Stopped()
+            try:
+                output_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(input_queue):
+        while True:
+            if stop.is_set():
+                raise _Stopped()
+            try:
+                return input_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def span(name):
+        if tracer is None:
+            return contextlib.ExitStack()
+        return tracer.span(name)
+
+    def run_source(name, iterable, output_queue):
+        try:
+            with span(name):
+                for item in iterable:
+                    put(output_queue, item)
+            put(output_queue, _DONE)
+        except _Stopped:
+            pass
+        except Exception as e:  # pylint: disable=broad-except
+            fail(output_queue, e)
+
+    def run_stage(name, function, input_queue, output_queue):
+        try:
+            with span(name):
+                while True:
+                    item = get(input_queue)
+                    if item is _DONE or isinstance(item, _Failure):
+                        break
+                    for output in function(item):
+                        put(output_queue, output)
+            put(output_queue, item)
+        except _Stopped:
+            pass
+        except Exception as e:  # pylint: disable=broad-except
+            fail(output_queue, e)
+
+    def fail(output_queue, exception):
+        # Forward the failure through the remaining queues to the consumer
+        try:
+            put(output_queue, _Failure(exception))
+        except _Stopped:
+            pass
+
+    source_name, iterable = source
+    threads = [threading.Thread(target=run_source,
+                                args=(source_name, iterable, queues[0]),
+                                daemon=True)]
+    for index, (name, function) in enumerate(stages):
+        threads.append(threading.Thread(
+            target=run_stage,
+            args=(name, function, queues[index], queues[index + 1]),
+            daemon=True
+        ))
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            item = queues[-1].get()
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.exception
+            yield item
+    finally:
+        # Also reached when the consumer stops early or a stage failed
+        stop.set()
+        for thread in threads:
+            thread.join()
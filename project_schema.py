@@ -0,0 +1,127 @@
+"""Revalidates errors against the current schema of a project
+
+Each error log entry embeds a copy of the schema it failed, as it was when the
+error was logged. With a project schema (the json schema of the file
+metadata, e.g. {"type": "object", "properties": {"info": ...}}) the item of
+each error is instead revalidated against the matching subschema of the
+project schema, so the report follows the current rules.
+"""
+import json
+import logging
+import re
+
+import jsonschema
+
+
+log = logging.getLogger('grp-2')
+
+
+class ProjectSchema(object):
+    """A project schema, checked once, whose subschemas are looked up by the
+    item path of the errors and cached
+
+    Args:
+        schema (dict): jsonschema object validating the file metadata
+    """
+    def __init__(self, schema):
+        jsonschema.Draft7Validator.check_schema(schema)
+        self.schema = schema
+        self._resolver = jsonschema.RefResolver.from_schema(schema)
+        # Subschema by item path, None if the item has no subschema
+        self._subschemas = {}
+        # Validators of the subschemas with references, by item path
+        self._validators = {}
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path) as schema_file:
+            return cls(json.load(schema_file))
+
+    def _resolve(self, schema):
+        """Follows the local references of a schema, None if a reference is
+        not local or is circular
+        """
+        refs = set()
+        while isinstance(schema, dict) and '$ref' in schema:
+            ref = schema['$ref']
+            if not ref.startswith('#') or ref in refs:
+                return None
+            refs.add(ref)
+            _, schema = self._resolver.resolve(ref)
+        return schema
+
+    def _find_subschema(self, item):
+        schema = self._resolve(self.schema)
+        for part in item.split('.'):
+            if not isinstance(schema, dict):
+                return None
+            properties = schema.get('properties') or {}
+            items = schema.get('items')
+            if part in properties:
+                schema = properties[part]
+            elif part.isdigit() and isinstance(items, list):
+                if int(part) >= len(items):
+                    return None
+                schema = items[int(part)]
+            elif part.isdigit() and isinstance(items, dict):
+                schema = items
+            else:
+                schema = next((
+                    subschema for pattern, subschema in
+                    (schema.get('patternProperties') or {}).items()
+                    if re.search(pattern, part)
+                ), schema.get('additionalProperties'))
+                if not isinstance(schema, dict):
+                    return None
+            schema = self._resolve(schema)
+        if not isinstance(schema, dict):
+            return None
+        return schema
+
+    def get_subschema(self, item):
+        """Returns the subschema validating an item
+
+        Args:
+            item (str): The period separated path of the item, e.g.
+                info.header.dicom.Modality
+
+        Returns:
+            dict|None: The subschema, None if the project schema does not
+                describe the item
+        """
+        if not item:
+            return None
+        try:
+            return self._subschemas[item]
+        except KeyError:
+            pass
+        subschema = self._find_subschema(item)
+        if subschema is None:
+            log.debug('No subschema for %s in the project schema', item)
+        self._subschemas[item] = subschema
+        return subschema
+
+    def get_validator(self, item):
+        """Returns a validator of the subschema of an item if the subschema
+        has references. Its references are relative to the project schema, so
+        it is validated with a resolver rooted at the project schema
+
+        Args:
+            item (str): The period separated path of the item
+
+        Returns:
+            jsonschema.Draft7Validator|None: The validator, None if the
+                subschema has no references and can be validated on its own,
+                or if the project schema does not describe the item
+        """
+        try:
+            return self._validators[item]
+        except KeyError:
+            pass
+        subschema = self.get_subschema(item)
+        validator = None
+        if subschema is not None and '"$ref"' in json.dumps(subschema):
+            validator = jsonschema.Draft7Validator(subschema,
+                                                   resolver=self._resolver)
+        self._validators[item] = validator
+        return validator
@@ -0,0 +1,254 @@
+"""Flywheel client wrapper that retries throttled requests and adapts its
+concurrency to server pushback
+"""
+import functools
+import logging
+import random
+import threading
+import time
+import types
+
+import flywheel
+
+
+log = logging.getLogger('grp-2')
+
+# Statuses the api returns when it is overloaded or rate limiting
+RETRY_STATUSES = [429, 502, 503, 504]
+# Statuses of requests the server rejected before processing them, the only
+# ones a call that is not idempotent is retried on. A 502 or a 504 can come
+# after the server already e.g. deleted the file
+REJECTED_STATUSES = [429, 503]
+# Prefixes of the sdk methods that are not idempotent
+NON_IDEMPOTENT_PREFIXES = ('add_', 'create_', 'delete_', 'upload_')
+
+
+def is_idempotent(function):
+    """Returns whether an api call can be repeated without changing its
+    outcome, from the name of the sdk method
+
+    Args:
+        function (callable): The api call
+
+    Returns:
+        bool: False for the methods that add, create, delete or upload
+    """
+    name = getattr(function, '__name__', '')
+    return not name.startswith(NON_IDEMPOTENT_PREFIXES)
+
+
+def get_retry_status(exception, idempotent=True):
+    """Returns the http status of an exception if the request should be
+    retried
+
+    Args:
+        exception (Exception): An exception raised by an api call
+        idempotent (bool): Whether the call can be repeated, if not it is
+            only retried when the server rejected it
+
+    Returns:
+        int|None: The status, None if the request should not be retried
+    """
+    status = getattr(exception, 'status', None)
+    if status is None:
+        # requests.HTTPError
+        response = getattr(exception, 'response', None)
+        status = getattr(response, 'status_code', None)
+    retry_statuses = RETRY_STATUSES if idempotent else REJECTED_STATUSES
+    return status if status in retry_statuses else None
+
+
+def get_retry_after(exception):
+    """Returns the delay requested by the Retry-After header of a response
+
+    Args:
+        exception (Exception): An exception raised by an api call
+
+    Returns:
+        float|None: Seconds to wait, None if the header is missing
+    """
+    headers = getattr(exception, 'headers', None)
+    if headers is None:
+        headers = getattr(getattr(exception, 'response', None), 'headers', None)
+    try:
+        return float(headers['Retry-After'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter(object):
+    """Limits the number of concurrent api calls, the limit is increased
+    additively while calls succeed and decreased multiplicatively when the
+    server pushes back (AIMD)
+
+    Args:
+        initial (int): The initial concurrency limit
+        minimum (int): The lowest the limit can be decreased to
+        maximum (int): The highest the limit can be increased to
+        decrease (float): Factor applied to the limit on pushback
+    """
+    def __init__(self, initial=4, minimum=1, maximum=16, decrease=0.5):
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            # Grows by about one per limit successful calls
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+    def on_pushback(self):
+        with self._condition:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            log.debug('Server pushback, concurrency limit lowered to %.1f',
+                      self.limit)
+
+
+class RateLimitedClient(object):
+    """Wraps a flywheel client, calls are retried with jittered exponential
+    backoff when the server responds with a RETRY_STATUSES status (only
+    REJECTED_STATUSES for calls that are not idempotent), and the number of
+    concurrent calls follows an AdaptiveLimiter.
+
+    Only api calls go through call: the client methods, the methods of the
+    sdk api objects and the page requests of finders. Containers and files
+    returned by the client make their api calls (e.g. container.read_file or
+    container.acquisitions.iter()) through their sdk context, which is
+    replaced by a wrapped one, so their local methods (e.g. to_dict) are
+    neither limited nor counted.
+
+    Args:
+        client (Client): Flywheel Api client
+        max_retries (int): Number of retries before the error is raised
+        base_delay (float): Delay before the first retry, in seconds
+        max_delay (float): Maximum delay between two retries, in seconds
+        limiter (AdaptiveLimiter): Optional limiter, e.g. to share one limiter
+            between several clients
+    """
+    def __init__(self, client, max_retries=5, base_delay=0.5, max_delay=30.0,
+                 limiter=None):
+        self._client = client
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter = limiter or AdaptiveLimiter()
+        self.call_count = 0
+        self.retry_count = 0
+        self._count_lock = threading.Lock()
+        # The sdk context of the returned flywheel objects, see wrap
+        self._context = _ApiObjectProxy(getattr(client, '_fw', client), self)
+
+    def call(self, function, *args, **kwargs):
+        """Calls function, retrying it while the server pushes back
+
+        Args:
+            function (callable): The api call
+            *args: Positional arguments of the call
+            **kwargs: Keyword arguments of the call
+
+        Returns:
+            object: The result of the call
+        """
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                with self._count_lock:
+                    self.call_count += 1
+                result = function(*args, **kwargs)
+            except Exception as e:
+                status = get_retry_status(e, is_idempotent(function))
+                if status is None or attempt >= self.max_retries:
+                    raise
+                self.limiter.on_pushback()
+                with self._count_lock:
+                    self.retry_count += 1
+                delay = get_retry_after(e)
+                if delay is None:
+                    # Full jitter, spreads the retries of concurrent callers
+                    delay = random.uniform(
+                        0, min(self.max_delay, self.base_delay * 2 ** attempt)
+                    )
+                log.warning('Api responded %d to %s, retrying in %.1fs (%d/%d)',
+                            status, getattr(function, '__name__', function),
+                            delay, attempt + 1, self.max_retries)
+            else:
+                self.limiter.on_success()
+                return self.wrap(result)
+            finally:
+                self.limiter.release()
+            time.sleep(delay)
+            attempt += 1
+
+    def wrap(self, value):
+        """Routes the api calls of flywheel objects through call, by setting
+        their sdk context to a wrapped one
+
+        Args:
+            value (object): A value returned by an api call
+
+        Returns:
+            object: The value, items of lists and generators are wrapped too
+        """
+        if isinstance(value, list):
+            return [self.wrap(item) for item in value]
+        if isinstance(value, types.GeneratorType):
+            return (self.wrap(item) for item in value)
+        if _is_flywheel_object(value) and hasattr(value, '_set_context'):
+            value._set_context(self._context)
+        return value
+
+    def __getattr__(self, name):
+        return _wrap_attribute(getattr(self._client, name), self)
+
+
+class _ApiObjectProxy(object):
+    """Proxies an sdk object whose methods are api calls (the sdk context,
+    the api classes), wrapping its methods with RateLimitedClient.call
+    """
+    def __init__(self, wrapped, rate_limited_client):
+        self._wrapped = wrapped
+        self._rate_limited_client = rate_limited_client
+
+    def __getattr__(self, name):
+        return _wrap_attribute(getattr(self._wrapped, name),
+                               self._rate_limited_client)
+
+    def __repr__(self):
+        return repr(self._wrapped)
+
+
+def _is_flywheel_object(value):
+    return type(value).__module__.startswith('flywheel.')
+
+
+def _wrap_attribute(value, rate_limited_client):
+    if isinstance(value, flywheel.finder.Finder):
+        # Finders are callable, each of their page requests is an api call,
+        # including those of the lazy iter and iter_find generators
+        return flywheel.finder.Finder(_ApiObjectProxy(value._context, rate_limited_client),
+                                      value._method, *value._args)
+    if callable(value) and not isinstance(value, type):
+        @functools.wraps(value)
+        def wrapper(*args, **kwargs):
+            return rate_limited_client.call(value, *args, **kwargs)
+        return wrapper
+    if _is_flywheel_object(value) and not hasattr(value, '_set_context'):
+        # Api classes, e.g. files_api
+        return _ApiObjectProxy(value, rate_limited_client)
+    return rate_limited_client.wrap(value)
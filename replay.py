@@ -0,0 +1,242 @@
+"""Records the api responses of a run and replays them offline
+
+RecordingAdapter and ReplayAdapter are requests transport adapters. Once
+mounted on the session of the flywheel sdk with install, every api request
+(finders, gets, file reads and downloads) goes through them. A recording is
+a fixture directory holding one json line per request in exchanges.jsonl and
+the response bodies in bodies/, named by their sha1.
+
+Requests are matched on their method, path and query. The host and the
+request bodies are not matched, and authorization headers are not recorded.
+"""
+import collections
+import datetime
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import urllib.parse
+import zipfile
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+
+EXCHANGES_FILENAME = 'exchanges.jsonl'
+BODIES_DIRNAME = 'bodies'
+# Response headers kept in recordings, the others (cookies, ...) are dropped
+RECORDED_HEADERS = ['Content-Type', 'Content-Disposition', 'Location',
+                    'Retry-After']
+
+
+def get_request_key(method, url):
+    """Returns the key a request is recorded and replayed under
+
+    Args:
+        method (str): The http method
+        url (str): The request url
+
+    Returns:
+        str: The method, path and sorted query of the request, e.g.
+            'GET /api/containers/5db0?inflate_job=true'
+    """
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.urlencode(
+        sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True))
+    )
+    path = parts.path + ('?' + query if query else '')
+    return '{} {}'.format(method.upper(), path)
+
+
+class RecordingAdapter(requests.adapters.BaseAdapter):
+    """Sends requests with another adapter and records the responses
+
+    Args:
+        fixture_dir (str): Directory to write the recording to, created if
+            it does not exist
+        adapter (BaseAdapter): The adapter sending the requests, defaults
+            to a requests HTTPAdapter
+    """
+    def __init__(self, fixture_dir, adapter=None):
+        super(RecordingAdapter, self).__init__()
+        self.fixture_dir = fixture_dir
+        self.adapter = adapter or requests.adapters.HTTPAdapter()
+        self.request_count = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(fixture_dir, BODIES_DIRNAME), exist_ok=True)
+        self._exchanges_file = open(
+            os.path.join(fixture_dir, EXCHANGES_FILENAME), 'w'
+        )
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        response = self.adapter.send(request, **kwargs)
+        # Reads streamed bodies too, requests serves the read content to
+        # the caller, and raw is reset for those who read the stream (e.g.
+        # the bulk download archive)
+        content = response.content
+        response.raw = io.BytesIO(content)
+        elapsed = time.perf_counter() - start
+
+        body = None
+        if content:
+            body = hashlib.sha1(content).hexdigest()
+            body_path = os.path.join(self.fixture_dir, BODIES_DIRNAME, body)
+            if not os.path.exists(body_path):
+                with open(body_path, 'wb') as body_file:
+                    body_file.write(content)
+        parts = urllib.parse.urlsplit(request.url)
+        exchange = {
+            'method': request.method,
+            'url': urllib.parse.urlunsplit(('', '', parts.path, parts.query, '')),
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {
+                header: response.headers[header]
+                for header in RECORDED_HEADERS if header in response.headers
+            },
+            'body': body,
+            'elapsed': round(elapsed, 6)
+        }
+        with self._lock:
+            self.request_count += 1
+            self._exchanges_file.write(json.dumps(exchange) + '\n')
+            self._exchanges_file.flush()
+        return response
+
+    def close(self):
+        self.adapter.close()
+        with self._lock:
+            if not self._exchanges_file.closed:
+                self._exchanges_file.close()
+
+
+class ReplayAdapter(requests.adapters.BaseAdapter):
+    """Serves the responses of a recording instead of sending the requests
+
+    A request repeated more times than it was recorded gets the last
+    recorded response again, so a run making fewer or more calls than the
+    recorded one still replays.
+
+    Args:
+        fixture_dir (str): Directory of the recording
+        latency_scale (float): Factor applied to the recorded latency of
+            each response, 0 responds immediately
+        latency (float): Optional latency in seconds used for every response
+            instead of the recorded one
+    """
+    def __init__(self, fixture_dir, latency_scale=1.0, latency=None):
+        super(ReplayAdapter, self).__init__()
+        self.fixture_dir = fixture_dir
+        self.latency_scale = latency_scale
+        self.latency = latency
+        self.exchanges = collections.OrderedDict()
+        # Number of requests served by request key
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+        with open(os.path.join(fixture_dir, EXCHANGES_FILENAME)) as exchanges_file:
+            for line in exchanges_file:
+                if not line.strip():
+                    continue
+                exchange = json.loads(line)
+                key = get_request_key(exchange['method'], exchange['url'])
+                self.exchanges.setdefault(key, []).append(exchange)
+
+    @property
+    def request_count(self):
+        return sum(self.counts.values())
+
+    def send(self, request, **kwargs):
+        key = get_request_key(request.method, request.url)
+        with self._lock:
+            exchanges = self.exchanges.get(key)
+            if not exchanges:
+                raise ValueError('No recorded response for {}'.format(key))
+            exchange = exchanges[min(self.counts[key], len(exchanges) - 1)]
+            self.counts[key] += 1
+
+        if self.latency is not None:
+            delay = self.latency
+        else:
+            delay = exchange.get('elapsed', 0) * self.latency_scale
+        if delay > 0:
+            time.sleep(delay)
+
+        content = b''
+        if exchange.get('body'):
+            body_path = os.path.join(self.fixture_dir, BODIES_DIRNAME,
+                                     exchange['body'])
+            with open(body_path, 'rb') as body_file:
+                content = body_file.read()
+
+        response = requests.Response()
+        response.status_code = exchange['status']
+        response.reason = exchange.get('reason')
+        response.headers = CaseInsensitiveDict(exchange.get('headers') or {})
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(content)
+        response.url = request.url
+        response.request = request
+        response.elapsed = datetime.timedelta(seconds=delay)
+        return response
+
+    def close(self):
+        pass
+
+
+def install(client, adapter):
+    """Sends the api requests of a flywheel client through an adapter
+
+    Args:
+        client (Client): Flywheel Api client
+        adapter (RecordingAdapter|ReplayAdapter): The adapter
+    """
+    session = client._fw.api_client.rest_client.session
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+
+def get_session(client):
+    """Returns a requests session going through the adapter installed on a
+    client, for the requests made without the sdk
+
+    Args:
+        client (Client): Flywheel Api client
+
+    Returns:
+        requests.Session|None: The session, None if no adapter is installed
+    """
+    adapter = client._fw.api_client.rest_client.session.get_adapter('https://')
+    # Adapters installed with install, or wrapping them (e.g.
+    # bulk_download.ArchiveAdapter), replace the http adapter of the sdk
+    if isinstance(adapter, requests.adapters.HTTPAdapter):
+        return None
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def write_recording(fixture_dir, gear_context, timestamp):
+    """Writes a recording as a zip analysis output
+
+    Args:
+        fixture_dir (str): Directory of the recording
+        gear_context (GearContext): the gear context so that we can write out
+            the file
+        timestamp (datetime): timestamp used in the output filename
+
+    Returns:
+        str: The filename that was used to write the recording
+    """
+    output_filename = 'api-recording-{}.zip'.format(timestamp)
+    with gear_context.open_output(output_filename, 'wb') as output_file:
+        with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for root, _, filenames in os.walk(fixture_dir):
+                for filename in sorted(filenames):
+                    path = os.path.join(root, filename)
+                    archive.write(path, os.path.relpath(path, fixture_dir))
+    return output_filename
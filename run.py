@@ -1,15 +1,37 @@
 #!/usr/bin/env python
 
+import collections
+import contextlib
 import csv
 import datetime
 import copy
+import hashlib
+import io
 import json
 import logging
+import os
+import tarfile
+import tempfile
 
 import flywheel
 import jsonschema
 import re
 
+import bulk_download
+import error_store
+import fast_validators
+import locality
+import pipeline
+import project_schema
+import rate_limit
+import sqlite_report
+import telemetry
+import replay
+import snapshot
+import time_budget
+import tracing
+from validation_pool import get_validation_pool
+
 
 ERROR_LOG_FILENAME_SUFFIX = 'error.log.json'
 CSV_HEADERS = [
@@ -20,11 +42,51 @@ CSV_HEADERS = [
     '_id',
     'type'
 ]
+# Columns of the report of a count_only run, one row per container type
+COUNT_HEADERS = [
+    'type',
+    'containers',
+    'error_logs',
+    'errors'
+]
+
+# Columns of a grouped report, one row per distinct error
+GROUPED_HEADERS = [
+    'error',
+    'type',
+    'resolved',
+    'count',
+    'container_ids',
+    'paths'
+]
+# Separates the container ids and paths of a group in csv reports
+GROUPED_CSV_SEPARATOR = ';'
+
+# Identifies the part of the project a job reports on when the report is
+# split across several jobs, see get_shard
+Shard = collections.namedtuple('Shard', ['index', 'count', 'by'])
+# Error log entries validated together when a streamed log is validated by a
+# validation pool
+STREAM_CHUNK_SIZE = 1000
+# Size of the reads when streaming an error log
+STREAM_READ_SIZE = 64 * 1024
+
+# Maximum number of results of the error log file search
+SEARCH_SIZE = 10000
+SHARD_FILENAME_REGEX = r'\.shard-(?P<index>\d+)-of-(?P<count>\d+)\.(?P<ext>csv|json|sqlite)$'
 
 
 log = logging.getLogger('grp-2')
 log.setLevel('INFO')
 
+tracer = tracing.Tracer()
+# Counts the progress of the run, see telemetry
+progress = telemetry.ProgressReporter()
+
+# Compiled validators by schema fingerprint, see get_validator
+VALIDATOR_CACHE_SIZE = 1024
+_validators = {}
+
 
 def get_resolver_path(client, container):
     """Generates the resolveer path for a container
@@ -100,15 +162,104 @@ def add_additional_info(error_containers, client):
         client (Client): Flywheel Api client
     """
     for error_container in error_containers:
+        add_container_info(error_container, client)
+
+
+def iter_additional_info(error_containers, client):
+    """Generator version of add_additional_info, adds the info to each
+    container when the next stage asks for it
+
+    Args:
+        error_containers (iterable): container dictionaries
+        client (Client): Flywheel Api client
+
+    Yields:
+        dict: The container dictionaries, with resolver path and uri
+    """
+    for error_container in error_containers:
+        add_container_info(error_container, client)
+        yield error_container
+
+
+def add_container_info(error_container, client):
+    """Adds the resolver path and uri to a single container entry
+
+    Args:
+        error_container (dict): A container dictionary
+        client (Client): Flywheel Api client
+    """
+    with tracer.span('add_additional_info', category='container',
+                     _id=error_container['_id']):
         container = client.get(error_container['_id'])
         error_container['path'] = get_resolver_path(client, container)
         error_container['url'] = get_uri(client, container)
 
 
+def get_shard(config):
+    """Returns the shard a job reports on from the gear config
+
+    Args:
+        config (dict): The gear config with shard_index, shard_count and
+            shard_by
+
+    Returns:
+        Shard|None: The shard, None if the report is not sharded
+    """
+    shard_count = config.get('shard_count') or 1
+    if shard_count <= 1:
+        return None
+    shard_index = config.get('shard_index') or 0
+    if not 0 <= shard_index < shard_count:
+        raise ValueError('Shard index {} not valid for {} shards'.format(
+            shard_index, shard_count
+        ))
+    shard_by = config.get('shard_by') or 'subject'
+    if shard_by not in ['subject', 'session']:
+        raise ValueError('Cannot shard by {}'.format(shard_by))
+    return Shard(shard_index, shard_count, shard_by)
+
+
+def in_shard(container, container_type, shard):
+    """Checks whether a container belongs to a shard, containers are
+    partitioned by a stable hash of the id of their subject (or session) so
+    that every job of a sharded report agrees on the partition
+
+    Args:
+        container (Container): A flywheel container
+        container_type (str): The type of the container
+        shard (Shard): The shard, None if the report is not sharded
+
+    Returns:
+        bool: Whether or not the container belongs to the shard
+    """
+    if shard is None:
+        return True
+    # Subjects are never split by session, so they are sharded by their own id
+    if container_type in [shard.by, 'subject']:
+        key = container.id
+    else:
+        key = container.parents.get(shard.by)
+    return shard_key_in_shard(key, shard)
+
+
+def shard_key_in_shard(key, shard):
+    """Checks whether the stable hash of a key falls in a shard
+
+    Args:
+        key (str): The id the container is partitioned by
+        shard (Shard): The shard
+
+    Returns:
+        bool: Whether or not the key belongs to the shard
+    """
+    digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+    return int(digest, 16) % shard.count == shard.index
+
+
 def collect_containers(finder, container_type, collect_acquisitions=False,
-                       skip_sessions=False):
-    """Iterates over finder for containers with tags=error filter, and returns
-    a list of dictionaries with the container id and type
+                       skip_sessions=False, shard=None, subtrees=None):
+    """Iterates over finder for containers with tags=error filter, and yields
+    dictionaries with the container id and type
 
     Args:
         finder (Finder): A flywheel sdk finder
@@ -117,32 +268,43 @@ def collect_containers(finder, container_type, collect_acquisitions=False,
             acquisitions
         skip_sessions (bool): Optional flag to skip collecting sessions if only
             collecting acquisitions
+        shard (Shard): Optional shard to restrict the containers to
+        subtrees (dict): Optional dictionary the subject and session ids of
+            each container are added to by container id, see
+            locality.get_subtree
 
-    Returns:
-        list: A list of dictionaries with the container id and type set
+    Yields:
+        dict: A dictionary with the container id and type set
     """
-    error_containers = []
     log.debug('Inside collect function, collect acqs %s', collect_acquisitions)
     log.debug('Container type %s', container_type)
     for container in finder.find('tags=error'):
         log.debug('Checking container %s', container.label)
+        if not in_shard(container, container_type, shard):
+            continue
         if container_type != 'session' or not skip_sessions:
-            error_containers.append({
+            if subtrees is not None:
+                subtrees[container.id] = locality.get_subtree(container, container_type)
+            yield {
                 '_id': container.id,
                 'type': container_type
-            })
+            }
     if collect_acquisitions:
         for session in finder.find():
+            # Acquisitions are in the shard of their session
+            if not in_shard(session, 'session', shard):
+                continue
             log.debug('Collecting acquisitions for session %s', session.label)
             for acquisition in session.acquisitions.find('tags=error'):
-                error_containers.append({
+                if subtrees is not None:
+                    subtrees[acquisition.id] = locality.get_subtree(acquisition, 'acquisition')
+                yield {
                     '_id': acquisition.id,
                     'type': 'acquisition'
-                })
-    return error_containers
+                }
 
 
-def find_error_containers(container_type, parent):
+def find_error_containers(container_type, parent, shard=None, subtrees=None):
     """Given a parent and a container type, the function will return a list
     of all containers of the given container_type that have the tag error
 
@@ -152,12 +314,37 @@ def find_error_containers(container_type, parent):
         parent (ContainerOutput): The parent container, can be a project,
             subject, or session, and this restrict what the container type can
             be
+        shard (Shard): Optional shard to restrict the containers to
+        subtrees (dict): Optional dictionary the subject and session ids of
+            each container are added to by container id, see
+            locality.get_subtree
 
     Returns:
         list: A list of containers (_id and type) that are tagged as
             error
     """
-    error_containers = []
+    return list(iter_error_containers(container_type, parent, shard=shard,
+                                      subtrees=subtrees))
+
+
+def iter_error_containers(container_type, parent, shard=None, subtrees=None):
+    """Generator version of find_error_containers, yields the containers as
+    the finders return them so that the next stages can start before the
+    discovery is complete
+
+    Args:
+        container_type (str): Must be 'all', 'subject', 'session', or
+            'acquisition'
+        parent (ContainerOutput): The parent container, can be a project,
+            subject, or session
+        shard (Shard): Optional shard to restrict the containers to
+        subtrees (dict): Optional dictionary the subject and session ids of
+            each container are added to by container id, see
+            locality.get_subtree
+
+    Yields:
+        dict: A container (_id and type) that is tagged as error
+    """
     if container_type not in ['all', 'subject', 'session', 'acquisition']:
         raise ValueError('Container type {} not valid'.format(container_type))
 
@@ -172,7 +359,8 @@ def find_error_containers(container_type, parent):
             raise ValueError('Cannot find subjects of a parent of type %s',
                              parent.container_type)
 
-        error_containers += collect_containers(parent.subjects, 'subject')
+        yield from collect_containers(parent.subjects, 'subject', shard=shard,
+                                      subtrees=subtrees)
 
     # If collecting all container types under a project or a subject; or just
     # the sessions under a container, or acquisitions
@@ -192,9 +380,10 @@ def find_error_containers(container_type, parent):
         log.debug('Collecting acquisitions? %s', collect_acquisitions)
         skip_sessions = container_type == 'acquisition'
         log.debug('Skip sessions? %s', skip_sessions)
-        error_containers += collect_containers(parent.sessions, 'session',
-                                               collect_acquisitions=collect_acquisitions,
-                                               skip_sessions=skip_sessions)
+        yield from collect_containers(parent.sessions, 'session',
+                                      collect_acquisitions=collect_acquisitions,
+                                      skip_sessions=skip_sessions,
+                                      shard=shard, subtrees=subtrees)
 
     # If the parent type is a session, loop through the acquisitions
     if parent.container_type == 'session':
@@ -202,39 +391,218 @@ def find_error_containers(container_type, parent):
             # User should not choose a session to run if container_type is not
             # all or acquisition
             raise ValueError('Invalid container type {} for children of session'.format(container_type))
-        error_containers += collect_containers(parent.acquisitions, 'acquisition')
+        yield from collect_containers(parent.acquisitions, 'acquisition',
+                                      shard=shard, subtrees=subtrees)
 
-    return error_containers
+
+def get_child_container_types(container_type, parent):
+    """Returns the container types to report on under a parent, with the same
+    rules as find_error_containers
+
+    Args:
+        container_type (str): Must be 'all', 'subject', 'session', or
+            'acquisition'
+        parent (ContainerOutput): The parent container, can be a project,
+            subject, or session
+
+    Returns:
+        list: The container types, in report order
+    """
+    child_types = {
+        'project': ['subject', 'session', 'acquisition'],
+        'subject': ['session', 'acquisition'],
+        'session': ['acquisition']
+    }.get(parent.container_type, [])
+    if container_type not in ['all', 'subject', 'session', 'acquisition']:
+        raise ValueError('Container type {} not valid'.format(container_type))
+    if container_type == 'all':
+        return child_types
+    if container_type not in child_types:
+        raise ValueError('Cannot find {}s of a parent of type {}'.format(
+            container_type, parent.container_type
+        ))
+    return [container_type]
+
+
+def get_search_parent_type(result):
+    """Returns the container type of the parent of a file search result. The
+    sdk deserializes the parent of session and acquisition files as container
+    models without their type, which is then found by matching the parent id
+    with the containers of the result
+
+    Args:
+        result (SearchResponse): A file search result
+
+    Returns:
+        str|None: The container type of the parent of the file
+    """
+    parent_type = getattr(result.parent, 'type', None)
+    if parent_type:
+        return parent_type
+    for container_type in ['acquisition', 'session', 'subject', 'project']:
+        container = getattr(result, container_type, None)
+        if container is not None and getattr(container, 'id', None) == result.parent.id:
+            return container_type
+    return None
+
+
+def search_error_log_files(client, container_type, container_id):
+    """Searches the error log files under a container
+
+    Args:
+        client (Client): Flywheel Api client
+        container_type (str): The type of the container
+        container_id (str): The id of the container
+
+    Returns:
+        list: The file search results, at most SEARCH_SIZE
+    """
+    query = flywheel.SearchQuery(
+        return_type='file',
+        structured_query='file.name CONTAINS "{}" AND {}._id = {}'.format(
+            ERROR_LOG_FILENAME_SUFFIX, container_type, container_id
+        )
+    )
+    return client.search(query, size=SEARCH_SIZE)
+
+
+def find_error_log_files(container_type, parent, client, shard=None,
+                         subtrees=None):
+    """Finds the containers with error logs using a single file search under
+    the parent, instead of relying on error tags
+
+    Args:
+        container_type (str): Must be 'all', 'subject', 'session', or
+            'acquisition'
+        parent (ContainerOutput): The parent container, can be a project,
+            subject, or session
+        client (Client): Flywheel Api client
+        shard (Shard): Optional shard to restrict the containers to. File
+            search results do not include the subject of a file, so sessions
+            and acquisitions are partitioned by session
+        subtrees (dict): Optional dictionary the subject and session ids of
+            each container are added to by container id, see
+            locality.get_subtree
+
+    Returns:
+        tuple: A list of containers (_id and type) that have error logs, in
+            the same order as find_error_containers, and a dictionary of the
+            error log file names by container id
+    """
+    container_types = get_child_container_types(container_type, parent)
+    results = search_error_log_files(client, parent.container_type, parent.id)
+    if len(results) >= SEARCH_SIZE:
+        if parent.container_type != 'project':
+            raise ValueError(
+                'File search returned {} results under {} {}, some error logs '
+                'would be missing. Use the tags discovery mode instead'.format(
+                    len(results), parent.container_type, parent.id
+                )
+            )
+        # Each search is then restricted to one subject
+        log.info('File search returned %d results, searching the error logs '
+                 'of each subject', len(results))
+        results = []
+        for subject in parent.subjects.iter():
+            subject_results = search_error_log_files(client, 'subject', subject.id)
+            if len(subject_results) >= SEARCH_SIZE:
+                raise ValueError(
+                    'File search returned {} results under subject {}, some '
+                    'error logs would be missing. Use the tags discovery mode '
+                    'instead'.format(len(subject_results), subject.id)
+                )
+            results += subject_results
+
+    error_log_files = collections.OrderedDict()
+    container_types_by_id = {}
+    for result in results:
+        if not result.file.name.endswith(ERROR_LOG_FILENAME_SUFFIX):
+            continue
+        result_type = get_search_parent_type(result)
+        if result_type not in container_types:
+            continue
+        if shard is not None:
+            if result_type == 'subject':
+                key = result.parent.id
+            else:
+                key = result.session.id
+            if not shard_key_in_shard(key, shard):
+                continue
+        container_types_by_id[result.parent.id] = result_type
+        if subtrees is not None:
+            # Search results only have the code of the subject, which
+            # identifies the subject under the parent as well
+            subject = getattr(result, 'subject', None)
+            subtrees[result.parent.id] = (
+                subject.code if subject is not None else None,
+                result.session.id if result_type != 'subject' else None
+            )
+        error_log_files.setdefault(result.parent.id, []).append(result.file.name)
+
+    error_containers = [
+        {
+            '_id': _id,
+            'type': container_types_by_id[_id]
+        }
+        for _id in error_log_files
+    ]
+    error_containers.sort(key=lambda error_container: container_types.index(error_container['type']))
+    return error_containers, error_log_files
+
+
+def get_file_ext(file_type):
+    """Returns the report file extension of a file type, json by default"""
+    return file_type if file_type in ['csv', 'sqlite'] else 'json'
 
 
 def create_output_file(container_label, error_containers, file_type,
-                       gear_context, timestamp, output_filename=None):
+                       gear_context, timestamp, output_filename=None,
+                       shard=None, fieldnames=CSV_HEADERS):
     """Creates the output file from a set of error containers, the file type
     is determined from the config value
 
     Args:
         container_label (str): The label of root container
-        error_containers (list): list of containers that were tagged
-        file_type (str): The file type to format the output into
+        error_containers (iterable): list of containers that were tagged,
+            can be a generator, in which case the records are written as they
+            are produced
+        file_type (str): The file type to format the output into, json, csv
+            or sqlite
         gear_context (GearContext): the gear context so that we can write out
             the file
         output_filename (str): and optional file name that can be passed
+        shard (Shard): Optional shard the report is for, added to the file
+            name so that the shard reports can be merged
+        fieldnames (list): The csv columns
 
     Returns:
         str: The filename that was used to write the report as
     """
-    file_ext = 'csv' if file_type == 'csv' else 'json'
+    file_ext = get_file_ext(file_type)
     output_filename = output_filename or '{}-{}.{}'.format(
         container_label,
         timestamp,
         file_ext
     )
+    if shard is not None:
+        output_filename = get_shard_filename(output_filename, shard)
+    if file_type == 'sqlite':
+        with gear_context.open_output(output_filename, 'wb') as output_file:
+            sqlite_report.write_sqlite_report(error_containers, output_file,
+                                              fieldnames=fieldnames)
+        return output_filename
     with gear_context.open_output(output_filename, 'w') as output_file:
         if file_type == 'json':
-            json.dump(error_containers, output_file)
+            # Same output as json.dump of a list, without holding the list
+            output_file.write('[')
+            for index, container in enumerate(error_containers):
+                if index:
+                    output_file.write(', ')
+                json.dump(container, output_file)
+            output_file.write(']')
         elif file_type == 'csv':
             csv_dict_writer = csv.DictWriter(output_file,
-                                             fieldnames=CSV_HEADERS)
+                                             fieldnames=fieldnames)
             csv_dict_writer.writeheader()
             for container in error_containers:
                 csv_dict_writer.writerow(container)
@@ -243,6 +611,261 @@ def create_output_file(container_label, error_containers, file_type,
     return output_filename
 
 
+def group_errors(errors, file_type):
+    """Collapses the errors that have the same message, container type and
+    resolution into one row with the number of errors and the containers
+    they were found on
+
+    Args:
+        errors (iterable): The errors, can be a generator, the errors are
+            then grouped as they are produced
+        file_type (str): The report file type, the container ids and paths
+            are joined with GROUPED_CSV_SEPARATOR in csv reports
+
+    Returns:
+        list: A GROUPED_HEADERS dictionary per group, in the order the groups
+            were first found
+    """
+    groups = collections.OrderedDict()
+    for error in errors:
+        key = (error.get('error'), error.get('type'), error.get('resolved'))
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                'error': key[0],
+                'type': key[1],
+                'resolved': key[2],
+                'count': 0,
+                # Paths by container id, each container is listed once
+                'containers': collections.OrderedDict()
+            }
+        group['count'] += 1
+        group['containers'].setdefault(error.get('_id'), error.get('path'))
+
+    rows = []
+    for group in groups.values():
+        containers = group.pop('containers')
+        group['container_ids'] = list(containers.keys())
+        group['paths'] = list(containers.values())
+        if file_type == 'csv':
+            group['container_ids'] = GROUPED_CSV_SEPARATOR.join(
+                str(_id) for _id in group['container_ids']
+            )
+            group['paths'] = GROUPED_CSV_SEPARATOR.join(
+                str(path) for path in group['paths']
+            )
+        rows.append(group)
+    return rows
+
+
+def sort_errors(errors, config):
+    """Sorts the errors by path and type, spilling to disk past the
+    sort_buffer_size of the config, see error_store.sort_errors
+    """
+    return error_store.sort_errors(
+        errors,
+        config.get('sort_buffer_size') or error_store.DEFAULT_BUFFER_SIZE
+    )
+
+
+def get_report_rows(errors, config, presorted=False):
+    """Returns the rows and columns of the report of errors
+
+    Args:
+        errors (iterable): The errors
+        config (dict): The gear config with sort_report, sort_buffer_size,
+            grouped and file_type
+        presorted (bool): Whether the errors are already sorted, see
+            sort_errors
+
+    Returns:
+        tuple: The rows (the errors, or their groups if grouped is set) and
+            the csv columns
+    """
+    if config.get('sort_report') and not presorted:
+        errors = sort_errors(errors, config)
+    if config.get('grouped'):
+        return group_errors(errors, config.get('file_type')), GROUPED_HEADERS
+    return errors, CSV_HEADERS
+
+
+def get_shard_filename(filename, shard):
+    """Adds the shard to a report file name, report.csv becomes
+    report.shard-0-of-4.csv
+
+    Args:
+        filename (str): The report file name
+        shard (Shard): The shard the report is for
+
+    Returns:
+        str: The file name of the shard report
+    """
+    base, _, ext = filename.rpartition('.')
+    return '{}.shard-{}-of-{}.{}'.format(base, shard.index, shard.count, ext)
+
+
+def find_shard_reports(analyses, shard_count, file_type, exclude_id=None):
+    """Finds the latest report of each shard among the outputs of analyses
+
+    Args:
+        analyses (list): Analyses that may have shard reports as outputs
+        shard_count (int): The number of shards the report was split into
+        file_type (str): The file type of the shard reports
+        exclude_id (str): Optional analysis id to ignore, e.g. the merge job
+
+    Returns:
+        list: (analysis_id, filename) of the report of each shard, in shard
+            order
+    """
+    file_ext = get_file_ext(file_type)
+    latest = {}
+    for analysis in sorted(analyses, key=lambda analysis: analysis.created):
+        if analysis.id == exclude_id:
+            continue
+        for file_ in analysis.files or []:
+            match = re.search(SHARD_FILENAME_REGEX, file_.name)
+            if (
+                match and int(match.group('count')) == shard_count and
+                match.group('ext') == file_ext
+            ):
+                latest[int(match.group('index'))] = (analysis.id, file_.name)
+    missing = [index for index in range(shard_count) if index not in latest]
+    if missing:
+        raise ValueError('Missing reports for shards {} of {}'.format(
+            missing, shard_count
+        ))
+    return [latest[index] for index in range(shard_count)]
+
+
+def read_shard_reports(client, shard_reports, file_type):
+    """Reads the errors of shard reports, one report at a time
+
+    Args:
+        client (Client): Flywheel Api client
+        shard_reports (list): (analysis_id, filename) of each shard report
+        file_type (str): The file type of the shard reports
+
+    Yields:
+        dict: The errors of each shard report, in shard order
+    """
+    for analysis_id, filename in shard_reports:
+        log.info('Reading shard report %s of analysis %s', filename, analysis_id)
+        data = client.download_output_from_analysis_as_data(analysis_id, filename)
+        if file_type == 'sqlite':
+            yield from sqlite_report.read_sqlite_report(data)
+            continue
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        if file_type == 'csv':
+            yield from csv.DictReader(io.StringIO(data))
+        else:
+            yield from json.loads(data)
+
+
+def iter_json_array(json_file, read_size=STREAM_READ_SIZE):
+    """Parses a json array one element at a time, so that only the element
+    being parsed (and one read) is held in memory
+
+    Args:
+        json_file (file): A text file containing a json array
+        read_size (int): Number of characters read at once
+
+    Yields:
+        object: The elements of the array
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def skip_whitespace():
+        # Reads until a non whitespace character is at position
+        nonlocal buffer, position, eof
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\n\r':
+                position += 1
+            if position < len(buffer) or eof:
+                return
+            buffer = json_file.read(read_size)
+            position = 0
+            eof = not buffer
+
+    skip_whitespace()
+    if buffer[position:position + 1] != '[':
+        raise ValueError('Expected a json array')
+    position += 1
+    skip_whitespace()
+    if buffer[position:position + 1] == ']':
+        return
+    while True:
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # A number at the end of the buffer, or cut before its
+                # fraction or exponent, may continue in the next read
+                if eof or (end < len(buffer) and
+                           buffer[end] not in '+-.eE0123456789'):
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            chunk = json_file.read(read_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+        # Drop the parsed element from the buffer
+        buffer = buffer[end:]
+        position = 0
+        yield value
+
+        skip_whitespace()
+        separator = buffer[position:position + 1]
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError('Expected , or ] in json array')
+        position += 1
+        skip_whitespace()
+
+
+def iter_chunks(iterable, size):
+    """Groups the items of an iterable in lists of at most size items
+
+    Args:
+        iterable (iterable): The items to group
+        size (int): The maximum number of items in a group
+
+    Yields:
+        list: The groups of items
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_error_log(container, error_log_filename):
+    """Downloads an error log to a temporary file and parses it one error at a
+    time, the file is removed once the errors have been consumed
+
+    Args:
+        container (Container): The container of the error log
+        error_log_filename (str): The name of the error log
+
+    Yields:
+        dict: The errors of the error log
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, ERROR_LOG_FILENAME_SUFFIX)
+        container.download_file(error_log_filename, path)
+        with open(path) as error_log_file:
+            yield from iter_json_array(error_log_file)
+
+
 def dictionary_lookup(field, dictionary):
     """A traverses a dictionary with a period seperated list of fields as a str
 
@@ -273,25 +896,61 @@ def dictionary_lookup(field, dictionary):
     return d, True
 
 
-def validate(container, error):
+def validate(container, error, project_schema=None):
     """Wraps jsonschema.validate so that it returns a boolean instead of
     raising an Error
 
     Args:
         container (dict): The container to validate
         error (dict): An error with schema and item fields
+        project_schema (ProjectSchema): Optional project schema, see
+            get_validation_target
 
     Returns:
         list: list of validation error messages (empty if none)
     """
+    error_status, value, schema = get_validation_target(container, error,
+                                                        project_schema)
+    if error_status is not None:
+        return error_status
+
+    validator = None
+    if project_schema is not None:
+        validator = project_schema.get_validator(error.get('item'))
+    validation_output = get_schema_errors(value, schema, validator=validator)
+
+    return validation_output
+
+
+def get_validation_target(container, error, project_schema=None):
+    """Finds the value and schema to revalidate an error with
+
+    Args:
+        container (dict): The container to validate
+        error (dict): An error with schema and item fields
+        project_schema (ProjectSchema): Optional project schema, the item is
+            then validated against its subschema instead of the schema of
+            the error, which is only used if the project schema does not
+            describe the item
+
+    Returns:
+        tuple: (error_status, value, schema), error_status is the list of
+            validation error messages if the error cannot be revalidated
+            against its schema, None otherwise
+    """
     if not error.get('revalidate'):
-        return [error.get('error_message', 'Skipping revalidation')]
-    schema = error.get('schema', {})
-    if not schema:
-        log.error('Cannot re-validate error for %s - schema key is missing!',
-                  container.get('name', container.get('label', 'NA')))
-        log.error('For best results, please run the latest version of GRP-3')
-        return [error.get('error_message', 'Error schema is missing, cannot re-validate.')]
+        return [error.get('error_message', 'Skipping revalidation')], None, None
+    schema = None
+    if project_schema is not None:
+        # An empty subschema allows any value
+        schema = project_schema.get_subschema(error.get('item'))
+    if schema is None:
+        schema = error.get('schema', {})
+        if not schema:
+            log.error('Cannot re-validate error for %s - schema key is missing!',
+                      container.get('name', container.get('label', 'NA')))
+            log.error('For best results, please run the latest version of GRP-3')
+            return [error.get('error_message', 'Error schema is missing, cannot re-validate.')], None, None
     item = error.get('item')
     value, found_value = dictionary_lookup(item, container)
     if found_value is False:
@@ -302,25 +961,67 @@ def validate(container, error):
         )
         log.error(err_string)
         log.error(error)
-        return [error.get('error_msg', err_string)]
+        return [error.get('error_msg', err_string)], None, None
 
-    validation_output = get_schema_errors(value, schema)
+    return None, value, schema
 
-    return validation_output
+
+def get_schema_fingerprint(schema):
+    """Returns a stable fingerprint of a schema so that identical schemas
+    embedded in different error logs share one compiled validator
+
+    Args:
+        schema (dict): jsonschema object
+
+    Returns:
+        str: hex digest of the canonical json of the schema
+    """
+    return hashlib.sha1(
+        json.dumps(schema, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+
+def get_validator(schema, fingerprint=None):
+    """Returns a compiled validator for the schema, cached by fingerprint
+
+    Args:
+        schema (dict): jsonschema object
+        fingerprint (str): Optional precomputed fingerprint of the schema
+
+    Returns:
+        jsonschema.Draft7Validator: the validator for the schema
+    """
+    fingerprint = fingerprint or get_schema_fingerprint(schema)
+    validator = _validators.get(fingerprint)
+    if validator is None:
+        if len(_validators) >= VALIDATOR_CACHE_SIZE:
+            _validators.clear()
+        validator = jsonschema.Draft7Validator(schema)
+        _validators[fingerprint] = validator
+    return validator
 
 
-def get_schema_errors(value, schema):
+def get_schema_errors(value, schema, fingerprint=None, validator=None):
     """
     Validate the value against the schema provided
     Args:
         value: the value against which to validate the schema
         schema (dict): jsonschema object against which to validate the value
+        fingerprint (str): Optional precomputed fingerprint of the schema
+        validator (jsonschema.Draft7Validator): Optional validator of the
+            schema to use, e.g. with the resolver of a project schema, see
+            ProjectSchema.get_validator
 
     Returns:
         list: a list of validation errors
     """
-    # Initialize json schema validator
-    validator = jsonschema.Draft7Validator(schema)
+    if validator is None:
+        # Most schemas are simple enough to be checked without jsonschema
+        check_schema = fast_validators.compile_simple_schema(schema)
+        if check_schema is not None:
+            return sorted(check_schema(value))
+        # Get the compiled json schema validator
+        validator = get_validator(schema, fingerprint)
     # Initialize list object for storing validation error messages
     msg_list = list()
     for error in sorted(validator.iter_errors(value), key=str):
@@ -328,36 +1029,93 @@ def get_schema_errors(value, schema):
     return msg_list
 
 
-def get_container_errors(error_log, file_dict, container_dictionary):
+def get_container_errors(error_log, file_dict, container_dictionary,
+                         error_statuses=None, err_msg_set=None,
+                         project_schema=None):
     """Uses parameters given in the error log to validate the container
 
     Args:
-        error_log (list): list of error objects
+        error_log (iterable): list of error objects, can be a generator, in
+            which case each error is validated as it is produced
         file_dict (dict): The file metadata to validate
         container_dictionary (dict): The error container dictionary
+        error_statuses (list): Optional validation error messages of each
+            error, as returned by validate, if they were already computed
+        err_msg_set (set): Optional set of the messages already reported,
+            to share when an error log is validated in chunks
+        project_schema (ProjectSchema): Optional project schema to validate
+            the items with, see get_validation_target
 
     Returns:
         list: A list of error dictionaries
     """
     error_dictionaries = list()
-    err_msg_list = list()
+    err_msg_set = set() if err_msg_set is None else err_msg_set
+    if error_statuses is not None:
+        error_statuses = iter(error_statuses)
+    # A streamed error log can only be iterated once
     for error in error_log:
+        if error_statuses is None:
+            error_status = validate(file_dict, error, project_schema)
+        else:
+            error_status = next(error_statuses)
         error_dictionary = copy.deepcopy(container_dictionary)
-        error_status = validate(file_dict, error)
         if error_status == list():
             error_dictionary['resolved'] = True
             error_dictionaries.append(error_dictionary)
         else:
             for error_msg in error_status:
                 tmp_error_dictionary = copy.deepcopy(error_dictionary)
-                if error_msg not in err_msg_list:
-                    err_msg_list.append(error_msg)
+                if error_msg not in err_msg_set:
+                    err_msg_set.add(error_msg)
                     tmp_error_dictionary['resolved'] = False
                     tmp_error_dictionary['error'] = error_msg
                     error_dictionaries.append(tmp_error_dictionary)
     return error_dictionaries
 
 
+def submit_error_log(error_log, file_dict, validation_pool,
+                     project_schema=None):
+    """Submits the schema validation of an error log to a validation pool
+
+    Args:
+        error_log (list): list of error objects
+        file_dict (dict): The file metadata to validate
+        validation_pool (ValidationPool): The pool validating the schemas
+        project_schema (ProjectSchema): Optional project schema to validate
+            the items with, see get_validation_target
+
+    Returns:
+        function: Waits for the pool and returns the validation error messages
+            of each error, the same as validate would
+    """
+    error_statuses = []
+    work = []
+    for error in error_log:
+        error_status, value, schema = get_validation_target(file_dict, error,
+                                                            project_schema)
+        if error_status is None and project_schema is not None:
+            validator = project_schema.get_validator(error.get('item'))
+            if validator is not None:
+                # The resolver of the project schema cannot be sent to the
+                # worker processes
+                error_status = get_schema_errors(value, schema,
+                                                 validator=validator)
+        if error_status is None:
+            work.append((get_schema_fingerprint(schema), value, schema))
+        error_statuses.append(error_status)
+    pending = validation_pool.submit(work)
+
+    def get_error_statuses():
+        schema_errors = iter(pending.result())
+        return [
+            next(schema_errors) if error_status is None else error_status
+            for error_status in error_statuses
+        ]
+
+    return get_error_statuses
+
+
 def get_error_origin_file_dict(container_dict, error_log_name):
     """
     Finds the file dictionary in container_dict['files'] matching the error_log_name without ERROR_LOG_FILENAME_SUFFIX.
@@ -376,7 +1134,10 @@ def get_error_origin_file_dict(container_dict, error_log_name):
     return file_dict
 
 
-def get_errors(error_containers, client, delete_errors=False):
+def get_errors(error_containers, client, delete_errors=False,
+               validation_pool=None, error_log_files=None,
+               streaming_threshold=None, bulk_error_logs=None,
+               project_schema=None):
     """Generate a list of errors of all the containers and set the resolution
     and error message for each, if the error.log file DNE, we create a single
     error for the container without a message and resolved set to True
@@ -385,48 +1146,338 @@ def get_errors(error_containers, client, delete_errors=False):
         error_containers (list): list of container dictionaries
         client (Client): An api client
         delete_errors (bool): whether to delete error.log.json files and remove error tags
+        validation_pool (ValidationPool): Optional process pool to validate
+            the schemas with, while the next containers are read
+        error_log_files (dict): Optional error log file names by container
+            id, as returned by find_error_log_files, so that the files of the
+            containers are not listed again
+        streaming_threshold (int): Optional size in bytes above which error
+            logs are streamed instead of read in memory
+        bulk_error_logs (BulkErrorLogs): Optional error logs downloaded in
+            bulk, read instead of requesting each file
+        project_schema (ProjectSchema): Optional project schema to validate
+            the items with, see get_validation_target
     Returns:
         list: A list of errors (many to one container)
     """
-    errors = []
+    return list(iter_errors(error_containers, client, delete_errors,
+                            validation_pool=validation_pool,
+                            error_log_files=error_log_files,
+                            streaming_threshold=streaming_threshold,
+                            bulk_error_logs=bulk_error_logs,
+                            project_schema=project_schema))
+
+
+def iter_errors(error_containers, client, delete_errors=False,
+                validation_pool=None, error_log_files=None,
+                streaming_threshold=None, bulk_error_logs=None,
+                project_schema=None):
+    """Generates the errors of the containers one container at a time, see
+    get_errors for the arguments
+
+    Yields:
+        dict: The errors (many to one container)
+    """
+    error_log_files = error_log_files or {}
+    if validation_pool is None:
+        for container_dictionary in error_containers:
+            with tracer.span('get_errors', category='container',
+                             _id=container_dictionary['_id']):
+                errors = get_container_dictionary_errors(
+                    container_dictionary, client, delete_errors,
+                    error_log_filenames=error_log_files.get(container_dictionary['_id']),
+                    streaming_threshold=streaming_threshold,
+                    bulk_error_logs=bulk_error_logs,
+                    project_schema=project_schema
+                )
+            progress.container_processed()
+            yield from errors
+        return
+
+    # Keep a window of containers in flight so the pool validates while the
+    # error logs of the next containers are downloaded
+    in_flight = collections.deque()
     for container_dictionary in error_containers:
-        container = client.get_container(container_dictionary['_id'])
+        with tracer.span('read_error_logs', category='container',
+                         _id=container_dictionary['_id']):
+            in_flight.append(read_error_logs(
+                container_dictionary, client, validation_pool,
+                error_log_filenames=error_log_files.get(container_dictionary['_id']),
+                streaming_threshold=streaming_threshold,
+                bulk_error_logs=bulk_error_logs,
+                project_schema=project_schema
+            ))
+        if len(in_flight) >= validation_pool.window:
+            errors = resolve_error_logs(*in_flight.popleft(),
+                                        delete_errors=delete_errors,
+                                        validation_pool=validation_pool,
+                                        project_schema=project_schema)
+            progress.container_processed()
+            yield from errors
+    while in_flight:
+        errors = resolve_error_logs(*in_flight.popleft(),
+                                    delete_errors=delete_errors,
+                                    validation_pool=validation_pool,
+                                    project_schema=project_schema)
+        progress.container_processed()
+        yield from errors
+
+
+def count_error_logs(container_dictionary, client, error_log_filenames=None,
+                     streaming_threshold=None, bulk_error_logs=None):
+    """Counts the entries of the error logs of an error container, without
+    revalidating them
+
+    Args:
+        container_dictionary (dict): The error container dictionary
+        client (Client): An api client
+        error_log_filenames (list): Optional names of the error logs of the
+            container, listed from the container files if not given
+        streaming_threshold (int): Optional size in bytes above which error
+            logs are streamed instead of read in memory
+        bulk_error_logs (BulkErrorLogs): Optional error logs downloaded in
+            bulk, read instead of requesting each file
+
+    Returns:
+        tuple: the number of error logs and the number of entries
+    """
+    container = client.get_container(container_dictionary['_id'])
+    if error_log_filenames is None:
         error_log_filenames = [file_.name for file_ in container.files if
                                file_.name.endswith(ERROR_LOG_FILENAME_SUFFIX)]
-        if error_log_filenames:
-            for error_log_filename in error_log_filenames:
-                origin_file_dict = get_error_origin_file_dict(container.to_dict(), error_log_filename)
-                log.info('Reading file %s on %s %s', error_log_filename, container.container_type, container.id)
-                error_log = json.loads(container.read_file(error_log_filename))
+    if streaming_threshold is not None:
+        file_sizes = {file_.name: file_.size for file_ in container.files}
+    entry_count = 0
+    for error_log_filename in error_log_filenames:
+        data = None
+        if bulk_error_logs is not None:
+            data = bulk_error_logs.pop(container.id, error_log_filename)
+        if data is not None:
+            entry_count += len(json.loads(data))
+        elif (
+            streaming_threshold is not None and
+            (file_sizes.get(error_log_filename) or 0) > streaming_threshold
+        ):
+            entry_count += sum(
+                1 for _ in stream_error_log(container, error_log_filename)
+            )
+        else:
+            entry_count += len(json.loads(container.read_file(error_log_filename)))
+        progress.error_log_read()
+    return len(error_log_filenames), entry_count
+
+
+def count_errors(error_containers, client, error_log_files=None,
+                 streaming_threshold=None, bulk_error_logs=None):
+    """Counts the error containers, error logs and error log entries of each
+    container type, without revalidating the errors or changing the
+    containers
+
+    Args:
+        error_containers (iterable): container dictionaries
+        client (Client): An api client
+        error_log_files (dict): Optional error log file names by container
+            id, as returned by find_error_log_files
+        streaming_threshold (int): Optional size in bytes above which error
+            logs are streamed instead of read in memory
+        bulk_error_logs (BulkErrorLogs): Optional error logs downloaded in
+            bulk, read instead of requesting each file
+
+    Returns:
+        list: A COUNT_HEADERS dictionary per container type, in discovery
+            order, followed by the totals (type 'all')
+    """
+    error_log_files = error_log_files or {}
+    counts = collections.OrderedDict()
+    for container_dictionary in error_containers:
+        with tracer.span('count_errors', category='container',
+                         _id=container_dictionary['_id']):
+            error_log_count, entry_count = count_error_logs(
+                container_dictionary, client,
+                error_log_filenames=error_log_files.get(container_dictionary['_id']),
+                streaming_threshold=streaming_threshold,
+                bulk_error_logs=bulk_error_logs
+            )
+        progress.container_processed()
+        for type_ in [container_dictionary['type'], 'all']:
+            type_counts = counts.setdefault(type_, {
+                'type': type_, 'containers': 0, 'error_logs': 0, 'errors': 0
+            })
+            type_counts['containers'] += 1
+            type_counts['error_logs'] += error_log_count
+            type_counts['errors'] += entry_count
+    # Totals last
+    totals = counts.pop('all', {
+        'type': 'all', 'containers': 0, 'error_logs': 0, 'errors': 0
+    })
+    return list(counts.values()) + [totals]
+
+
+def get_container_dictionary_errors(container_dictionary, client,
+                                    delete_errors=False,
+                                    error_log_filenames=None,
+                                    streaming_threshold=None,
+                                    bulk_error_logs=None,
+                                    project_schema=None):
+    """Generate the list of errors for a single error container, see
+    get_errors
+
+    Args:
+        container_dictionary (dict): The error container dictionary
+        client (Client): An api client
+        delete_errors (bool): whether to delete error.log.json files and remove error tags
+        error_log_filenames (list): Optional names of the error logs of the
+            container, listed from the container files if not given
+        streaming_threshold (int): Optional size in bytes above which error
+            logs are streamed instead of read in memory
+        bulk_error_logs (BulkErrorLogs): Optional error logs downloaded in
+            bulk, read instead of requesting each file
+        project_schema (ProjectSchema): Optional project schema to validate
+            the items with, see get_validation_target
+    Returns:
+        list: A list of errors for the container
+    """
+    return resolve_error_logs(
+        *read_error_logs(container_dictionary, client,
+                         error_log_filenames=error_log_filenames,
+                         streaming_threshold=streaming_threshold,
+                         bulk_error_logs=bulk_error_logs),
+        delete_errors=delete_errors,
+        project_schema=project_schema
+    )
+
+
+def read_error_logs(container_dictionary, client, validation_pool=None,
+                    error_log_filenames=None, streaming_threshold=None,
+                    bulk_error_logs=None, project_schema=None):
+    """Reads the error logs of an error container, and submits their
+    validation if a validation pool is given
+
+    Args:
+        container_dictionary (dict): The error container dictionary
+        client (Client): An api client
+        validation_pool (ValidationPool): Optional process pool to validate
+            the schemas with
+        error_log_filenames (list): Optional names of the error logs of the
+            container, listed from the container files if not given
+        streaming_threshold (int): Optional size in bytes above which error
+            logs are streamed (see stream_error_log) instead of read in memory
+        bulk_error_logs (BulkErrorLogs): Optional error logs downloaded in
+            bulk, read instead of requesting each file. Error logs missing
+            from it are read from the container
+        project_schema (ProjectSchema): Optional project schema to validate
+            the items with, see get_validation_target
+
+    Returns:
+        tuple: the container dictionary, the container and a list of
+            (error_log_filename, origin_file_dict, error_log, error_statuses)
+            tuples where error_statuses is None or a function returning the
+            validation error messages of each error. error_log is a list, or
+            a generator for streamed error logs
+    """
+    container = client.get_container(container_dictionary['_id'])
+    if error_log_filenames is None:
+        error_log_filenames = [file_.name for file_ in container.files if
+                               file_.name.endswith(ERROR_LOG_FILENAME_SUFFIX)]
+    if streaming_threshold is not None:
+        file_sizes = {file_.name: file_.size for file_ in container.files}
+    error_logs = []
+    for error_log_filename in error_log_filenames:
+        origin_file_dict = get_error_origin_file_dict(container.to_dict(), error_log_filename)
+        data = None
+        if bulk_error_logs is not None:
+            data = bulk_error_logs.pop(container.id, error_log_filename)
+        if (
+            data is None and
+            streaming_threshold is not None and
+            (file_sizes.get(error_log_filename) or 0) > streaming_threshold
+        ):
+            log.info('Streaming file %s on %s %s', error_log_filename, container.container_type, container.id)
+            error_log = stream_error_log(container, error_log_filename)
+            error_logs.append((error_log_filename, origin_file_dict, error_log,
+                               None))
+            progress.error_log_read()
+            continue
+        if data is None:
+            log.info('Reading file %s on %s %s', error_log_filename, container.container_type, container.id)
+            data = container.read_file(error_log_filename)
+        error_log = json.loads(data)
+        error_statuses = None
+        if validation_pool is not None:
+            error_statuses = submit_error_log(error_log, origin_file_dict,
+                                              validation_pool, project_schema)
+        error_logs.append((error_log_filename, origin_file_dict, error_log,
+                           error_statuses))
+        progress.error_log_read()
+    return container_dictionary, container, error_logs
+
+
+def resolve_error_logs(container_dictionary, container, error_logs,
+                       delete_errors=False, validation_pool=None,
+                       project_schema=None):
+    """Generates the errors of a container from the error logs returned by
+    read_error_logs, deleting resolved error logs if requested
+
+    Args:
+        container_dictionary (dict): The error container dictionary
+        container (Container): The error container
+        error_logs (list): The error logs returned by read_error_logs
+        delete_errors (bool): whether to delete error.log.json files and remove error tags
+        validation_pool (ValidationPool): Optional process pool to validate
+            streamed error logs with, in chunks of STREAM_CHUNK_SIZE errors
+        project_schema (ProjectSchema): Optional project schema to validate
+            the items with, see get_validation_target
+    Returns:
+        list: A list of errors for the container
+    """
+    errors = []
+    if error_logs:
+        for error_log_filename, origin_file_dict, error_log, error_statuses in error_logs:
+            if error_statuses is not None:
+                error_statuses = error_statuses()
+            if isinstance(error_log, list) or validation_pool is None:
                 container_errors = get_container_errors(error_log,
                                                         origin_file_dict,
-                                                        container_dictionary)
-
-                resolved = all([
-                    container_error['resolved'] for
-                    container_error in
-                    container_errors
-                ])
-                if resolved and delete_errors:
-                    log.info('Deleting {} for {}={}...'.format(
-                        error_log_filename,
-                        container.container_type,
-                        container.id
-                    ))
-                    container.delete_file(error_log_filename)
-                    container.delete_tag('error')
-                errors += container_errors
-        else:
-            # If the error file isn't there, assume it was resolved
-            resolved = True
-            container.delete_tag('error')
-            container_dictionary['resolved'] = True
-            errors.append(container_dictionary)
+                                                        container_dictionary,
+                                                        error_statuses=error_statuses,
+                                                        project_schema=project_schema)
+            else:
+                container_errors = []
+                err_msg_set = set()
+                for chunk in iter_chunks(error_log, STREAM_CHUNK_SIZE):
+                    container_errors += get_container_errors(
+                        chunk, origin_file_dict, container_dictionary,
+                        error_statuses=submit_error_log(chunk, origin_file_dict,
+                                                        validation_pool,
+                                                        project_schema)(),
+                        err_msg_set=err_msg_set
+                    )
+
+            resolved = all([
+                container_error['resolved'] for
+                container_error in
+                container_errors
+            ])
+            if resolved and delete_errors:
+                log.info('Deleting {} for {}={}...'.format(
+                    error_log_filename,
+                    container.container_type,
+                    container.id
+                ))
+                container.delete_file(error_log_filename)
+                container.delete_tag('error')
+            errors += container_errors
+    else:
+        # If the error file isn't there, assume it was resolved
+        resolved = True
+        container.delete_tag('error')
+        container_dictionary['resolved'] = True
+        errors.append(container_dictionary)
     return errors
 
 
 def update_analysis_label(parent_type, parent_id, analysis_id, analysis_label,
-                          apikey, api_url):
+                          apikey, api_url, session=None):
     """Helper function to make a request to the api without the sdk because the
     sdk doesn't support updating analysis labels
 
@@ -437,6 +1488,8 @@ def update_analysis_label(parent_type, parent_id, analysis_id, analysis_label,
         analysis_label (str): The label that should be set for the analysis
         apikey (str): The api key for the client
         api_url (str): The url for the api
+        session (requests.Session): Optional session to send the request
+            with, e.g. one recording or replaying the api responses
 
     Returns:
         dict: Api response for the request
@@ -459,55 +1512,639 @@ def update_analysis_label(parent_type, parent_id, analysis_id, analysis_label,
         "label": analysis_label
     })
 
-    raw_response = requests.put(url, headers=headers, data=data)
+    raw_response = (session or requests).put(url, headers=headers, data=data)
+    if raw_response.status_code in rate_limit.RETRY_STATUSES:
+        # Raised so that RateLimitedClient.call retries the request
+        raw_response.raise_for_status()
     return raw_response.json()
 
 
+def get_streaming_threshold(config):
+    """Returns the size above which error logs are streamed
+
+    Args:
+        config (dict): The gear config with streaming_threshold_mb
+
+    Returns:
+        int|None: The size in bytes, None to never stream
+    """
+    streaming_threshold_mb = config.get('streaming_threshold_mb')
+    if streaming_threshold_mb is None or streaming_threshold_mb < 0:
+        return None
+    return int(streaming_threshold_mb * 1024 * 1024)
+
+
+def get_bulk_error_logs(config, container_type, parent, client,
+                        error_containers=None, error_log_files=None,
+                        shard=None, checkpoint=None):
+    """Downloads the error logs of the report in a single archive if the
+    bulk_download option is set, see bulk_download
+
+    Args:
+        config (dict): The gear config with bulk_download and
+            streaming_threshold_mb, error logs above the streaming threshold
+            are left out of the archive content and streamed
+        container_type (str): The container type to report on
+        parent (Container): The container the analysis is attached to
+        client (Client): Flywheel Api client
+        error_containers (iterable): The error containers found by the
+            discovery. If their error logs are searched for, the error logs
+            are restricted to them when they are a list
+        error_log_files (dict): The error log file names by container id
+            found by the files discovery, searched for if not given
+        shard (Shard): Optional shard to restrict the error logs to
+        checkpoint (Checkpoint): Optional checkpoint, to restrict the error
+            logs to the containers left
+
+    Returns:
+        BulkErrorLogs|None: The error logs, None if they are not downloaded
+            in bulk
+    """
+    if not config.get('bulk_download'):
+        return None
+    if error_log_files is None:
+        # The tags discovery and checkpoints do not list the error logs
+        try:
+            searched_containers, error_log_files = find_error_log_files(
+                container_type, parent, client, shard=shard
+            )
+        except ValueError as e:
+            log.warning('Bulk download skipped (%s), reading each error log '
+                        'instead', e)
+            return None
+        if isinstance(error_containers, list):
+            # Only the error logs of the containers found by their tag, a
+            # discovery generator is not consumed ahead of the processing
+            discovered_ids = {error_container['_id']
+                              for error_container in error_containers}
+            searched_containers = [
+                error_container for error_container in searched_containers
+                if error_container['_id'] in discovered_ids
+            ]
+        error_containers = searched_containers
+    if checkpoint is not None:
+        error_containers = checkpoint.filter(error_containers)
+    file_refs = bulk_download.get_file_refs(error_containers, error_log_files)
+    log.info('Downloading %d error logs in bulk...', len(file_refs))
+    try:
+        return bulk_download.download_error_logs(
+            client, file_refs, max_size=get_streaming_threshold(config)
+        )
+    except flywheel.ApiException as e:
+        log.warning('Bulk download failed (%s), reading each error log '
+                    'instead', e.status)
+        return None
+    except tarfile.TarError as e:
+        log.warning('Bulk download archive could not be read (%s), reading '
+                    'each error log instead', e)
+        return None
+
+
+def discover_error_containers(discovery, container_type, parent, client,
+                              shard=None, checkpoint=None, subtrees=None):
+    """Finds the error containers with the configured discovery mode, or
+    returns the containers of a checkpoint
+
+    Args:
+        discovery (str): 'tags' to find containers by their error tag, or
+            'files' to find them by their error log files
+        container_type (str): The container type to report on
+        parent (Container): The container the analysis is attached to
+        client (Client): Flywheel Api client
+        shard (Shard): Optional shard to restrict the containers to
+        checkpoint (Checkpoint): Optional checkpoint of a time budgeted run,
+            see time_budget.read_checkpoint. Its containers are processed
+            instead of discovering the containers, their error logs are then
+            listed from their files. If its discovery was stopped, the
+            containers are discovered without those already processed
+        subtrees (dict): Optional dictionary the subject and session ids of
+            each container are added to by container id, see
+            locality.get_subtree
+
+    Returns:
+        tuple: An iterable of error containers (a generator in tags mode)
+            and the error log file names by container id (None in tags mode).
+            The containers are counted by the progress reporter as they are
+            found
+    """
+    if checkpoint is not None and checkpoint.discovery_complete:
+        log.info('Resuming %d containers from checkpoint',
+                 len(checkpoint.containers))
+        return progress.track_discovery(list(checkpoint.containers)), None
+    if checkpoint is not None:
+        log.info('Resuming discovery from checkpoint, skipping %d processed '
+                 'containers', len(checkpoint.processed_ids))
+    discovery = discovery or 'tags'
+    if discovery == 'files':
+        error_containers, error_log_files = find_error_log_files(
+            container_type, parent, client, shard=shard, subtrees=subtrees
+        )
+    elif discovery == 'tags':
+        error_containers = iter_error_containers(
+            container_type, parent, shard=shard, subtrees=subtrees
+        )
+        error_log_files = None
+    else:
+        raise ValueError('Discovery mode {} not valid'.format(discovery))
+    if checkpoint is not None:
+        error_containers = checkpoint.filter(error_containers)
+    return progress.track_discovery(error_containers), error_log_files
+
+
+def run_batched(gear_context, client, parent, container_type, delete_error_logs,
+                validation_pool=None, shard=None, budget=None, checkpoint=None,
+                project_schema=None):
+    """Runs each stage on all containers before starting the next one
+
+    Args:
+        gear_context (GearContext): the gear context
+        client (Client): Flywheel Api client
+        parent (Container): The container the analysis is attached to
+        container_type (str): The container type to report on
+        delete_error_logs (bool): whether to delete resolved error logs
+        validation_pool (ValidationPool): Optional process pool to validate
+            the schemas with
+        shard (Shard): Optional shard to restrict the report to
+        budget (TimeBudget): Optional time budget, the containers are then
+            enriched and validated one at a time until the deadline. The
+            discovery is not budgeted, it is complete before the first
+            container is scheduled
+        checkpoint (Checkpoint): Optional checkpoint of the containers to
+            process instead of discovering them, see discover_error_containers
+        project_schema (ProjectSchema): Optional project schema to validate
+            the items with, see get_validation_target
+
+    Returns:
+        tuple: the report timestamp, the report filename and the error count
+    """
+    # Containers are processed subtree by subtree with the locality option
+    subtrees = {} if gear_context.config.get('locality') else None
+    # Get all containers
+    log.info('Finding containers with errors...')
+    with tracer.span('find_error_containers'):
+        error_containers, error_log_files = discover_error_containers(
+            gear_context.config.get('discovery'), container_type, parent,
+            client, shard=shard, checkpoint=checkpoint, subtrees=subtrees
+        )
+        error_containers = list(error_containers)
+    log.debug('Found %d containers', len(error_containers))
+    with tracer.span('bulk_download'):
+        bulk_error_logs = get_bulk_error_logs(
+            gear_context.config, container_type, parent, client,
+            error_containers=error_containers, error_log_files=error_log_files,
+            shard=shard, checkpoint=checkpoint
+        )
+
+    report_containers = error_containers
+    if subtrees is not None:
+        error_containers = locality.schedule_by_subtree(error_containers,
+                                                        subtrees)
+        client = locality.SubtreeCache(client)
+
+    # Set the resolve paths
+    if budget is not None:
+        # The deadline is checked before each container is enriched
+        error_containers = iter_additional_info(budget.limit(error_containers),
+                                                client)
+    elif subtrees is not None:
+        # Each container is enriched right before its error logs are read,
+        # so that both stages fetch it from the cache
+        error_containers = iter_additional_info(error_containers, client)
+    else:
+        with tracer.span('add_additional_info'):
+            add_additional_info(error_containers, client)
+
+    # Set the status for the containers
+    log.info('Resolving status for invalid containers...')
+    # TODO: Figure out the validator stuff, maybe have our validation be a
+    # pip module?
+    sort_report = gear_context.config.get('sort_report')
+    error_count = 0
+
+    def count(errors):
+        nonlocal error_count
+        for error in errors:
+            error_count += 1
+            yield error
+
+    with tracer.span('get_errors'):
+        errors = iter_errors(error_containers, client,
+                             delete_errors=delete_error_logs,
+                             validation_pool=validation_pool,
+                             error_log_files=error_log_files,
+                             streaming_threshold=get_streaming_threshold(gear_context.config),
+                             bulk_error_logs=bulk_error_logs,
+                             project_schema=project_schema)
+        if sort_report:
+            # Sorted as they are generated, so that the errors are never all
+            # held in memory. The sort order replaces the discovery order
+            errors = sort_errors(count(errors), gear_context.config)
+        else:
+            errors = list(count(errors))
+    if subtrees is not None:
+        client.log_stats()
+        if not sort_report:
+            errors = locality.restore_order(errors, report_containers)
+
+    log.info('Writing error report')
+    timestamp = datetime.datetime.utcnow()
+    with tracer.span('create_output_file'):
+        rows, fieldnames = get_report_rows(errors, gear_context.config,
+                                           presorted=sort_report)
+        filename = create_output_file(parent.label, rows,
+                                      gear_context.config.get('file_type'),
+                                      gear_context, timestamp,
+                                      gear_context.config.get('filename'),
+                                      shard=shard, fieldnames=fieldnames)
+    return timestamp, filename, error_count
+
+
+def run_pipelined(gear_context, client, parent, container_type, delete_error_logs,
+                  validation_pool=None, shard=None, budget=None,
+                  checkpoint=None, project_schema=None):
+    """Runs discovery, enrichment and validation concurrently, connected by
+    bounded queues, while the report is written from the main thread. Rows
+    are written as soon as the first containers are validated and only
+    queue_size items wait between two stages.
+
+    Args:
+        gear_context (GearContext): the gear context
+        client (Client): Flywheel Api client
+        parent (Container): The container the analysis is attached to
+        container_type (str): The container type to report on
+        delete_error_logs (bool): whether to delete resolved error logs
+        validation_pool (ValidationPool): Optional process pool to validate
+            the schemas with, the containers waiting in the queue between
+            reading and resolving their error logs are validated concurrently
+        shard (Shard): Optional shard to restrict the report to
+        budget (TimeBudget): Optional time budget, no container is sent down
+            the pipeline after the deadline
+        checkpoint (Checkpoint): Optional checkpoint of the containers to
+            process instead of discovering them, see discover_error_containers
+        project_schema (ProjectSchema): Optional project schema to validate
+            the items with, see get_validation_target
+
+    Returns:
+        tuple: the report timestamp, the report filename and the error count
+    """
+    queue_size = gear_context.config.get('queue_size') or 100
+    streaming_threshold = get_streaming_threshold(gear_context.config)
+    error_count = 0
+    error_containers, error_log_files = discover_error_containers(
+        gear_context.config.get('discovery'), container_type, parent, client,
+        shard=shard, checkpoint=checkpoint
+    )
+    # Downloaded before the pipeline starts, the containers are then read
+    # from the archive
+    with tracer.span('bulk_download'):
+        bulk_error_logs = get_bulk_error_logs(
+            gear_context.config, container_type, parent, client,
+            error_containers=error_containers, error_log_files=error_log_files,
+            shard=shard, checkpoint=checkpoint
+        )
+    error_log_files = error_log_files or {}
+    if budget is not None:
+        error_containers = budget.limit(error_containers)
+
+    def enrich(error_container):
+        add_container_info(error_container, client)
+        return [error_container]
+
+    def read(error_container):
+        with tracer.span('read_error_logs', category='container',
+                         _id=error_container['_id']):
+            return [read_error_logs(
+                error_container, client, validation_pool,
+                error_log_filenames=error_log_files.get(error_container['_id']),
+                streaming_threshold=streaming_threshold,
+                bulk_error_logs=bulk_error_logs,
+                project_schema=project_schema
+            )]
+
+    def resolve(read_result):
+        with tracer.span('get_errors', category='container',
+                         _id=read_result[0]['_id']):
+            errors = resolve_error_logs(*read_result,
+                                        delete_errors=delete_error_logs,
+                                        validation_pool=validation_pool,
+                                        project_schema=project_schema)
+        progress.container_processed()
+        return errors
+
+    def count(errors):
+        nonlocal error_count
+        for error in errors:
+            error_count += 1
+            yield error
+
+    errors = pipeline.run_pipeline(
+        ('find_error_containers', error_containers),
+        [('add_additional_info', enrich), ('read_error_logs', read),
+         ('get_errors', resolve)],
+        queue_size=queue_size,
+        tracer=tracer
+    )
+    # The report timestamp is taken when writing starts
+    timestamp = datetime.datetime.utcnow()
+    with tracer.span('create_output_file'):
+        rows, fieldnames = get_report_rows(count(errors), gear_context.config)
+        filename = create_output_file(parent.label, rows,
+                                      gear_context.config.get('file_type'),
+                                      gear_context, timestamp,
+                                      gear_context.config.get('filename'),
+                                      shard=shard, fieldnames=fieldnames)
+    return timestamp, filename, error_count
+
+
+def run_count_only(gear_context, client, parent, container_type, shard=None,
+                   budget=None, checkpoint=None):
+    """Counts the errors of the error containers without revalidating them,
+    and writes the counts of each container type as the report
+
+    Args:
+        gear_context (GearContext): the gear context
+        client (Client): Flywheel Api client
+        parent (Container): The container the analysis is attached to
+        container_type (str): The container type to report on
+        shard (Shard): Optional shard to restrict the report to
+        budget (TimeBudget): Optional time budget, no container is counted
+            after the deadline
+        checkpoint (Checkpoint): Optional checkpoint of the containers to
+            count instead of discovering them, see discover_error_containers
+
+    Returns:
+        tuple: the report timestamp, the report filename and the number of
+            error log entries
+    """
+    with tracer.span('find_error_containers'):
+        error_containers, error_log_files = discover_error_containers(
+            gear_context.config.get('discovery'), container_type, parent,
+            client, shard=shard, checkpoint=checkpoint
+        )
+    with tracer.span('bulk_download'):
+        bulk_error_logs = get_bulk_error_logs(
+            gear_context.config, container_type, parent, client,
+            error_containers=error_containers, error_log_files=error_log_files,
+            shard=shard, checkpoint=checkpoint
+        )
+    if budget is not None:
+        error_containers = budget.limit(error_containers)
+    with tracer.span('count_errors'):
+        counts = count_errors(error_containers, client,
+                              error_log_files=error_log_files,
+                              streaming_threshold=get_streaming_threshold(gear_context.config),
+                              bulk_error_logs=bulk_error_logs)
+
+    timestamp = datetime.datetime.utcnow()
+    file_ext = get_file_ext(gear_context.config.get('file_type'))
+    with tracer.span('create_output_file'):
+        filename = create_output_file(
+            parent.label, counts, gear_context.config.get('file_type'),
+            gear_context, timestamp,
+            gear_context.config.get('filename') or '{}-counts-{}.{}'.format(
+                parent.label, timestamp, file_ext
+            ),
+            shard=shard, fieldnames=COUNT_HEADERS
+        )
+    return timestamp, filename, counts[-1]['errors']
+
+
+def merge_shards(gear_context, client, parent, analysis, shard_count):
+    """Combines the latest report of each shard, found among the analyses of
+    the parent, into one report
+
+    Args:
+        gear_context (GearContext): the gear context
+        client (Client): Flywheel Api client
+        parent (Container): The container the analyses are attached to
+        analysis (AnalysisOutput): The analysis of the merge job
+        shard_count (int): The number of shards the report was split into
+
+    Returns:
+        tuple: the report timestamp, the report filename and the error count
+    """
+    file_type = gear_context.config.get('file_type')
+    shard_reports = find_shard_reports(parent.analyses or [], shard_count,
+                                       file_type, exclude_id=analysis.id)
+    error_count = 0
+
+    def count(errors):
+        nonlocal error_count
+        for error in errors:
+            error_count += 1
+            yield error
+
+    errors = read_shard_reports(client, shard_reports, file_type)
+    timestamp = datetime.datetime.utcnow()
+    with tracer.span('create_output_file'):
+        rows, fieldnames = get_report_rows(count(errors), gear_context.config)
+        filename = create_output_file(parent.label, rows, file_type,
+                                      gear_context, timestamp,
+                                      gear_context.config.get('filename'),
+                                      fieldnames=fieldnames)
+    return timestamp, filename, error_count
+
+
+@contextlib.contextmanager
+def report_progress(gear_context, client):
+    """Reports the progress of the run every progress_interval_seconds, in
+    the job log and in progress-{timestamp}.jsonl, see telemetry
+
+    Args:
+        gear_context (GearContext): the gear context so that we can write out
+            the progress file
+        client (RateLimitedClient): The client whose api calls are counted
+    """
+    interval = gear_context.config.get('progress_interval_seconds',
+                                       telemetry.DEFAULT_INTERVAL)
+    if not interval:
+        yield
+        return
+    output_filename = 'progress-{}.jsonl'.format(datetime.datetime.utcnow())
+    with gear_context.open_output(output_filename, 'w') as output_file:
+        progress.start(interval, output_file=output_file,
+                       api_calls=lambda: client.call_count)
+        try:
+            yield
+        finally:
+            progress.stop()
+
+
+def generate_report(gear_context):
+    """Finds the error containers under the analysis parent, revalidates their
+    errors, writes the report and updates the analysis label
+
+    Args:
+        gear_context (GearContext): the gear context
+    """
+    budget = time_budget.get_time_budget(gear_context.config)
+    container_type = gear_context.config.get('container_type')
+    delete_error_logs = gear_context.config.get('delete_error_logs')
+    client = rate_limit.RateLimitedClient(
+        gear_context.client,
+        max_retries=gear_context.config.get('api_max_retries', 5),
+        limiter=rate_limit.AdaptiveLimiter(
+            maximum=gear_context.config.get('api_max_concurrency') or 16
+        )
+    )
+    analysis = client.get_analysis(gear_context.destination['id'])
+    parent = client.get_container(analysis.parent['id'])
+
+    if gear_context.config.get('export_snapshot'):
+        log.info('Exporting snapshot...')
+        with tracer.span('export_snapshot'):
+            filename = snapshot.write_snapshot(client, parent, gear_context,
+                                               datetime.datetime.utcnow())
+        log.info('Wrote snapshot with filename {}'.format(filename))
+
+    shard = get_shard(gear_context.config)
+    checkpoint = None
+    checkpoint_path = gear_context.get_input_path('checkpoint')
+    if checkpoint_path:
+        checkpoint = time_budget.read_checkpoint(checkpoint_path, parent)
+    schema = None
+    schema_path = gear_context.get_input_path('schema')
+    if schema_path:
+        log.info('Validating errors against the project schema')
+        schema = project_schema.ProjectSchema.from_file(schema_path)
+
+    with report_progress(gear_context, client):
+        if gear_context.config.get('merge_shards'):
+            log.info('Merging shard reports...')
+            timestamp, filename, error_count = merge_shards(
+                gear_context, client, parent, analysis,
+                gear_context.config.get('shard_count') or 1
+            )
+            shard = None
+        elif gear_context.config.get('count_only'):
+            log.info('Counting errors without revalidation...')
+            timestamp, filename, error_count = run_count_only(
+                gear_context, client, parent, container_type, shard=shard,
+                budget=budget, checkpoint=checkpoint
+            )
+        else:
+            validation_pool = get_validation_pool(
+                gear_context.config.get('validation_workers')
+            )
+            try:
+                if gear_context.config.get('pipeline'):
+                    log.info('Finding containers and resolving status in pipelined mode...')
+                    timestamp, filename, error_count = run_pipelined(
+                        gear_context, client, parent, container_type, delete_error_logs,
+                        validation_pool=validation_pool, shard=shard,
+                        budget=budget, checkpoint=checkpoint,
+                        project_schema=schema
+                    )
+                else:
+                    timestamp, filename, error_count = run_batched(
+                        gear_context, client, parent, container_type, delete_error_logs,
+                        validation_pool=validation_pool, shard=shard,
+                        budget=budget, checkpoint=checkpoint,
+                        project_schema=schema
+                    )
+            finally:
+                if validation_pool is not None:
+                    validation_pool.close()
+    log.info('Wrote error report with filename {}'.format(filename))
+
+    # Update analysis label
+    analysis_label = 'Metadata Error Report: COUNT={} [{}]'.format(error_count, timestamp)
+    if gear_context.config.get('count_only') and not gear_context.config.get('merge_shards'):
+        analysis_label += ' (count only)'
+    if budget is not None and budget.exhausted:
+        processed_ids = None
+        containers_left = len(budget.remaining)
+        if not budget.discovery_complete:
+            processed_ids = {error_container['_id']
+                             for error_container in budget.scheduled}
+            if checkpoint is not None:
+                processed_ids |= checkpoint.processed_ids
+            containers_left = '{}+'.format(containers_left)
+        filename = time_budget.write_checkpoint(gear_context, parent,
+                                                budget.remaining, timestamp,
+                                                processed_ids=processed_ids)
+        log.info('Wrote checkpoint of {} containers with filename {}'.format(
+            containers_left, filename))
+        analysis_label += ' (partial, {} containers left)'.format(
+            containers_left)
+    if shard is not None:
+        analysis_label += ' (shard {} of {})'.format(shard.index, shard.count)
+    log.info('Updating label of analysis={} to {}'.format(analysis.id, analysis_label))
+
+    # TODO: Remove this when the sdk lets me do this
+    client.call(update_analysis_label,
+                parent.container_type, parent.id, analysis.id,
+                analysis_label,
+                gear_context.client._fw.api_client.configuration.api_key['Authorization'],
+                gear_context.client._fw.api_client.configuration.host,
+                session=replay.get_session(gear_context.client))
+
+
+def write_trace(gear_context, timestamp):
+    """Writes the spans recorded by the tracer as an analysis output
+
+    Args:
+        gear_context (GearContext): the gear context so that we can write out
+            the file
+        timestamp (datetime): timestamp used in the output filename
+
+    Returns:
+        str: The filename that was used to write the trace
+    """
+    output_filename = 'trace-{}.json'.format(timestamp)
+    with gear_context.open_output(output_filename, 'w') as output_file:
+        tracer.dump(output_file)
+    return output_filename
+
+
+def write_diagnostics(gear_context, profiler=None, recorder=None):
+    """Writes the timing trace, the profile and the api recording of the run
+    as analysis outputs, those that are enabled
+
+    Args:
+        gear_context (GearContext): the gear context so that we can write out
+            the files
+        profiler (cProfile.Profile|SamplingProfiler): Optional finished
+            profiler
+        recorder (RecordingAdapter): Optional api recorder
+    """
+    timestamp = datetime.datetime.utcnow()
+    if tracer.enabled:
+        filename = write_trace(gear_context, timestamp)
+        log.info('Wrote timing trace with filename {}'.format(filename))
+    if profiler:
+        filename = tracing.write_profile(profiler, gear_context, timestamp)
+        log.info('Wrote profile with filename {}'.format(filename))
+    if recorder:
+        recorder.close()
+        filename = replay.write_recording(recorder.fixture_dir,
+                                          gear_context, timestamp)
+        log.info('Wrote api recording of {} requests with filename {}'.format(
+            recorder.request_count, filename))
+
+
 def main():
     with flywheel.GearContext() as gear_context:
         gear_context.init_logging()
         log.info(gear_context.config)
         log.info(gear_context.destination)
-        container_type = gear_context.config.get('container_type')
-        delete_error_logs = gear_context.config.get('delete_error_logs')
-        analysis = gear_context.client.get_analysis(
-            gear_context.destination['id']
-        )
-        parent = gear_context.client.get_container(analysis.parent['id'])
-
-        # Get all containers
-        # TODO: Should it be based on whether the error.log file exists?
-        log.info('Finding containers with errors...')
-        error_containers = find_error_containers(container_type, parent)
-        log.debug('Found %d containers', len(error_containers))
-
-        # Set the resolve paths
-        add_additional_info(error_containers, gear_context.client)
-
-        # Set the status for the containers
-        log.info('Resolving status for invalid containers...')
-        # TODO: Figure out the validator stuff, maybe have our validation be a
-        # pip module?
-        errors = get_errors(error_containers, gear_context.client, delete_errors=delete_error_logs)
-        error_count = len(errors)
-
-        log.info('Writing error report')
-        timestamp = datetime.datetime.utcnow()
-        filename = create_output_file(parent.label, errors,
-                                      gear_context.config.get('file_type'),
-                                      gear_context, timestamp,
-                                      gear_context.config.get('filename'))
-        log.info('Wrote error report with filename {}'.format(filename))
-
-        # Update analysis label
-        analysis_label = 'Metadata Error Report: COUNT={} [{}]'.format(error_count, timestamp)
-        log.info('Updating label of analysis={} to {}'.format(analysis.id, analysis_label))
-
-        # TODO: Remove this when the sdk lets me do this
-        update_analysis_label(parent.container_type, parent.id, analysis.id,
-                              analysis_label,
-                              gear_context.client._fw.api_client.configuration.api_key['Authorization'],
-                              gear_context.client._fw.api_client.configuration.host)
+        tracer.enabled = bool(gear_context.config.get('trace'))
+        recorder = None
+        if gear_context.config.get('record_api'):
+            recorder = replay.RecordingAdapter(
+                os.path.join(gear_context.work_dir, 'api-recording')
+            )
+            replay.install(gear_context.client, recorder)
+        profiler = None
+        try:
+            with tracing.profile(gear_context.config.get('profiler')) as profiler:
+                generate_report(gear_context)
+        finally:
+            # Failed runs are the ones the diagnostics are most needed for
+            try:
+                write_diagnostics(gear_context, profiler, recorder)
+            except Exception:
+                log.exception('Could not write the diagnostics of the run')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,66 @@
+"""Runs run.generate_report offline against an api recording, with the
+recorded (or scaled) latency, and prints the run time and api request counts
+
+Recordings are written by the gear with the record_api config option, unzip
+the api-recording-{timestamp}.zip output into a directory to replay it.
+
+Usage:
+    python scripts/bench-replay.py tests/data/replay/project [--latency-scale 1]
+        [--config '{"container_type": "all", "pipeline": true}']
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+import flywheel  # noqa: E402
+import replay  # noqa: E402
+import run  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks a report run on an api recording')
+    parser.add_argument('fixture_dir', help='Directory of the recording')
+    parser.add_argument('--latency-scale', type=float, default=1.0,
+                        help='Factor applied to the recorded latencies')
+    parser.add_argument('--config', default='{}',
+                        help='Gear config as json, merged into the defaults')
+    parser.add_argument('--destination', default='an1',
+                        help='Id of the recorded analysis')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of most repeated requests to print')
+    args = parser.parse_args()
+
+    adapter = replay.ReplayAdapter(args.fixture_dir,
+                                   latency_scale=args.latency_scale)
+    client = flywheel.Client('replay.flywheel.io:replay')
+    replay.install(client, adapter)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        gear_context = mock.MagicMock()
+        gear_context.client = client
+        gear_context.config = dict({'container_type': 'all', 'file_type': 'csv'},
+                                   **json.loads(args.config))
+        gear_context.get_input_path.return_value = None
+        gear_context.destination = {'id': args.destination}
+        gear_context.open_output.side_effect = (
+            lambda name, mode='w': open(os.path.join(output_dir, name), mode)
+        )
+        start = time.perf_counter()
+        run.generate_report(gear_context)
+        elapsed = time.perf_counter() - start
+
+    print('{:.3f}s, {} requests ({} distinct)'.format(
+        elapsed, adapter.request_count, len(adapter.counts)
+    ))
+    for key, count in adapter.counts.most_common(args.top):
+        print('{:6d}  {}'.format(count, key))
+
+
+if __name__ == '__main__':
+    main()
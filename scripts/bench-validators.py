@@ -0,0 +1,77 @@
+"""Compares run.get_schema_errors with and without the fast path validators
+on rules shaped like the ones in tests/data/test_error_list.json
+
+Usage:
+    python scripts/bench-validators.py [--count 20000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+import fast_validators  # noqa: E402
+import run  # noqa: E402
+
+
+def load_rules(count):
+    """Builds (value, schema) pairs from the simple rules of the test error
+    list, plus the other simple rule shapes common in error logs
+
+    Args:
+        count (int): Number of pairs to build
+
+    Returns:
+        list: list of (value, schema) tuples
+    """
+    with open(os.path.join(ROOT, 'tests', 'data', 'test_error_list.json')) as err_data:
+        error_list = json.load(err_data)
+    schemas = [
+        error['schema'] for error in error_list
+        if fast_validators.compile_simple_schema(error['schema']) is not None
+    ]
+    schemas += [
+        {'type': 'string', 'pattern': 'ses-[0-9]+'},
+        {'required': ['AcquisitionDate']},
+        {'type': 'number', 'minimum': 0, 'maximum': 300}
+    ]
+    values = ['NM', 'MR', 'ses-01', 'sub-01', 72.5, -1, {'SeriesDate': '20200101'}]
+    return [
+        (values[index % len(values)], dict(schemas[index % len(schemas)]))
+        for index in range(count)
+    ]
+
+
+def jsonschema_errors(value, schema):
+    validator = run.jsonschema.Draft7Validator(schema)
+    return [error.message for error in sorted(validator.iter_errors(value), key=str)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks schema validation')
+    parser.add_argument('--count', type=int, default=20000,
+                        help='Number of rules to validate')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rules = load_rules(args.count)
+    for value, schema in rules:
+        assert run.get_schema_errors(value, schema) == jsonschema_errors(value, schema)
+
+    timings = {}
+    for name, function in [('jsonschema', jsonschema_errors),
+                           ('get_schema_errors', run.get_schema_errors)]:
+        timings[name] = min(timeit.repeat(
+            lambda: [function(value, schema) for value, schema in rules],
+            number=1, repeat=args.repeat
+        ))
+        print('{:<20} {:8.3f}s {:8.1f}us/rule'.format(
+            name, timings[name], timings[name] / len(rules) * 1e6
+        ))
+    print('speedup {:.1f}x'.format(timings['jsonschema'] / timings['get_schema_errors']))
+
+
+if __name__ == '__main__':
+    main()
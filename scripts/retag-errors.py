@@ -1,6 +1,12 @@
 import argparse
 import flywheel
 import logging
+import os
+import sys
+
+# rate_limit lives next to run.py at the root of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import rate_limit  # noqa: E402
 
 log = logging.getLogger(__name__)
 ERROR_LOG_SUFFIX = 'error.log.json'
@@ -78,6 +84,8 @@ if __name__ == '__main__':
     parser.add_argument('project_path', help='Resolver path of project to upload to')
     parser.add_argument('--project-id', help='If multiple projects of the same'
                                              + ' name, specify id')
+    parser.add_argument('--max-retries', type=int, default=5,
+                        help='Retries of requests the api throttles (429/503)')
 
     args = parser.parse_args()
 
@@ -90,6 +98,9 @@ if __name__ == '__main__':
         client = flywheel.Client(args.api_key)
     else:
         client = flywheel.Client()
+    # Retry throttled requests, containers returned by the client are wrapped
+    # too so add_tag is retried as well
+    client = rate_limit.RateLimitedClient(client, max_retries=args.max_retries)
 
     # Retrieve the project
     if args.project_id:
@@ -102,4 +113,6 @@ if __name__ == '__main__':
 
     tags_added = retag_container(project)
     log.info('Added %d tags', tags_added)
+    log.info('Made %d api calls, %d retried', client.call_count,
+             client.retry_count)
 
@@ -0,0 +1,357 @@
+"""Runs the report offline, against a local snapshot of the metadata of a
+project instead of the api
+
+A snapshot is a directory holding snapshot.json (the parent id, the site url
+and the ids of the containers in the order the api listed them), the json of
+each container in containers/{id}.json and the error logs of each container
+in files/{id}/{name}. The gear writes one with the export_snapshot option.
+
+Usage:
+    python snapshot.py {snapshot dir} [--container-type all] [--file-type csv]
+        [--output-dir .] [--filename report.csv] [--grouped]
+        [--schema project-schema.json]
+"""
+import argparse
+import copy
+import datetime
+import json
+import logging
+import os
+import shutil
+import zipfile
+
+import project_schema
+
+log = logging.getLogger('grp-2')
+
+SNAPSHOT_FILENAME = 'snapshot.json'
+CONTAINERS_DIRNAME = 'containers'
+FILES_DIRNAME = 'files'
+# Finder attributes of each container type
+CHILD_TYPES = {
+    'project': ['subjects', 'sessions'],
+    'subject': ['sessions'],
+    'session': ['acquisitions']
+}
+
+
+class _Record(dict):
+    """Dictionary whose items can also be read as attributes, like the
+    models of the sdk
+    """
+    def __getattr__(self, name):
+        try:
+            return _to_record(self[name])
+        except KeyError:
+            raise AttributeError(name)
+
+
+def _to_record(value):
+    if isinstance(value, dict) and not isinstance(value, _Record):
+        return _Record(value)
+    if isinstance(value, list):
+        return [_to_record(item) for item in value]
+    return value
+
+
+class SnapshotContainer(_Record):
+    """A container of a snapshot, with the methods of the sdk containers
+    used by the report. Files are never deleted from a snapshot.
+    """
+    def __init__(self, snapshot_client, container):
+        super(SnapshotContainer, self).__init__(container)
+        self._snapshot_client = snapshot_client
+
+    @property
+    def id(self):
+        return self['id']
+
+    def __getattr__(self, name):
+        if name in CHILD_TYPES.get(self.get('container_type'), []):
+            # e.g. sessions lists the children of type session
+            return _SnapshotFinder(
+                self._snapshot_client,
+                self._snapshot_client.get_children(self.id, name[:-1])
+            )
+        return super(SnapshotContainer, self).__getattr__(name)
+
+    def to_dict(self):
+        return copy.deepcopy(dict(self))
+
+    def _file_path(self, name):
+        return os.path.join(self._snapshot_client.snapshot_dir, FILES_DIRNAME,
+                            self.id, name)
+
+    def read_file(self, name):
+        with open(self._file_path(name), 'rb') as snapshot_file:
+            return snapshot_file.read()
+
+    def download_file(self, name, dest_file):
+        shutil.copyfile(self._file_path(name), dest_file)
+
+    def delete_file(self, name):
+        log.info('Not deleting %s of %s %s from the snapshot', name,
+                 self.get('container_type'), self.id)
+
+    def delete_tag(self, tag):
+        log.info('Not removing tag %s of %s %s from the snapshot', tag,
+                 self.get('container_type'), self.id)
+
+
+class _SnapshotFinder(object):
+    """Finds the children of a snapshot container, only the tags=error
+    filter used by the report is supported
+    """
+    def __init__(self, snapshot_client, containers):
+        self._snapshot_client = snapshot_client
+        self._containers = containers
+
+    def find(self, *filters):
+        containers = self._containers
+        for filter_ in filters:
+            if filter_ != 'tags=error':
+                raise ValueError('Filter {} not supported on snapshots'.format(filter_))
+            containers = [container for container in containers
+                          if 'error' in (container.get('tags') or [])]
+        return [SnapshotContainer(self._snapshot_client, container)
+                for container in containers]
+
+
+class SnapshotClient(object):
+    """Serves the containers and error logs of a snapshot with the subset of
+    the flywheel client api used by the report
+
+    Args:
+        snapshot_dir (str): The snapshot directory
+    """
+    def __init__(self, snapshot_dir):
+        self.snapshot_dir = snapshot_dir
+        with open(os.path.join(snapshot_dir, SNAPSHOT_FILENAME)) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        self.parent_id = snapshot['parent']
+        self.api_url = snapshot['api_url']
+        self._containers = {}
+        # Children by parent id and container type, in snapshot order
+        self._children = {}
+        for _id in snapshot['containers']:
+            with open(os.path.join(snapshot_dir, CONTAINERS_DIRNAME,
+                                   '{}.json'.format(_id))) as container_file:
+                container = json.load(container_file)
+            self._containers[_id] = container
+            for parent_id in (container.get('parents') or {}).values():
+                if parent_id:
+                    self._children.setdefault(
+                        (parent_id, container.get('container_type')), []
+                    ).append(container)
+
+    def get(self, _id):
+        return self.get_container(_id)
+
+    def get_container(self, _id):
+        try:
+            return SnapshotContainer(self, self._containers[_id])
+        except KeyError:
+            raise ValueError('Container {} is not in the snapshot'.format(_id))
+
+    def get_children(self, _id, container_type):
+        return self._children.get((_id, container_type), [])
+
+    def get_config(self):
+        return _Record({'site': {'api_url': self.api_url}})
+
+    def search(self, query, size=None):
+        """Lists the error logs under the snapshot parent, the query is not
+        parsed: a snapshot only holds the containers under its parent
+        """
+        results = []
+        for container in self._containers.values():
+            if container['id'] == self.parent_id:
+                continue
+            parents = container.get('parents') or {}
+            session_id = container['id'] if container.get('container_type') == 'session' else parents.get('session')
+            for file_ in container.get('files') or []:
+                if file_['name'].endswith('error.log.json'):
+                    results.append(_Record({
+                        'file': {'name': file_['name']},
+                        'parent': {'type': container.get('container_type'),
+                                   'id': container['id']},
+                        'session': {'id': session_id}
+                    }))
+        return results[:size]
+
+
+def get_error_log_filenames(container):
+    """Returns the names of the error logs of a container, empty if its
+    files are not listed
+    """
+    return [
+        file_.name for file_ in (getattr(container, 'files', None) or [])
+        if file_.name.endswith('error.log.json')
+    ]
+
+
+def export_snapshot(client, parent, archive):
+    """Writes a snapshot of the parent, its ancestors and the containers
+    under it to a zip archive. The error tagged containers and the
+    containers with error logs are fetched in full, with their error logs.
+
+    Args:
+        client (Client): Flywheel Api client
+        parent (Container): The container the analysis is attached to
+        archive (zipfile.ZipFile): The archive to write to
+
+    Returns:
+        int: The number of containers in the snapshot
+    """
+    containers = []
+    for parent_type in ['group', 'project', 'subject', 'session']:
+        ancestor_id = parent.parents.get(parent_type)
+        if ancestor_id:
+            ancestor = client.get(ancestor_id)
+            containers.append((parent_type, ancestor))
+    containers.append((parent.container_type, parent))
+
+    children = []
+    for child_finder in CHILD_TYPES.get(parent.container_type, []):
+        children += [(child_finder[:-1], child)
+                     for child in getattr(parent, child_finder).find()]
+    # Sessions are listed before their acquisitions are
+    if parent.container_type == 'session':
+        sessions = [parent]
+    else:
+        sessions = [child for child_type, child in children if child_type == 'session']
+    for session in sessions:
+        children += [('acquisition', acquisition)
+                     for acquisition in session.acquisitions.find()]
+
+    ids = []
+    for container_type, container in containers + children:
+        if container.id in ids:
+            continue
+        ids.append(container.id)
+        error_log_filenames = get_error_log_filenames(container)
+        if error_log_filenames or 'error' in (getattr(container, 'tags', None) or []):
+            # Listed containers may not include the file metadata
+            container = client.get(container.id)
+            for error_log_filename in get_error_log_filenames(container):
+                archive.writestr(
+                    '{}/{}/{}'.format(FILES_DIRNAME, container.id, error_log_filename),
+                    container.read_file(error_log_filename)
+                )
+        container_dict = container.to_dict()
+        container_dict['container_type'] = container_type
+        archive.writestr('{}/{}.json'.format(CONTAINERS_DIRNAME, container.id),
+                         json.dumps(container_dict, default=str))
+
+    archive.writestr(SNAPSHOT_FILENAME, json.dumps({
+        'parent': parent.id,
+        'api_url': client.get_config().site.api_url,
+        'containers': ids
+    }))
+    return len(ids)
+
+
+def write_snapshot(client, parent, gear_context, timestamp):
+    """Writes a snapshot of the parent as a zip analysis output
+
+    Args:
+        client (Client): Flywheel Api client
+        parent (Container): The container the analysis is attached to
+        gear_context (GearContext): the gear context so that we can write out
+            the file
+        timestamp (datetime): timestamp used in the output filename
+
+    Returns:
+        str: The filename that was used to write the snapshot
+    """
+    output_filename = 'snapshot-{}.zip'.format(timestamp)
+    with gear_context.open_output(output_filename, 'wb') as output_file:
+        with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+            count = export_snapshot(client, parent, archive)
+    log.info('Exported %d containers', count)
+    return output_filename
+
+
+class LocalOutput(object):
+    """Writes the report to a local directory, in place of the gear context
+
+    Args:
+        output_dir (str): The directory the report is written to
+    """
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+
+    def open_output(self, name, mode='w', **kwargs):
+        return open(os.path.join(self.output_dir, name), mode, **kwargs)
+
+
+def run_snapshot_report(snapshot_dir, output_dir, container_type='all',
+                        file_type='csv', filename=None, grouped=False,
+                        schema_path=None, sort_report=False):
+    """Finds the error containers of a snapshot, revalidates their errors and
+    writes the report, the same as the gear does against the api
+
+    Args:
+        snapshot_dir (str): The snapshot directory
+        output_dir (str): The directory the report is written to
+        container_type (str): The container type to report on
+        file_type (str): The file type of the report
+        filename (str): Optional report file name
+        grouped (bool): Whether to group identical errors, see
+            run.group_errors
+        schema_path (str): Optional project schema to validate the errors
+            against, see project_schema
+        sort_report (bool): Whether to sort the errors by path and type, see
+            run.sort_errors
+
+    Returns:
+        tuple: the report filename and the error count
+    """
+    # Imported here because run imports this module to export snapshots
+    import run
+
+    client = SnapshotClient(snapshot_dir)
+    parent = client.get_container(client.parent_id)
+    error_containers = run.find_error_containers(container_type, parent)
+    run.add_additional_info(error_containers, client)
+    schema = None
+    if schema_path:
+        schema = project_schema.ProjectSchema.from_file(schema_path)
+    errors = run.get_errors(error_containers, client, project_schema=schema)
+    rows, fieldnames = run.get_report_rows(errors, {'grouped': grouped,
+                                                    'file_type': file_type,
+                                                    'sort_report': sort_report})
+    filename = run.create_output_file(parent.label, rows, file_type,
+                                      LocalOutput(output_dir),
+                                      datetime.datetime.utcnow(), filename,
+                                      fieldnames=fieldnames)
+    return filename, len(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Writes the error report of a snapshot')
+    parser.add_argument('snapshot_dir', help='Unzipped snapshot-{timestamp}.zip output')
+    parser.add_argument('--container-type', default='all')
+    parser.add_argument('--file-type', default='csv', choices=['csv', 'json', 'sqlite'])
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--filename', help='Optional report name override')
+    parser.add_argument('--grouped', action='store_true',
+                        help='One row per distinct error')
+    parser.add_argument('--sort-report', action='store_true',
+                        help='Sort the errors by path and type')
+    parser.add_argument('--schema', help='Optional project schema to '
+                        'validate the errors against')
+    args = parser.parse_args()
+
+    logging.basicConfig(level='INFO')
+    filename, error_count = run_snapshot_report(
+        args.snapshot_dir, args.output_dir, container_type=args.container_type,
+        file_type=args.file_type, filename=args.filename, grouped=args.grouped,
+        schema_path=args.schema, sort_report=args.sort_report
+    )
+    log.info('Wrote error report of %d errors with filename %s', error_count,
+             filename)
+
+
+if __name__ == '__main__':
+    main()
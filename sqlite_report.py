@@ -0,0 +1,171 @@
+"""Writes reports as indexed SQLite databases
+
+Error reports are normalized into containers, messages and errors tables,
+with a report view giving back the rows of the csv report in order:
+
+    SELECT * FROM report WHERE path LIKE 'group/project/sub-01/%'
+    SELECT _id, path, error FROM report WHERE resolved = 0 AND type = 'session'
+
+Other reports (grouped or count_only reports) are written as a single report
+table with their columns.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+
+
+# Rows inserted per executemany call
+INSERT_BATCH_SIZE = 1000
+ERROR_COLUMNS = ['_id', 'path', 'url', 'error', 'resolved', 'type']
+
+SCHEMA = '''
+CREATE TABLE containers (
+    id INTEGER PRIMARY KEY,
+    container_id TEXT NOT NULL UNIQUE,
+    type TEXT,
+    path TEXT,
+    url TEXT
+);
+CREATE TABLE messages (
+    id INTEGER PRIMARY KEY,
+    message TEXT NOT NULL UNIQUE
+);
+CREATE TABLE errors (
+    id INTEGER PRIMARY KEY,
+    container INTEGER NOT NULL REFERENCES containers (id),
+    message INTEGER REFERENCES messages (id),
+    resolved INTEGER
+);
+CREATE VIEW report AS
+    SELECT containers.container_id AS _id, containers.path AS path,
+           containers.url AS url, messages.message AS error,
+           errors.resolved AS resolved, containers.type AS type
+    FROM errors
+    JOIN containers ON containers.id = errors.container
+    LEFT JOIN messages ON messages.id = errors.message
+    ORDER BY errors.id;
+'''
+# Created once the rows are inserted, which is faster than updating them on
+# each insert
+INDEXES = '''
+CREATE INDEX containers_path ON containers (path);
+CREATE INDEX containers_type ON containers (type);
+CREATE INDEX errors_container ON errors (container);
+CREATE INDEX errors_message ON errors (message);
+CREATE INDEX errors_resolved ON errors (resolved);
+'''
+
+
+def _iter_batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _to_bool(value):
+    """resolved is a bool, or a string in rows read back from csv reports"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        return value == 'True'
+    return bool(value)
+
+
+def _insert_errors(connection, errors):
+    connection.executescript(SCHEMA)
+    for batch in _iter_batches(errors):
+        with connection:
+            connection.executemany(
+                'INSERT OR IGNORE INTO containers (container_id, type, path, url) '
+                'VALUES (?, ?, ?, ?)',
+                [(error.get('_id'), error.get('type'), error.get('path'),
+                  error.get('url')) for error in batch]
+            )
+            connection.executemany(
+                'INSERT OR IGNORE INTO messages (message) VALUES (?)',
+                [(error['error'],) for error in batch if error.get('error')]
+            )
+            connection.executemany(
+                'INSERT INTO errors (container, message, resolved) VALUES ('
+                '(SELECT id FROM containers WHERE container_id = ?), '
+                '(SELECT id FROM messages WHERE message = ?), ?)',
+                [(error.get('_id'), error.get('error') or None,
+                  _to_bool(error.get('resolved'))) for error in batch]
+            )
+    connection.executescript(INDEXES)
+
+
+def _insert_rows(connection, rows, fieldnames):
+    connection.execute('CREATE TABLE report ({})'.format(
+        ', '.join('"{}"'.format(fieldname) for fieldname in fieldnames)
+    ))
+    insert = 'INSERT INTO report VALUES ({})'.format(
+        ', '.join('?' for _ in fieldnames)
+    )
+    for batch in _iter_batches(rows):
+        with connection:
+            connection.executemany(insert, [
+                tuple(
+                    json.dumps(row.get(fieldname))
+                    if isinstance(row.get(fieldname), (list, dict))
+                    else row.get(fieldname)
+                    for fieldname in fieldnames
+                )
+                for row in batch
+            ])
+
+
+def write_sqlite_report(rows, output_file, fieldnames=ERROR_COLUMNS):
+    """Writes report rows to a SQLite database
+
+    Args:
+        rows (iterable): The report rows, can be a generator
+        output_file (file): A writable binary file the database is copied
+            to, the database is built in a temporary file first
+        fieldnames (list): The columns of the rows, error rows (see
+            run.CSV_HEADERS) are normalized
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'report.sqlite')
+        connection = sqlite3.connect(path)
+        try:
+            if set(fieldnames) == set(ERROR_COLUMNS):
+                _insert_errors(connection, rows)
+            else:
+                _insert_rows(connection, rows, fieldnames)
+        finally:
+            connection.close()
+        with open(path, 'rb') as database_file:
+            shutil.copyfileobj(database_file, output_file)
+
+
+def read_sqlite_report(data):
+    """Reads the rows of an error report written by write_sqlite_report
+
+    Args:
+        data (bytes): The content of the database file
+
+    Yields:
+        dict: The rows of the report, in order
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'report.sqlite')
+        with open(path, 'wb') as database_file:
+            database_file.write(data)
+        connection = sqlite3.connect(path)
+        connection.row_factory = sqlite3.Row
+        try:
+            for row in connection.execute('SELECT * FROM report'):
+                row = dict(row)
+                if row['resolved'] is not None:
+                    row['resolved'] = bool(row['resolved'])
+                yield row
+        finally:
+            connection.close()
@@ -0,0 +1,215 @@
+"""Reports the progress of long runs
+
+The stages count the containers found, the containers processed and the
+error logs read on a ProgressReporter. While the run is reporting, a thread
+logs a progress event every interval and appends it as one json line to the
+progress file, with the throughput over the last interval and the estimated
+time left. A stalled run keeps reporting, with no throughput.
+"""
+import datetime
+import json
+import logging
+import threading
+import time
+
+
+log = logging.getLogger('grp-2')
+
+DEFAULT_INTERVAL = 60
+
+
+def format_duration(seconds):
+    """Formats a duration in seconds as e.g. 1h02m03s"""
+    if seconds is None:
+        return 'unknown'
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return '{}h{:02d}m{:02d}s'.format(hours, minutes, seconds)
+    if minutes:
+        return '{}m{:02d}s'.format(minutes, seconds)
+    return '{}s'.format(seconds)
+
+
+class ProgressReporter(object):
+    """Counts the progress of a run and reports it periodically once started
+
+    Args:
+        clock (callable): Returns the current time in seconds
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._output_file = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.containers_found = 0
+            self.discovery_complete = False
+            self.containers_processed = 0
+            self.error_logs_read = 0
+            self.api_calls = None
+            self._start = self.clock()
+            # Counts at the previous event, for the interval throughput
+            self._last = (self._start, 0, 0)
+
+    def track_discovery(self, error_containers):
+        """Counts the containers found as they are discovered
+
+        Args:
+            error_containers (iterable): The discovered containers, a list
+                when the discovery is already complete, or a generator
+
+        Returns:
+            iterable: The list itself, or a generator of the containers
+        """
+        if isinstance(error_containers, list):
+            with self._lock:
+                self.containers_found += len(error_containers)
+                self.discovery_complete = True
+            return error_containers
+        return self._track_discovery(error_containers)
+
+    def _track_discovery(self, error_containers):
+        for error_container in error_containers:
+            with self._lock:
+                self.containers_found += 1
+            yield error_container
+        with self._lock:
+            self.discovery_complete = True
+
+    def container_processed(self):
+        with self._lock:
+            self.containers_processed += 1
+
+    def error_log_read(self):
+        with self._lock:
+            self.error_logs_read += 1
+
+    def get_event(self, stage=None):
+        """Returns the progress since the start of the run
+
+        Args:
+            stage (str): Optional stage of the run, guessed from the counts
+                if not given
+
+        Returns:
+            dict: The progress event. The rates are per second over the time
+                since the previous event, the containers left and the time
+                left are None until the discovery is complete
+        """
+        now = self.clock()
+        with self._lock:
+            api_calls = self.api_calls() if self.api_calls is not None else None
+            last_time, last_processed, last_api_calls = self._last
+            interval = now - last_time
+            processed_rate = None
+            api_call_rate = None
+            if interval > 0:
+                processed_rate = (self.containers_processed - last_processed) / interval
+                if api_calls is not None:
+                    api_call_rate = (api_calls - last_api_calls) / interval
+            self._last = (now, self.containers_processed, api_calls or 0)
+
+            remaining = None
+            eta = None
+            if self.discovery_complete:
+                remaining = max(self.containers_found - self.containers_processed, 0)
+                if remaining == 0:
+                    eta = 0
+                elif processed_rate:
+                    eta = remaining / processed_rate
+            if stage is None:
+                if not self.discovery_complete and not self.containers_processed:
+                    stage = 'discovery'
+                else:
+                    stage = 'processing'
+            return {
+                'time': datetime.datetime.utcnow().isoformat(),
+                'stage': stage,
+                'elapsed_seconds': round(now - self._start, 3),
+                'containers_found': self.containers_found,
+                'discovery_complete': self.discovery_complete,
+                'containers_processed': self.containers_processed,
+                'containers_remaining': remaining,
+                'error_logs_read': self.error_logs_read,
+                'api_calls': api_calls,
+                'api_calls_per_second': _round(api_call_rate),
+                'containers_per_second': _round(processed_rate),
+                'eta_seconds': _round(eta)
+            }
+
+    def report(self, stage=None):
+        """Logs a progress event and writes it to the progress file
+
+        Args:
+            stage (str): Optional stage of the run, see get_event
+
+        Returns:
+            dict: The progress event
+        """
+        event = self.get_event(stage)
+        total = event['containers_found']
+        if not event['discovery_complete']:
+            total = '{}+'.format(total)
+        log.info(
+            'Progress (%s): %d/%s containers processed, %s left, %d error logs '
+            'read, %s containers/s, %s api calls/s, ETA %s', event['stage'],
+            event['containers_processed'], total,
+            _or_unknown(event['containers_remaining']), event['error_logs_read'],
+            _or_unknown(event['containers_per_second']),
+            _or_unknown(event['api_calls_per_second']),
+            format_duration(event['eta_seconds'])
+        )
+        if self._output_file is not None:
+            self._output_file.write(json.dumps(event) + '\n')
+            self._output_file.flush()
+        return event
+
+    def start(self, interval=DEFAULT_INTERVAL, output_file=None, api_calls=None):
+        """Resets the counts and reports every interval until stop
+
+        Args:
+            interval (float): Seconds between two events
+            output_file (file): Optional text file the events are appended to
+            api_calls (callable): Optional function returning the number of
+                api calls made so far, e.g. of a rate_limit.RateLimitedClient
+        """
+        self.reset()
+        self.api_calls = api_calls
+        if api_calls is not None:
+            # The calls made before the start are not in the first rate
+            self._last = (self._start, 0, api_calls())
+        self._output_file = output_file
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,),
+                                        name='progress', daemon=True)
+        self._thread.start()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.report()
+            except Exception:
+                log.exception('Could not report progress')
+
+    def stop(self):
+        """Stops reporting, after a last 'done' event"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.report('done')
+        self._output_file = None
+
+
+def _round(value):
+    return round(value, 3) if value is not None else None
+
+
+def _or_unknown(value):
+    return 'unknown' if value is None else value
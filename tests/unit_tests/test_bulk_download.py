@@ -0,0 +1,178 @@
+import io
+import tarfile
+import zipfile
+from unittest import mock
+
+import flywheel
+import pytest
+import bulk_download
+import replay
+import run
+import snapshot
+from test_replay import FIXTURE_DIR, REQUEST_COUNT, replay_report
+
+
+ERROR_LOG_COUNT = 4
+
+
+@pytest.fixture
+def files_dir(tmp_path):
+    """The error logs of the fixture, from a snapshot of the project"""
+    client = flywheel.Client('example.flywheel.io:key')
+    replay.install(client, replay.ReplayAdapter(FIXTURE_DIR, latency=0))
+    gear_context = mock.MagicMock()
+    gear_context.open_output.side_effect = (
+        lambda name, mode='w': open(tmp_path / name, mode)
+    )
+    filename = snapshot.write_snapshot(client, client.get('p1'), gear_context, 'now')
+    with zipfile.ZipFile(tmp_path / filename) as archive:
+        archive.extractall(tmp_path / 'snapshot')
+    return str(tmp_path / 'snapshot' / snapshot.FILES_DIRNAME)
+
+
+def get_archive(members):
+    content = io.BytesIO()
+    with tarfile.open(fileobj=content, mode='w') as archive:
+        for name, data in members:
+            member = tarfile.TarInfo(name)
+            member.size = len(data)
+            archive.addfile(member, io.BytesIO(data))
+    content.seek(0)
+    return content
+
+
+@pytest.mark.parametrize('config', [
+    {},
+    {'discovery': 'files'},
+    {'pipeline': True, 'queue_size': 1},
+    {'count_only': True}
+])
+def test_bulk_report_matches_per_file_report(tmp_path, files_dir, config):
+    per_file = replay_report(replay.ReplayAdapter(FIXTURE_DIR, latency=0),
+                             tmp_path / 'per_file', **config)
+    upstream = replay.ReplayAdapter(FIXTURE_DIR, latency=0)
+    adapter = bulk_download.ArchiveAdapter(files_dir, upstream)
+    bulk = replay_report(adapter, tmp_path / 'bulk', bulk_download=True,
+                         **config)
+
+    assert bulk == per_file
+    assert adapter.archive_count == 1
+    assert not [key for key in upstream.counts if '/files/' in key]
+    assert upstream.counts['POST /api/dataexplorer/search?simple=true&size=10000'] == 1
+
+
+def test_bulk_report_request_count(tmp_path, files_dir):
+    upstream = replay.ReplayAdapter(FIXTURE_DIR, latency=0)
+    replay_report(bulk_download.ArchiveAdapter(files_dir, upstream),
+                  tmp_path / 'bulk', bulk_download=True)
+
+    # The file reads are replaced by a file search, a ticket and its archive
+    assert upstream.request_count == REQUEST_COUNT - ERROR_LOG_COUNT + 1
+
+
+def test_bulk_report_streams_large_error_logs(tmp_path, files_dir):
+    upstream = replay.ReplayAdapter(FIXTURE_DIR, latency=0)
+    adapter = bulk_download.ArchiveAdapter(files_dir, upstream)
+    replay_report(adapter, tmp_path / 'bulk', bulk_download=True,
+                  streaming_threshold_mb=0)
+
+    assert adapter.archive_count == 1
+    assert len([key for key in upstream.counts if '/files/' in key]) == ERROR_LOG_COUNT
+
+
+def test_record_bulk_report(tmp_path, files_dir):
+    per_file = replay_report(replay.ReplayAdapter(FIXTURE_DIR, latency=0),
+                             tmp_path / 'per_file')
+    archive_adapter = bulk_download.ArchiveAdapter(
+        files_dir, replay.ReplayAdapter(FIXTURE_DIR, latency=0)
+    )
+    recorder = replay.RecordingAdapter(str(tmp_path / 'recording'),
+                                       adapter=archive_adapter)
+    recorded = replay_report(recorder, tmp_path / 'recorded', bulk_download=True)
+    recorder.close()
+
+    assert recorded == per_file
+    assert archive_adapter.archive_count == 1
+    # The archive is replayed from the recording
+    replayed = replay_report(replay.ReplayAdapter(str(tmp_path / 'recording'), latency=0),
+                             tmp_path / 'replayed', bulk_download=True)
+    assert replayed == per_file
+
+
+def test_read_archive():
+    archive = get_archive([
+        ('acquisition/acq1/t1.dcm.zip.error.log.json', b'[1]'),
+        ('acquisition/acq1/large.error.log.json', b'[1, 2, 3, 4, 5]'),
+        ('acquisition/acq2/t1.dcm.zip.error.log.json', b'[2]'),
+        ('session/ses1/visit.txt.error.log.json', b'[3]')
+    ])
+    file_refs = bulk_download.get_file_refs(
+        [{'_id': 'acq1', 'type': 'acquisition'}, {'_id': 'ses1', 'type': 'session'}],
+        {'acq1': ['t1.dcm.zip.error.log.json', 'large.error.log.json'],
+         'ses1': ['visit.txt.error.log.json']}
+    )
+    assert file_refs[0] == {'container_name': 'acquisition', 'container_id': 'acq1',
+                            'filename': 't1.dcm.zip.error.log.json'}
+
+    bulk_error_logs = bulk_download.read_archive(archive, file_refs, max_size=10)
+
+    assert len(bulk_error_logs) == 2
+    assert bulk_error_logs.pop('acq1', 't1.dcm.zip.error.log.json') == b'[1]'
+    assert bulk_error_logs.pop('acq1', 't1.dcm.zip.error.log.json') is None
+    assert bulk_error_logs.pop('acq1', 'large.error.log.json') is None
+    assert bulk_error_logs.pop('acq2', 't1.dcm.zip.error.log.json') is None
+    assert bulk_error_logs.pop('ses1', 'visit.txt.error.log.json') == b'[3]'
+
+
+def test_bulk_download_fallback():
+    client = mock.MagicMock()
+    client.create_download_ticket.side_effect = flywheel.ApiException(status=404)
+    error_containers = [{'_id': 'acq1', 'type': 'acquisition'}]
+    error_log_files = {'acq1': ['t1.dcm.zip.error.log.json']}
+
+    assert run.get_bulk_error_logs(
+        {'bulk_download': True}, 'all', mock.MagicMock(), client,
+        error_containers=error_containers, error_log_files=error_log_files
+    ) is None
+    assert run.get_bulk_error_logs(
+        {}, 'all', mock.MagicMock(), client,
+        error_containers=error_containers, error_log_files=error_log_files
+    ) is None
+    assert client.create_download_ticket.call_count == 1
+
+    # An archive that cannot be read
+    client.create_download_ticket.side_effect = None
+    client.files_api.download_ticket_with_http_info.return_value.raw = (
+        io.BytesIO(b'not an archive' * 100)
+    )
+    assert run.get_bulk_error_logs(
+        {'bulk_download': True}, 'all', mock.MagicMock(), client,
+        error_containers=error_containers, error_log_files=error_log_files
+    ) is None
+
+
+def test_bulk_download_of_discovered_containers(monkeypatch):
+    monkeypatch.setattr(run, 'find_error_log_files', lambda *args, **kwargs: (
+        [{'_id': 'acq1', 'type': 'acquisition'}, {'_id': 'acq2', 'type': 'acquisition'}],
+        {'acq1': ['t1.dcm.zip.error.log.json'], 'acq2': ['t1.dcm.zip.error.log.json']}
+    ))
+    download_error_logs = mock.MagicMock()
+    monkeypatch.setattr(bulk_download, 'download_error_logs', download_error_logs)
+
+    run.get_bulk_error_logs({'bulk_download': True}, 'all', mock.MagicMock(),
+                            mock.MagicMock(), error_containers=[
+                                {'_id': 'acq1', 'type': 'acquisition'}
+                            ])
+    file_refs = download_error_logs.call_args[0][1]
+    assert [file_ref['container_id'] for file_ref in file_refs] == ['acq1']
+
+
+def test_bulk_download_search_limit(monkeypatch):
+    def find_error_log_files(*args, **kwargs):
+        raise ValueError('Too many error logs')
+    monkeypatch.setattr(run, 'find_error_log_files', find_error_log_files)
+
+    assert run.get_bulk_error_logs(
+        {'bulk_download': True}, 'all', mock.MagicMock(), mock.MagicMock(),
+        error_containers=[{'_id': 'acq1', 'type': 'acquisition'}]
+    ) is None
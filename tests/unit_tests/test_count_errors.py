@@ -0,0 +1,63 @@
+import json
+from unittest import mock
+
+import run
+
+
+def get_client(containers):
+    client = mock.MagicMock()
+    client.get_container.side_effect = lambda _id: containers[_id]
+    return client
+
+
+def get_container(files):
+    container = mock.MagicMock()
+    container.files = []
+    for name, error_log in files.items():
+        file_ = mock.MagicMock()
+        file_.name = name
+        file_.size = len(json.dumps(error_log))
+        container.files.append(file_)
+    container.read_file.side_effect = lambda name: json.dumps(files[name])
+    return container
+
+
+def test_count_errors():
+    containers = {
+        'sub1': get_container({'a.csv.error.log.json': [{}, {}], 'a.csv': []}),
+        'ses1': get_container({}),
+        'acq1': get_container({'t1.dcm.error.log.json': [{}], 'b.dcm.error.log.json': [{}, {}, {}]}),
+        'acq2': get_container({'t2.dcm.error.log.json': [{}]})
+    }
+    error_containers = [
+        {'_id': 'sub1', 'type': 'subject'},
+        {'_id': 'ses1', 'type': 'session'},
+        {'_id': 'acq1', 'type': 'acquisition'},
+        {'_id': 'acq2', 'type': 'acquisition'}
+    ]
+    with mock.patch('run.validate') as validate:
+        counts = run.count_errors(error_containers, get_client(containers))
+    validate.assert_not_called()
+
+    assert counts == [
+        {'type': 'subject', 'containers': 1, 'error_logs': 1, 'errors': 2},
+        {'type': 'session', 'containers': 1, 'error_logs': 0, 'errors': 0},
+        {'type': 'acquisition', 'containers': 2, 'error_logs': 3, 'errors': 5},
+        {'type': 'all', 'containers': 4, 'error_logs': 4, 'errors': 7}
+    ]
+    containers['ses1'].delete_tag.assert_not_called()
+
+
+def test_count_errors_with_error_log_files():
+    container = get_container({'t1.dcm.error.log.json': [{}, {}], 'b.dcm.error.log.json': [{}]})
+    counts = run.count_errors([{'_id': 'acq1', 'type': 'acquisition'}],
+                              get_client({'acq1': container}),
+                              error_log_files={'acq1': ['t1.dcm.error.log.json']})
+
+    assert counts[-1] == {'type': 'all', 'containers': 1, 'error_logs': 1, 'errors': 2}
+
+
+def test_count_errors_empty():
+    assert run.count_errors([], get_client({})) == [
+        {'type': 'all', 'containers': 0, 'error_logs': 0, 'errors': 0}
+    ]
@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+
+import run
+
+
+class MockGearContext(object):
+    def __init__(self):
+        self.outputs = {}
+
+    def open_output(self, name, mode):
+        output = io.StringIO()
+        output.close = lambda: None
+        self.outputs[name] = output
+        return output
+
+
+ERRORS = [
+    {'_id': 'session_id', 'type': 'session', 'path': 'group/project/subject/session',
+     'url': 'https://hostname/#/projects/project_id/sessions/session_id?tab=data',
+     'resolved': False, 'error': "'label' is a required property"},
+    {'_id': 'acquisition_id', 'type': 'acquisition', 'path': 'group/project/subject/session/acquisition',
+     'url': 'https://hostname/#/projects/project_id/sessions/session_id?tab=data',
+     'resolved': True}
+]
+
+
+def test_create_json_output_file():
+    gear_context = MockGearContext()
+    filename = run.create_output_file('project', iter(ERRORS), 'json',
+                                      gear_context, 'now')
+
+    assert filename == 'project-now.json'
+    assert gear_context.outputs[filename].getvalue() == json.dumps(ERRORS)
+
+
+def test_create_empty_json_output_file():
+    gear_context = MockGearContext()
+    filename = run.create_output_file('project', iter([]), 'json',
+                                      gear_context, 'now')
+
+    assert gear_context.outputs[filename].getvalue() == '[]'
+
+
+def test_create_csv_output_file():
+    gear_context = MockGearContext()
+    filename = run.create_output_file('project', iter(ERRORS), 'csv',
+                                      gear_context, 'now', 'report.csv')
+
+    assert filename == 'report.csv'
+    rows = list(csv.DictReader(io.StringIO(gear_context.outputs[filename].getvalue())))
+    assert [row['_id'] for row in rows] == ['session_id', 'acquisition_id']
+    assert rows[0]['error'] == "'label' is a required property"
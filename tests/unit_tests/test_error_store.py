@@ -0,0 +1,81 @@
+import os
+import random
+
+import error_store
+import pytest
+import replay
+import run
+from test_replay import FIXTURE_DIR, replay_report
+
+
+def get_errors(count):
+    rng = random.Random(0)
+    return [
+        {'_id': str(index), 'path': 'group/project/sub-{:02d}'.format(rng.randrange(20)),
+         'type': rng.choice(['subject', 'session', 'acquisition']),
+         'resolved': False, 'error': 'error {}'.format(index)}
+        for index in range(count)
+    ]
+
+
+@pytest.mark.parametrize('buffer_size', [1, 7, 100, 10000])
+def test_sort_errors(buffer_size):
+    errors = get_errors(500)
+    expected = sorted(errors, key=lambda error: (error['path'], error['type']))
+
+    assert list(error_store.sort_errors(iter(errors), buffer_size=buffer_size)) == expected
+
+
+def test_store_spills_and_cleans_up():
+    store = error_store.SortedErrorStore(buffer_size=10)
+    store.extend(get_errors(35))
+    tmp_dir = store._tmp_dir.name
+
+    assert store.spilled_runs == 3
+    assert len(store._buffer) == 5
+    assert len(os.listdir(tmp_dir)) == 3
+    assert len(list(store)) == 35
+    assert not os.path.exists(tmp_dir)
+
+
+def test_store_closed_early():
+    with error_store.SortedErrorStore(buffer_size=2) as store:
+        store.extend(get_errors(5))
+        tmp_dir = store._tmp_dir.name
+        next(iter(store))
+    assert not os.path.exists(tmp_dir)
+
+
+def test_missing_keys_sort_first():
+    errors = [{'path': 'b', 'type': 'session'}, {'type': 'acquisition'},
+              {'path': 'a', 'type': None}]
+    assert list(error_store.sort_errors(errors, buffer_size=2)) == [
+        {'type': 'acquisition'}, {'path': 'a', 'type': None},
+        {'path': 'b', 'type': 'session'}
+    ]
+
+
+def test_get_report_rows_sorted():
+    errors = get_errors(50)
+    rows, fieldnames = run.get_report_rows(errors, {'sort_report': True,
+                                                    'sort_buffer_size': 8})
+    assert fieldnames == run.CSV_HEADERS
+    assert list(rows) == sorted(errors, key=error_store.get_report_sort_key)
+
+
+@pytest.mark.parametrize('config', [{}, {'locality': True}])
+def test_replay_sorted_report_streams_errors(tmp_path, monkeypatch, config):
+    report = replay_report(replay.ReplayAdapter(FIXTURE_DIR, latency=0),
+                           tmp_path / 'unsorted', **config)
+    # The batched report must not build the list of errors before sorting
+    monkeypatch.setattr(run, 'get_errors', None)
+    spills = []
+    spill = error_store.SortedErrorStore._spill
+    monkeypatch.setattr(error_store.SortedErrorStore, '_spill',
+                        lambda store: spills.append(len(store._buffer)) or spill(store))
+    sorted_report = replay_report(replay.ReplayAdapter(FIXTURE_DIR, latency=0),
+                                  tmp_path / 'sorted', sort_report=True,
+                                  sort_buffer_size=2, **config)
+
+    assert sorted_report == sorted(report, key=error_store.get_report_sort_key)
+    assert spills and max(spills) <= 2
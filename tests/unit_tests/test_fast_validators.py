@@ -0,0 +1,87 @@
+import json
+from pathlib import Path
+
+import jsonschema
+import pytest
+import fast_validators
+import run
+
+
+DATA_ROOT = Path(__file__).parents[1] / 'data'
+
+SCHEMAS = [
+    {},
+    {'type': 'string'},
+    {'type': 'integer'},
+    {'type': 'number'},
+    {'type': 'boolean'},
+    {'type': 'null'},
+    {'type': 'array'},
+    {'type': 'object'},
+    {'type': ['string', 'null']},
+    {'enum': ['CT', 'PT', 'MR'], 'type': 'string',
+     'description': "Modality must match 'MR' or 'CT' or 'PT'"},
+    {'enum': [0, 1, 'a']},
+    {'enum': [True, None]},
+    {'enum': [[1, 2], {'a': 1}]},
+    {'pattern': 'ses-[0-9]+', 'type': 'string'},
+    {'pattern': '^[A-Z]{2}$'},
+    {'required': ['label', 'info']},
+    {'required': ['AcquisitionDate'], 'type': 'object'},
+    {'minimum': 0, 'maximum': 10},
+    {'minimum': 0.5, 'type': 'number'},
+    {'exclusiveMinimum': 0, 'exclusiveMaximum': 10},
+    {'minLength': 2, 'maxLength': 4},
+    {'format': 'date', 'type': 'string'}
+]
+
+VALUES = [
+    None, True, False, 0, 1, 1.0, 0.0, 2, -1, 0.5, 10, 10.5, 11, 1e100,
+    '', 'a', 'MR', 'NM', 'ses-01', 'sub-01', 'AB', 'ABC', 'ABCDE', '1',
+    [], [1, 2], ['SCREEN SAVE'], {}, {'label': 'x'}, {'label': 'x', 'info': {}},
+    {'a': 1}, {'AcquisitionDate': '20200101'}
+]
+
+
+def jsonschema_messages(value, schema):
+    validator = jsonschema.Draft7Validator(schema)
+    return [error.message for error in sorted(validator.iter_errors(value), key=str)]
+
+
+@pytest.mark.parametrize('schema', SCHEMAS)
+def test_message_parity(schema):
+    check_schema = fast_validators.compile_simple_schema(schema)
+    assert check_schema is not None
+    for value in VALUES:
+        assert sorted(check_schema(value)) == jsonschema_messages(value, schema)
+
+
+@pytest.mark.parametrize('schema', [
+    {'anyOf': [{'required': ['AcquisitionDate']}, {'required': ['SeriesDate']}]},
+    {'properties': {'Modality': {'type': 'string'}}},
+    {'items': {'not': {'enum': ['SCREEN SAVE']}}, 'type': 'array'},
+    {'$ref': '#/definitions/label'},
+    {'type': 'string', 'required': True},
+    {'type': 'date'},
+    {'pattern': '('},
+    {'minimum': '1'},
+    True
+])
+def test_complex_schemas_fall_back(schema):
+    assert fast_validators.compile_simple_schema(schema) is None
+
+
+def test_get_schema_errors_parity_error_list():
+    with open(DATA_ROOT / 'test_error_list.json') as err_data:
+        error_list = json.load(err_data)
+    values = [
+        {'Modality': 'NM', 'ImageType': ['SCREEN SAVE'], 'Units': 'MLML'},
+        {'Modality': 'MR', 'ImageType': ['NORM'], 'StudyDate': 'defined'},
+        'NM', 'MR', 1, None
+    ]
+    for error in error_list:
+        for value in values:
+            assert (
+                run.get_schema_errors(value, error['schema']) ==
+                jsonschema_messages(value, error['schema'])
+            )
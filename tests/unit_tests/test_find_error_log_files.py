@@ -0,0 +1,140 @@
+import pytest
+import mock
+import run
+
+
+class MockParent(object):
+    def __init__(self, container_type):
+        self.container_type = container_type
+        self.id = '{}_id'.format(container_type)
+
+
+class MockSearchResult(object):
+    def __init__(self, parent_type, parent_id, name, session_id=None):
+        self.file = mock.MagicMock()
+        self.file.name = name
+        self.parent = mock.MagicMock(type=parent_type, id=parent_id)
+        self.session = mock.MagicMock(id=session_id)
+
+
+class MockClient(object):
+    def __init__(self, results, results_by_id=None):
+        self.results = results
+        self.results_by_id = results_by_id or {}
+        self.queries = []
+
+    def search(self, query, size=None):
+        self.queries.append(query)
+        container_id = query.structured_query.split(' = ')[-1]
+        return self.results_by_id.get(container_id, self.results)
+
+
+RESULTS = [
+    MockSearchResult('acquisition', 'acquisition_1', 'a.dcm.zip.error.log.json', 'session_1'),
+    MockSearchResult('session', 'session_1', 'session.error.log.json', 'session_1'),
+    MockSearchResult('acquisition', 'acquisition_1', 'b.dcm.zip.error.log.json', 'session_1'),
+    MockSearchResult('subject', 'subject_1', 'subject.error.log.json'),
+    MockSearchResult('acquisition', 'acquisition_2', 'a.dcm.zip.error.log.json.bak', 'session_2'),
+    MockSearchResult('project', 'project_id', 'project.error.log.json')
+]
+
+
+def test_find_all_for_project():
+    client = MockClient(RESULTS)
+    error_containers, error_log_files = run.find_error_log_files(
+        'all', MockParent('project'), client
+    )
+
+    assert len(client.queries) == 1
+    assert 'project._id = project_id' in client.queries[0].structured_query
+    assert error_containers == [
+        {'_id': 'subject_1', 'type': 'subject'},
+        {'_id': 'session_1', 'type': 'session'},
+        {'_id': 'acquisition_1', 'type': 'acquisition'}
+    ]
+    assert error_log_files == {
+        'acquisition_1': ['a.dcm.zip.error.log.json', 'b.dcm.zip.error.log.json'],
+        'session_1': ['session.error.log.json'],
+        'subject_1': ['subject.error.log.json']
+    }
+
+
+def test_find_acquisition_for_session():
+    client = MockClient(RESULTS)
+    error_containers, error_log_files = run.find_error_log_files(
+        'acquisition', MockParent('session'), client
+    )
+
+    assert error_containers == [{'_id': 'acquisition_1', 'type': 'acquisition'}]
+    assert list(error_log_files) == ['acquisition_1']
+
+
+def test_find_invalid_container_type():
+    with pytest.raises(ValueError):
+        run.find_error_log_files('session', MockParent('session'), MockClient([]))
+    with pytest.raises(ValueError):
+        run.find_error_log_files('subject', MockParent('subject'), MockClient([]))
+    with pytest.raises(ValueError):
+        run.find_error_log_files('file', MockParent('project'), MockClient([]))
+
+
+def test_find_shard():
+    results = [
+        MockSearchResult('acquisition', 'acquisition_{}'.format(index),
+                      'a.error.log.json', 'session_{}'.format(index // 2))
+        for index in range(20)
+    ]
+    found = []
+    for index in range(3):
+        error_containers, _ = run.find_error_log_files(
+            'acquisition', MockParent('project'), MockClient(results),
+            shard=run.Shard(index, 3, 'subject')
+        )
+        found += [error_container['_id'] for error_container in error_containers]
+
+    assert sorted(found) == sorted(result.parent.id for result in results)
+
+
+def test_discover_invalid_mode():
+    with pytest.raises(ValueError):
+        run.discover_error_containers('both', 'all', MockParent('project'),
+                                      MockClient([]))
+
+
+def test_get_search_parent_type():
+    # The sdk deserializes session and acquisition parents without their type
+    result = mock.MagicMock()
+    result.parent = mock.MagicMock(spec=['id'], id='acquisition_1')
+    result.acquisition.id = 'acquisition_1'
+    assert run.get_search_parent_type(result) == 'acquisition'
+
+    result = mock.MagicMock(acquisition=None)
+    result.parent = mock.MagicMock(spec=['id'], id='session_1')
+    result.session.id = 'session_1'
+    assert run.get_search_parent_type(result) == 'session'
+
+    assert run.get_search_parent_type(RESULTS[3]) == 'subject'
+
+
+def test_search_split_by_subject(monkeypatch):
+    monkeypatch.setattr(run, 'SEARCH_SIZE', 3)
+    subject_results = {
+        'subject_1': RESULTS[:4],
+        'subject_2': [MockSearchResult('acquisition', 'acquisition_3',
+                                       'c.dcm.zip.error.log.json', 'session_3')]
+    }
+    client = MockClient(RESULTS, subject_results)
+    parent = MockParent('project')
+    parent.subjects = mock.MagicMock()
+    parent.subjects.iter.return_value = [mock.MagicMock(id='subject_2')]
+
+    error_containers, _ = run.find_error_log_files('acquisition', parent, client)
+    assert error_containers == [{'_id': 'acquisition_3', 'type': 'acquisition'}]
+    assert 'subject._id = subject_2' in client.queries[1].structured_query
+
+    # A search that cannot be split further fails instead of truncating
+    parent.subjects.iter.return_value = [mock.MagicMock(id='subject_1')]
+    with pytest.raises(ValueError):
+        run.find_error_log_files('all', parent, client)
+    with pytest.raises(ValueError):
+        run.find_error_log_files('all', MockParent('subject'), MockClient(RESULTS))
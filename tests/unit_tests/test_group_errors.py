@@ -0,0 +1,48 @@
+import run
+
+
+def get_errors():
+    errors = []
+    for index in range(3):
+        errors.append({'_id': 'acq{}'.format(index), 'type': 'acquisition',
+                       'path': 'g/p/s/ses/acq{}'.format(index), 'url': 'url',
+                       'resolved': False, 'error': "'NM' is not one of ['MR']"})
+    errors.append({'_id': 'acq0', 'type': 'acquisition', 'path': 'g/p/s/ses/acq0',
+                   'url': 'url', 'resolved': False, 'error': "'NM' is not one of ['MR']"})
+    errors.append({'_id': 'ses0', 'type': 'session', 'path': 'g/p/s/ses',
+                   'url': 'url', 'resolved': False, 'error': "'NM' is not one of ['MR']"})
+    errors.append({'_id': 'acq1', 'type': 'acquisition', 'path': 'g/p/s/ses/acq1',
+                   'url': 'url', 'resolved': True})
+    return errors
+
+
+def test_group_errors_json():
+    groups = run.group_errors(iter(get_errors()), 'json')
+
+    assert groups == [
+        {'error': "'NM' is not one of ['MR']", 'type': 'acquisition',
+         'resolved': False, 'count': 4,
+         'container_ids': ['acq0', 'acq1', 'acq2'],
+         'paths': ['g/p/s/ses/acq0', 'g/p/s/ses/acq1', 'g/p/s/ses/acq2']},
+        {'error': "'NM' is not one of ['MR']", 'type': 'session',
+         'resolved': False, 'count': 1, 'container_ids': ['ses0'],
+         'paths': ['g/p/s/ses']},
+        {'error': None, 'type': 'acquisition', 'resolved': True, 'count': 1,
+         'container_ids': ['acq1'], 'paths': ['g/p/s/ses/acq1']}
+    ]
+
+
+def test_group_errors_csv():
+    groups = run.group_errors(get_errors(), 'csv')
+
+    assert groups[0]['container_ids'] == 'acq0;acq1;acq2'
+    assert groups[0]['paths'] == 'g/p/s/ses/acq0;g/p/s/ses/acq1;g/p/s/ses/acq2'
+    assert all(set(group) == set(run.GROUPED_HEADERS) for group in groups)
+
+
+def test_get_report_rows():
+    errors = get_errors()
+    assert run.get_report_rows(errors, {}) == (errors, run.CSV_HEADERS)
+    rows, fieldnames = run.get_report_rows(errors, {'grouped': True})
+    assert fieldnames == run.GROUPED_HEADERS
+    assert sum(row['count'] for row in rows) == len(errors)
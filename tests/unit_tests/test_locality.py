@@ -0,0 +1,135 @@
+import pytest
+import locality
+import replay
+from test_replay import FIXTURE_DIR, REQUEST_COUNT, replay_report
+
+
+ERROR_CONTAINERS = [
+    {'_id': 'sub1', 'type': 'subject'},
+    {'_id': 'sub2', 'type': 'subject'},
+    {'_id': 'ses1', 'type': 'session'},
+    {'_id': 'ses3', 'type': 'session'},
+    {'_id': 'acq2', 'type': 'acquisition'},
+    {'_id': 'acq1', 'type': 'acquisition'},
+    {'_id': 'acq3', 'type': 'acquisition'},
+    {'_id': 'acq4', 'type': 'acquisition'}
+]
+SUBTREES = {
+    'sub1': ('sub1', None),
+    'sub2': ('sub2', None),
+    'ses1': ('sub1', 'ses1'),
+    'ses3': ('sub2', 'ses3'),
+    'acq1': ('sub1', 'ses1'),
+    'acq2': ('sub2', 'ses2'),
+    'acq3': ('sub2', 'ses3'),
+    'acq4': ('sub1', 'ses1')
+}
+
+
+class MockContainer(object):
+    def __init__(self, _id, container_type, **parents):
+        self.id = _id
+        self.container_type = container_type
+        self.parents = parents
+
+
+class MockClient(object):
+    def __init__(self, containers):
+        self.containers = {container.id: container for container in containers}
+        self.gets = []
+
+    def get(self, _id):
+        self.gets.append(_id)
+        return self.containers[_id]
+
+    def get_config(self):
+        self.gets.append('config')
+        return 'config'
+
+
+def test_schedule_by_subtree():
+    scheduled = locality.schedule_by_subtree(ERROR_CONTAINERS, SUBTREES)
+
+    assert [error_container['_id'] for error_container in scheduled] == [
+        'sub1', 'ses1', 'acq1', 'acq4', 'sub2', 'ses3', 'acq3', 'acq2'
+    ]
+
+
+def test_schedule_without_subtrees():
+    scheduled = locality.schedule_by_subtree(ERROR_CONTAINERS, {})
+
+    assert scheduled == ERROR_CONTAINERS
+
+
+def test_restore_order():
+    errors = [
+        {'_id': 'acq1', 'error': 'a'}, {'_id': 'acq1', 'error': 'b'},
+        {'_id': 'sub1', 'error': 'c'}, {'_id': 'ses1', 'error': 'd'}
+    ]
+
+    assert locality.restore_order(errors, ERROR_CONTAINERS) == [
+        {'_id': 'sub1', 'error': 'c'}, {'_id': 'ses1', 'error': 'd'},
+        {'_id': 'acq1', 'error': 'a'}, {'_id': 'acq1', 'error': 'b'}
+    ]
+
+
+def test_get_subtree():
+    assert locality.get_subtree(MockContainer('sub1', 'subject', project='p1'),
+                                'subject') == ('sub1', None)
+    assert locality.get_subtree(MockContainer('acq1', 'acquisition',
+                                              subject='sub1', session='ses1'),
+                                'acquisition') == ('sub1', 'ses1')
+
+
+def test_subtree_cache():
+    client = MockClient([
+        MockContainer('neuro', 'group'),
+        MockContainer('p1', 'project', group='neuro'),
+        MockContainer('sub1', 'subject', group='neuro', project='p1'),
+        MockContainer('ses1', 'session', group='neuro', project='p1', subject='sub1'),
+        MockContainer('acq1', 'acquisition', group='neuro', project='p1',
+                      subject='sub1', session='ses1'),
+        MockContainer('ses2', 'session', group='neuro', project='p1', subject='sub1')
+    ])
+    cache = locality.SubtreeCache(client)
+
+    for _id in ['acq1', 'neuro', 'p1', 'sub1', 'ses1', 'acq1']:
+        assert cache.get(_id).id == _id
+    # The acquisition is kept when its parents are fetched
+    assert client.gets == ['acq1', 'neuro', 'p1', 'sub1', 'ses1']
+
+    # Leaving the session releases its acquisition
+    cache.get_container('ses2')
+    cache.get('acq1')
+    cache.get('p1')
+    assert client.gets[5:] == ['ses2', 'acq1']
+    assert (cache.hits, cache.misses) == (2, 7)
+
+    assert cache.get_config() == cache.get_config() == 'config'
+    assert client.gets.count('config') == 1
+
+
+@pytest.mark.parametrize('config', [
+    {},
+    {'discovery': 'files'},
+    {'validation_workers': 1},
+    {'container_type': 'acquisition'}
+])
+def test_replay_locality_report(tmp_path, config):
+    report = replay_report(replay.ReplayAdapter(FIXTURE_DIR, latency=0),
+                           tmp_path / 'default', **config)
+    adapter = replay.ReplayAdapter(FIXTURE_DIR, latency=0)
+    locality_report = replay_report(adapter, tmp_path / 'locality',
+                                    locality=True, **config)
+
+    assert locality_report == report
+    assert adapter.counts['GET /api/containers/neuro'] == 1
+    assert adapter.counts['GET /api/config'] == 1
+    assert adapter.counts['GET /api/containers/acq1'] == 1
+
+
+def test_replay_locality_request_count(tmp_path):
+    adapter = replay.ReplayAdapter(FIXTURE_DIR, latency=0)
+    replay_report(adapter, tmp_path, locality=True)
+
+    assert adapter.request_count == REQUEST_COUNT - 20
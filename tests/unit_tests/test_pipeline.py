@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+import pipeline
+import tracing
+
+
+def test_run_pipeline_order():
+    stages = [
+        ('double', lambda item: [item * 2]),
+        ('split', lambda item: [item, item + 1])
+    ]
+    results = list(pipeline.run_pipeline(('source', range(5)), stages,
+                                         queue_size=2))
+    assert results == [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+
+
+def test_run_pipeline_drops_items():
+    stages = [('filter', lambda item: [item] if item % 2 else [])]
+    results = list(pipeline.run_pipeline(('source', range(6)), stages))
+    assert results == [1, 3, 5]
+
+
+def test_run_pipeline_stage_exception():
+    def stage(item):
+        if item == 3:
+            raise ValueError('bad item')
+        return [item]
+
+    with pytest.raises(ValueError):
+        list(pipeline.run_pipeline(('source', range(10)), [('stage', stage)],
+                                   queue_size=1))
+
+
+def test_run_pipeline_source_exception():
+    def source():
+        yield 1
+        raise KeyError('missing')
+
+    with pytest.raises(KeyError):
+        list(pipeline.run_pipeline(('source', source()),
+                                   [('stage', lambda item: [item])]))
+
+
+def test_run_pipeline_first_result_before_source_done():
+    source_done = threading.Event()
+
+    def source():
+        for item in range(3):
+            yield item
+            time.sleep(0.05)
+        source_done.set()
+
+    results = pipeline.run_pipeline(('source', source()),
+                                    [('stage', lambda item: [item])])
+    assert next(results) == 0
+    assert not source_done.is_set()
+    results.close()
+
+
+def test_run_pipeline_bounded_queue():
+    produced = []
+
+    def source():
+        for item in range(100):
+            produced.append(item)
+            yield item
+
+    results = pipeline.run_pipeline(('source', source()),
+                                    [('stage', lambda item: [item])],
+                                    queue_size=2)
+    assert next(results) == 0
+    time.sleep(0.2)
+    # Two queues of two items, plus one item held by each thread
+    assert len(produced) <= 8
+    results.close()
+
+
+def test_run_pipeline_traces_stages():
+    tracer = tracing.Tracer(enabled=True)
+    list(pipeline.run_pipeline(('source', range(3)),
+                               [('stage', lambda item: [item])],
+                               tracer=tracer))
+    assert set(event['name'] for event in tracer.events) == {'source', 'stage'}
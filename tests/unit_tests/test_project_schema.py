@@ -0,0 +1,140 @@
+import json
+
+import jsonschema
+import pytest
+import project_schema
+import replay
+import run
+from test_replay import FIXTURE_DIR, replay_report
+
+
+SCHEMA = {
+    'type': 'object',
+    'definitions': {
+        'modality': {'type': 'string', 'enum': ['CT', 'PT', 'MR', 'NM']}
+    },
+    'properties': {
+        'info': {
+            'type': 'object',
+            'properties': {
+                'cohort': {'type': 'string', 'enum': ['patient', 'healthy', 'control']},
+                'header': {
+                    'properties': {
+                        'dicom': {
+                            'properties': {
+                                'Modality': {'$ref': '#/definitions/modality'},
+                                'EchoTimes': {'type': 'array', 'items': {'type': 'number'}}
+                            }
+                        }
+                    }
+                },
+                'Pair': {'type': 'array', 'items': [{'type': 'string'}, {'type': 'integer'}]}
+            },
+            'patternProperties': {'^Q_': {'type': 'integer'}},
+            'additionalProperties': {'type': 'string'}
+        }
+    }
+}
+
+
+def test_get_subschema():
+    schema = project_schema.ProjectSchema(SCHEMA)
+
+    assert schema.get_subschema('info.cohort') == {
+        'type': 'string', 'enum': ['patient', 'healthy', 'control']
+    }
+    assert schema.get_subschema('info.header.dicom.Modality') == SCHEMA['definitions']['modality']
+    assert schema.get_subschema('info.header.dicom.EchoTimes.3') == {'type': 'number'}
+    assert schema.get_subschema('info.Pair.1') == {'type': 'integer'}
+    assert schema.get_subschema('info.Pair.2') is None
+    assert schema.get_subschema('info.Q_1') == {'type': 'integer'}
+    assert schema.get_subschema('info.Notes') == {'type': 'string'}
+    assert schema.get_subschema('modality') is None
+    assert schema.get_subschema(None) is None
+
+
+def test_get_subschema_references():
+    schema = project_schema.ProjectSchema(SCHEMA)
+
+    # References of the subschema resolve against the project schema
+    validator = schema.get_validator('info.header.dicom')
+    assert validator.is_valid({'Modality': 'NM'})
+    assert not validator.is_valid({'Modality': 'XA'})
+    assert schema.get_validator('info.header.dicom') is validator
+    assert schema.get_validator('info.cohort') is None
+    assert schema.get_validator('modality') is None
+
+    circular = project_schema.ProjectSchema({
+        'definitions': {'a': {'$ref': '#/definitions/b'}, 'b': {'$ref': '#/definitions/a'}},
+        'properties': {'info': {'$ref': '#/definitions/a'},
+                       'remote': {'$ref': 'https://example.com/schema.json'}}
+    })
+    assert circular.get_subschema('info') is None
+    assert circular.get_subschema('remote') is None
+
+
+def test_validate_with_project_schema_references():
+    schema = project_schema.ProjectSchema({
+        'properties': {
+            'shared': {'type': 'string', 'maxLength': 3},
+            'info': {'properties': {'site': {'$ref': '#/properties/shared'}}},
+            'tags': {}
+        }
+    })
+    file_dict = {'info': {'site': 'Boston'}, 'tags': 5}
+    error = {'item': 'info', 'revalidate': True, 'schema': {'type': 'object'}}
+
+    assert run.validate(file_dict, error, schema) == ["'Boston' is too long"]
+    assert run.validate({'info': {'site': 'BOS'}}, error, schema) == []
+    # An empty subschema allows anything, the stale error schema is not used
+    assert run.validate(file_dict, {'item': 'tags', 'revalidate': True,
+                                    'schema': {'type': 'string'}}, schema) == []
+
+
+def test_invalid_project_schema():
+    with pytest.raises(jsonschema.SchemaError):
+        project_schema.ProjectSchema({'type': 'not a type'})
+
+
+def test_validate_with_project_schema():
+    schema = project_schema.ProjectSchema(SCHEMA)
+    file_dict = {'info': {'cohort': 'control'}, 'size': 90}
+    stale_error = {
+        'item': 'info.cohort', 'revalidate': True,
+        'schema': {'type': 'string', 'enum': ['patient', 'healthy']}
+    }
+
+    assert run.validate(file_dict, stale_error) == [
+        "'control' is not one of ['patient', 'healthy']"
+    ]
+    assert run.validate(file_dict, stale_error, schema) == []
+    # Items the project schema does not describe use the error schema
+    assert run.validate(file_dict, {
+        'item': 'size', 'revalidate': True, 'schema': {'maximum': 45}
+    }, schema) == ['90 is greater than the maximum of 45']
+    # Errors without a schema can be revalidated with the project schema
+    assert run.validate(file_dict, {'item': 'info.cohort', 'revalidate': True},
+                        schema) == []
+    assert run.validate(file_dict, {'item': 'info.cohort', 'revalidate': False,
+                                    'error_message': 'Skipped'}, schema) == ['Skipped']
+
+
+@pytest.mark.parametrize('config', [
+    {},
+    {'pipeline': True},
+    {'validation_workers': 1}
+])
+def test_replay_report_with_project_schema(tmp_path, config):
+    schema_path = str(tmp_path / 'schema.json')
+    with open(schema_path, 'w') as schema_file:
+        json.dump(SCHEMA, schema_file)
+    adapter = replay.ReplayAdapter(FIXTURE_DIR, latency=0)
+    report = replay_report(adapter, tmp_path / 'report', schema_path=schema_path,
+                           **config)
+
+    # The cohort and modality errors are resolved by the project schema, the
+    # image type is not in it and is revalidated against its error schema
+    assert [(error['_id'], error['resolved']) for error in report] == [
+        ('sub1', True), ('ses1', True), ('acq1', True), ('acq1', True),
+        ('acq3', False), ('acq3', False), ('acq4', True)
+    ]
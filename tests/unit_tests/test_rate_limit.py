@@ -0,0 +1,159 @@
+import threading
+
+import flywheel
+import pytest
+import rate_limit
+
+
+class MockClient(object):
+    def __init__(self, failures, sessions=None):
+        self.failures = list(failures)
+        self.calls = 0
+        self.session_ids = sessions or []
+        self.sessions = flywheel.finder.Finder(self, 'get_all_sessions')
+
+    def get(self, _id):
+        self.calls += 1
+        if self.failures:
+            raise flywheel.ApiException(status=self.failures.pop(0))
+        return flywheel.Session(id=_id, label='session_label')
+
+    def get_all_sessions(self, filter=None, limit=None, after_id=None):
+        self.calls += 1
+        if self.failures:
+            raise flywheel.ApiException(status=self.failures.pop(0))
+        start = self.session_ids.index(after_id) + 1 if after_id else 0
+        return [flywheel.Session(id=_id) for _id in
+                self.session_ids[start:start + (limit or len(self.session_ids))]]
+
+    def download_file_from_session_as_data(self, session_id, filename):
+        self.calls += 1
+        return b'[]'
+
+    def delete_session_file(self, session_id, filename):
+        self.calls += 1
+        if self.failures:
+            raise flywheel.ApiException(status=self.failures.pop(0))
+
+
+def get_client(failures, max_retries=3, sessions=None):
+    client = MockClient(failures, sessions)
+    return client, rate_limit.RateLimitedClient(client, max_retries=max_retries,
+                                                base_delay=0)
+
+
+def test_retry_then_succeed():
+    client, rate_limited_client = get_client([429, 503])
+    session = rate_limited_client.get('session_id')
+
+    assert session.label == 'session_label'
+    assert client.calls == 3
+    assert rate_limited_client.retry_count == 2
+
+
+def test_retry_exhausted():
+    client, rate_limited_client = get_client([429] * 4, max_retries=3)
+    with pytest.raises(flywheel.ApiException):
+        rate_limited_client.get('session_id')
+    assert client.calls == 4
+
+
+def test_no_retry_for_other_status():
+    client, rate_limited_client = get_client([409])
+    with pytest.raises(flywheel.ApiException) as exc_info:
+        rate_limited_client.get('session_id')
+    assert exc_info.value.status == 409
+    assert client.calls == 1
+
+
+def test_non_idempotent_calls_retried_only_when_rejected():
+    client, rate_limited_client = get_client([])
+    session = rate_limited_client.get('session_id')
+    client.failures = [429, 503]
+    session.delete_file('session.error.log.json')
+    assert client.calls == 4
+
+    # The file may have been deleted before the gateway timed out
+    client.failures = [504]
+    with pytest.raises(flywheel.ApiException):
+        session.delete_file('session.error.log.json')
+    assert client.calls == 5
+
+
+def test_retry_after_header():
+    exception = flywheel.ApiException(status=429)
+    exception.headers = {'Retry-After': '2'}
+    assert rate_limit.get_retry_after(exception) == 2.0
+    assert rate_limit.get_retry_after(flywheel.ApiException(status=429)) is None
+
+
+def test_returned_objects_are_wrapped():
+    _, rate_limited_client = get_client([])
+    session = rate_limited_client.get('session_id')
+    calls = rate_limited_client.call_count
+
+    # Local methods are not api calls
+    assert session.to_dict()['label'] == 'session_label'
+    assert rate_limited_client.call_count == calls
+    assert session.read_file('session.error.log.json') == b'[]'
+    assert rate_limited_client.call_count == calls + 1
+    assert rate_limited_client.wrap(['a', 1]) == ['a', 1]
+
+
+def test_limiter_aimd():
+    limiter = rate_limit.AdaptiveLimiter(initial=4, minimum=1, maximum=5)
+    limiter.on_pushback()
+    assert limiter.limit == 2
+    limiter.on_pushback()
+    limiter.on_pushback()
+    assert limiter.limit == 1
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.limit == 5
+
+
+def test_limiter_initial_limit_in_bounds():
+    assert rate_limit.AdaptiveLimiter(initial=32, maximum=16).limit == 16
+    assert rate_limit.AdaptiveLimiter(initial=0, minimum=1).limit == 1
+
+
+def test_limiter_bounds_concurrency():
+    limiter = rate_limit.AdaptiveLimiter(initial=2, maximum=2)
+    in_flight = []
+    lock = threading.Lock()
+    release = threading.Event()
+
+    def call():
+        limiter.acquire()
+        with lock:
+            in_flight.append(limiter.in_flight)
+        release.wait()
+        limiter.release()
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert max(in_flight) <= 2
+    assert limiter.in_flight == 0
+
+
+def test_finders_are_wrapped():
+    client, rate_limited_client = get_client([], sessions=['ses1', 'ses2'])
+
+    sessions = rate_limited_client.sessions.find('tags=error')
+    assert [session.id for session in sessions] == ['ses1', 'ses2']
+    assert rate_limited_client.call_count == 1
+
+
+def test_finder_pages_are_retried():
+    client, rate_limited_client = get_client([429], sessions=['ses1', 'ses2', 'ses3'])
+
+    sessions = rate_limited_client.sessions.iter(limit=2)
+    assert [session.id for session in sessions] == ['ses1', 'ses2', 'ses3']
+    # Three pages, the last one empty, and the retry of the first one
+    assert rate_limited_client.call_count == client.calls == 4
+    assert rate_limited_client.retry_count == 1
@@ -0,0 +1,213 @@
+import json
+import os
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+import flywheel
+import pytest
+import requests
+import replay
+import run
+import time_budget
+
+
+FIXTURE_DIR = str(Path(__file__).parents[1] / 'data' / 'replay' / 'project')
+# Requests of a report on all the containers of the fixture project
+REQUEST_COUNT = 47
+
+
+def get_gear_context(client, output_dir, checkpoint_path=None, schema_path=None,
+                     **config):
+    gear_context = mock.MagicMock()
+    gear_context.client = client
+    gear_context.config = dict({'container_type': 'all', 'file_type': 'json'},
+                               **config)
+    gear_context.get_input_path.side_effect = {
+        'checkpoint': checkpoint_path,
+        'schema': schema_path
+    }.get
+    gear_context.destination = {'id': 'an1'}
+    gear_context.open_output.side_effect = (
+        lambda name, mode='w': open(os.path.join(output_dir, name), mode)
+    )
+    return gear_context
+
+
+def replay_report(adapter, output_dir, checkpoint_path=None, schema_path=None,
+                  **config):
+    client = flywheel.Client('example.flywheel.io:key')
+    replay.install(client, adapter)
+    os.makedirs(output_dir, exist_ok=True)
+    run.generate_report(get_gear_context(client, output_dir, checkpoint_path,
+                                         schema_path, **config))
+    report_filename, = [filename for filename in os.listdir(output_dir)
+                        if not filename.startswith(('checkpoint-', 'progress-'))]
+    with open(os.path.join(output_dir, report_filename)) as report_file:
+        return json.load(report_file)
+
+
+def test_replay_generate_report(tmp_path):
+    adapter = replay.ReplayAdapter(FIXTURE_DIR, latency_scale=0)
+    report = replay_report(adapter, tmp_path)
+
+    assert [(error['_id'], error['resolved']) for error in report] == [
+        ('sub1', False), ('ses1', True), ('acq1', False), ('acq1', True),
+        ('acq3', False), ('acq3', False), ('acq4', True)
+    ]
+    assert report[0]['path'] == 'neuro/Neuro Study/sub-01'
+    assert adapter.request_count == REQUEST_COUNT
+    assert adapter.counts['GET /api/containers/neuro'] == 5
+    assert adapter.counts['DELETE /api/acquisitions/acq4/tags/error'] == 1
+    assert adapter.counts['PUT /api/projects/p1/analyses/an1'] == 1
+
+
+def test_replay_pipelined_report(tmp_path):
+    batched = replay_report(replay.ReplayAdapter(FIXTURE_DIR, latency_scale=0),
+                            tmp_path / 'batched')
+    adapter = replay.ReplayAdapter(FIXTURE_DIR, latency_scale=0)
+    pipelined = replay_report(adapter, tmp_path / 'pipelined', pipeline=True,
+                              queue_size=1)
+
+    assert pipelined == batched
+    assert adapter.request_count == REQUEST_COUNT
+
+
+def test_record_round_trip(tmp_path):
+    upstream = replay.ReplayAdapter(FIXTURE_DIR, latency_scale=0)
+    recorder = replay.RecordingAdapter(str(tmp_path / 'recording'),
+                                       adapter=upstream)
+    recorded = replay_report(recorder, tmp_path / 'recorded')
+    recorder.close()
+
+    assert recorder.request_count == REQUEST_COUNT
+    adapter = replay.ReplayAdapter(str(tmp_path / 'recording'), latency=0)
+    replayed = replay_report(adapter, tmp_path / 'replayed')
+
+    assert replayed == recorded
+    assert adapter.counts == upstream.counts
+    # Response bodies are stored once
+    assert (len(os.listdir(tmp_path / 'recording' / replay.BODIES_DIRNAME)) <=
+            len(os.listdir(Path(FIXTURE_DIR) / replay.BODIES_DIRNAME)))
+    with open(tmp_path / 'recording' / replay.EXCHANGES_FILENAME) as exchanges_file:
+        assert all('Authorization' not in line for line in exchanges_file)
+
+
+def test_replay_latency(monkeypatch):
+    delays = []
+    monkeypatch.setattr(replay.time, 'sleep', delays.append)
+    session = requests.Session()
+    session.mount('https://', replay.ReplayAdapter(FIXTURE_DIR, latency_scale=2))
+    session.get('https://example.flywheel.io/api/containers/p1')
+    session.mount('https://', replay.ReplayAdapter(FIXTURE_DIR, latency=0.5))
+    session.get('https://example.flywheel.io/api/containers/p1')
+
+    assert delays == [pytest.approx(0.06), 0.5]
+
+
+def test_replay_repeats_last_response():
+    adapter = replay.ReplayAdapter(FIXTURE_DIR, latency=0)
+    client = flywheel.Client('example.flywheel.io:key')
+    replay.install(client, adapter)
+
+    assert client.get('acq1').label == client.get('acq1').label == 'T1w'
+    assert adapter.counts['GET /api/containers/acq1'] == 2
+
+
+def test_replay_missing_request():
+    adapter = replay.ReplayAdapter(FIXTURE_DIR, latency=0)
+    client = flywheel.Client('example.flywheel.io:key')
+    replay.install(client, adapter)
+
+    with pytest.raises(ValueError, match='GET /api/containers/missing'):
+        client.get('missing')
+
+
+def test_get_request_key():
+    assert replay.get_request_key(
+        'get', 'https://example.flywheel.io:443/api/sessions?b=2&a=tags%3Derror'
+    ) == 'GET /api/sessions?a=tags%3Derror&b=2'
+    assert replay.get_request_key('GET', '/api/sessions?a=tags=error') == \
+        'GET /api/sessions?a=tags%3Derror'
+
+
+def test_get_session():
+    client = flywheel.Client('example.flywheel.io:key')
+    assert replay.get_session(client) is None
+    replay.install(client, replay.ReplayAdapter(FIXTURE_DIR, latency=0))
+    session = replay.get_session(client)
+    assert session.put('https://example.flywheel.io/api/projects/p1/analyses/an1').json() == {'modified': 1}
+
+
+def test_write_recording(tmp_path):
+    gear_context = get_gear_context(None, str(tmp_path))
+    filename = replay.write_recording(FIXTURE_DIR, gear_context, 'now')
+
+    assert filename == 'api-recording-now.zip'
+    with zipfile.ZipFile(tmp_path / filename) as archive:
+        names = archive.namelist()
+    assert replay.EXCHANGES_FILENAME in names
+    assert len(names) == 1 + len(os.listdir(Path(FIXTURE_DIR) / replay.BODIES_DIRNAME))
+
+
+def test_replay_count_only(tmp_path):
+    adapter = replay.ReplayAdapter(FIXTURE_DIR, latency_scale=0)
+    counts = replay_report(adapter, tmp_path, count_only=True)
+
+    assert counts == [
+        {'type': 'subject', 'containers': 1, 'error_logs': 1, 'errors': 1},
+        {'type': 'session', 'containers': 1, 'error_logs': 1, 'errors': 1},
+        {'type': 'acquisition', 'containers': 3, 'error_logs': 2, 'errors': 4},
+        {'type': 'all', 'containers': 5, 'error_logs': 4, 'errors': 6}
+    ]
+    # No resolver paths, no validation and no container changes
+    assert adapter.request_count == 19
+    assert 'GET /api/containers/neuro' not in adapter.counts
+    assert 'DELETE /api/acquisitions/acq4/tags/error' not in adapter.counts
+
+
+@pytest.mark.parametrize('config', [{}, {'pipeline': True, 'queue_size': 1}])
+def test_replay_time_budget_resume(tmp_path, monkeypatch, config):
+    full = replay_report(replay.ReplayAdapter(FIXTURE_DIR, latency_scale=0),
+                         tmp_path / 'full', **config)
+
+    # The deadline passes when the fourth container is scheduled
+    ticks = iter(range(100))
+    monkeypatch.setattr(time_budget, 'get_time_budget', lambda config: (
+        time_budget.TimeBudget(4, margin=0, clock=lambda: next(ticks))
+    ))
+    first = replay_report(replay.ReplayAdapter(FIXTURE_DIR, latency_scale=0),
+                          tmp_path / 'first', time_budget_minutes=1, **config)
+    checkpoint_path, = (tmp_path / 'first').glob('checkpoint-*.json')
+    with open(checkpoint_path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    if config.get('pipeline'):
+        # The discovery is stopped, the next run discovers the containers again
+        assert checkpoint['containers'] == [{'_id': 'acq3', 'type': 'acquisition'}]
+        assert checkpoint['processed'] == ['acq1', 'ses1', 'sub1']
+    else:
+        assert checkpoint['containers'] == [{'_id': 'acq3', 'type': 'acquisition'},
+                                            {'_id': 'acq4', 'type': 'acquisition'}]
+
+    monkeypatch.setattr(time_budget, 'get_time_budget', lambda config: None)
+    second = replay_report(replay.ReplayAdapter(FIXTURE_DIR, latency_scale=0),
+                           tmp_path / 'second', checkpoint_path=str(checkpoint_path),
+                           **config)
+    assert first + second == full
+    assert not list((tmp_path / 'second').glob('checkpoint-*.json'))
+
+
+def test_replay_grouped_report(tmp_path):
+    full = replay_report(replay.ReplayAdapter(FIXTURE_DIR, latency_scale=0),
+                         tmp_path / 'full')
+    grouped = replay_report(replay.ReplayAdapter(FIXTURE_DIR, latency_scale=0),
+                            tmp_path / 'grouped', grouped=True)
+
+    assert len(grouped) == 6
+    assert sum(group['count'] for group in grouped) == len(full)
+    assert grouped[3] == {
+        'error': None, 'type': 'acquisition', 'resolved': True, 'count': 2,
+        'container_ids': ['acq1', 'acq4'],
+        'paths': ['neuro/Neuro Study/sub-01/ses-01/T1w',
+                  'neuro/Neuro Study/sub-03/ses-03/DWI']
+    }
@@ -0,0 +1,149 @@
+import datetime
+import json
+
+import pytest
+import run
+
+
+class MockContainer(object):
+    def __init__(self, _id, subject, session=None):
+        self.id = _id
+        self.label = '{}_label'.format(_id)
+        self.parents = {'subject': subject, 'session': session}
+
+
+class MockFinder(object):
+    def __init__(self, containers):
+        self.containers = containers
+
+    def find(self, filter=None):
+        return iter(self.containers)
+
+
+class MockFile(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class MockAnalysis(object):
+    def __init__(self, _id, created, filenames):
+        self.id = _id
+        self.created = datetime.datetime(2020, 1, created)
+        self.files = [MockFile(filename) for filename in filenames]
+
+
+class MockClient(object):
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    def download_output_from_analysis_as_data(self, analysis_id, filename):
+        return self.outputs[(analysis_id, filename)]
+
+
+def test_get_shard_disabled():
+    assert run.get_shard({}) is None
+    assert run.get_shard({'shard_count': 1, 'shard_index': 0}) is None
+
+
+def test_get_shard():
+    shard = run.get_shard({'shard_count': 4, 'shard_index': 3})
+    assert shard == run.Shard(3, 4, 'subject')
+
+
+def test_get_shard_invalid():
+    with pytest.raises(ValueError):
+        run.get_shard({'shard_count': 4, 'shard_index': 4})
+    with pytest.raises(ValueError):
+        run.get_shard({'shard_count': 4, 'shard_index': 0, 'shard_by': 'acquisition'})
+
+
+def test_in_shard_partitions_subjects():
+    sessions = [
+        MockContainer('session_{}'.format(index), 'subject_{}'.format(index // 2))
+        for index in range(40)
+    ]
+    shards = [run.Shard(index, 3, 'subject') for index in range(3)]
+    for session in sessions:
+        in_shards = [run.in_shard(session, 'session', shard) for shard in shards]
+        assert in_shards.count(True) == 1
+
+    # Sessions of the same subject are in the same shard
+    for first, second in zip(sessions[::2], sessions[1::2]):
+        assert (
+            [run.in_shard(first, 'session', shard) for shard in shards] ==
+            [run.in_shard(second, 'session', shard) for shard in shards]
+        )
+
+
+def test_in_shard_by_session():
+    acquisition = MockContainer('acquisition', 'subject', 'session')
+    session = MockContainer('session', 'subject')
+    for index in range(5):
+        shard = run.Shard(index, 5, 'session')
+        assert (
+            run.in_shard(acquisition, 'acquisition', shard) ==
+            run.in_shard(session, 'session', shard)
+        )
+
+
+def test_collect_containers_shard():
+    sessions = [
+        MockContainer('session_{}'.format(index), 'subject_{}'.format(index))
+        for index in range(20)
+    ]
+    collected = []
+    for index in range(2):
+        shard = run.Shard(index, 2, 'subject')
+        collected += list(run.collect_containers(MockFinder(sessions), 'session',
+                                                 shard=shard))
+
+    assert sorted(container['_id'] for container in collected) == sorted(
+        session.id for session in sessions
+    )
+
+
+def test_get_shard_filename():
+    shard = run.Shard(1, 4, 'subject')
+    assert run.get_shard_filename('project-now.csv', shard) == 'project-now.shard-1-of-4.csv'
+
+
+def test_find_shard_reports():
+    analyses = [
+        MockAnalysis('new_0', 3, ['project-3.shard-0-of-2.csv']),
+        MockAnalysis('old_0', 1, ['project-1.shard-0-of-2.csv']),
+        MockAnalysis('old_1', 2, ['project-2.shard-1-of-2.csv']),
+        MockAnalysis('other', 4, ['project-4.shard-1-of-3.csv', 'project-4.csv']),
+        MockAnalysis('merge', 5, [])
+    ]
+    shard_reports = run.find_shard_reports(analyses, 2, 'csv', exclude_id='merge')
+    assert shard_reports == [
+        ('new_0', 'project-3.shard-0-of-2.csv'),
+        ('old_1', 'project-2.shard-1-of-2.csv')
+    ]
+
+
+def test_find_shard_reports_missing():
+    analyses = [MockAnalysis('shard_0', 1, ['project-1.shard-0-of-2.json'])]
+    with pytest.raises(ValueError):
+        run.find_shard_reports(analyses, 2, 'json')
+
+
+def test_read_shard_reports():
+    client = MockClient({
+        ('shard_0', 'report.shard-0-of-2.json'): json.dumps([{'_id': 'a'}]).encode(),
+        ('shard_1', 'report.shard-1-of-2.json'): json.dumps([{'_id': 'b'}, {'_id': 'c'}]).encode()
+    })
+    errors = run.read_shard_reports(client, [
+        ('shard_0', 'report.shard-0-of-2.json'),
+        ('shard_1', 'report.shard-1-of-2.json')
+    ], 'json')
+    assert [error['_id'] for error in errors] == ['a', 'b', 'c']
+
+
+def test_read_shard_reports_csv():
+    client = MockClient({
+        ('shard_0', 'report.shard-0-of-1.csv'): b'path,url,error,resolved,_id,type\r\np,u,e,False,a,session\r\n'
+    })
+    errors = list(run.read_shard_reports(client, [('shard_0', 'report.shard-0-of-1.csv')], 'csv'))
+    assert errors == [{'path': 'p', 'url': 'u', 'error': 'e', 'resolved': 'False',
+                       '_id': 'a', 'type': 'session'}]
@@ -0,0 +1,144 @@
+import json
+import os
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+import flywheel
+import pytest
+import replay
+import run
+import snapshot
+import sqlite_report
+
+
+FIXTURE_DIR = str(Path(__file__).parents[1] / 'data' / 'replay' / 'project')
+
+
+def get_client():
+    client = flywheel.Client('example.flywheel.io:key')
+    replay.install(client, replay.ReplayAdapter(FIXTURE_DIR, latency=0))
+    return client
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path):
+    client = get_client()
+    gear_context = mock.MagicMock()
+    gear_context.open_output.side_effect = (
+        lambda name, mode='w': open(tmp_path / name, mode)
+    )
+    filename = snapshot.write_snapshot(client, client.get('p1'), gear_context, 'now')
+    with zipfile.ZipFile(tmp_path / filename) as archive:
+        archive.extractall(tmp_path / 'snapshot')
+    return str(tmp_path / 'snapshot')
+
+
+def get_live_report(tmp_path, config):
+    gear_context = mock.MagicMock()
+    gear_context.client = get_client()
+    # Only the report is written to live.json
+    gear_context.config = dict(config, progress_interval_seconds=0)
+    gear_context.destination = {'id': 'an1'}
+    gear_context.get_input_path.return_value = None
+    gear_context.open_output.side_effect = (
+        lambda name, mode='w': open(tmp_path / 'live.json', mode)
+    )
+    run.generate_report(gear_context)
+    with open(tmp_path / 'live.json') as report_file:
+        return json.load(report_file)
+
+
+def test_export_snapshot(snapshot_dir):
+    with open(os.path.join(snapshot_dir, snapshot.SNAPSHOT_FILENAME)) as snapshot_file:
+        exported = json.load(snapshot_file)
+
+    assert exported['parent'] == 'p1'
+    assert exported['api_url'] == 'https://example.flywheel.io:443/api'
+    assert exported['containers'] == [
+        'neuro', 'p1', 'sub1', 'sub2', 'sub3', 'ses1', 'ses2', 'ses3',
+        'acq1', 'acq2', 'acq3', 'acq4'
+    ]
+    assert sorted(os.listdir(os.path.join(snapshot_dir, snapshot.FILES_DIRNAME))) == [
+        'acq1', 'acq3', 'ses1', 'sub1'
+    ]
+
+
+def test_export_snapshot_fetches_listed_containers(tmp_path):
+    # The listed acquisition has no file metadata, the fetched one has
+    listed = mock.MagicMock(id='acq1', files=None, tags=['error'])
+    fetched = mock.MagicMock(id='acq1', tags=['error'])
+    fetched.files = [mock.MagicMock()]
+    fetched.files[0].name = 't1.dcm.zip.error.log.json'
+    fetched.read_file.return_value = b'[]'
+    fetched.to_dict.return_value = {'id': 'acq1'}
+    parent = mock.MagicMock(id='ses1', container_type='session', parents={},
+                            files=None, tags=[])
+    parent.acquisitions.find.return_value = [listed]
+    parent.to_dict.return_value = {'id': 'ses1'}
+    client = mock.MagicMock()
+    client.get.return_value = fetched
+    client.get_config.return_value.site.api_url = 'https://example.flywheel.io/api'
+
+    with zipfile.ZipFile(tmp_path / 'snapshot.zip', 'w') as archive:
+        assert snapshot.export_snapshot(client, parent, archive) == 2
+    with zipfile.ZipFile(tmp_path / 'snapshot.zip') as archive:
+        assert archive.read('files/acq1/t1.dcm.zip.error.log.json') == b'[]'
+
+
+@pytest.mark.parametrize('container_type', ['all', 'session', 'acquisition'])
+def test_snapshot_report_matches_live(tmp_path, snapshot_dir, container_type):
+    live = get_live_report(tmp_path, {'container_type': container_type,
+                                      'file_type': 'json'})
+    filename, error_count = snapshot.run_snapshot_report(
+        snapshot_dir, str(tmp_path), container_type=container_type,
+        file_type='json', filename='offline.json'
+    )
+
+    with open(tmp_path / filename) as report_file:
+        assert json.load(report_file) == live
+    assert error_count == len(live)
+
+
+def test_snapshot_report_cli(tmp_path, snapshot_dir, monkeypatch):
+    live = get_live_report(tmp_path, {'container_type': 'all', 'file_type': 'json',
+                                      'sort_report': True})
+    monkeypatch.setattr('sys.argv', [
+        'snapshot.py', snapshot_dir, '--output-dir', str(tmp_path),
+        '--file-type', 'sqlite', '--filename', 'offline.sqlite', '--sort-report'
+    ])
+    snapshot.main()
+
+    with open(tmp_path / 'offline.sqlite', 'rb') as report_file:
+        rows = list(sqlite_report.read_sqlite_report(report_file.read()))
+    assert [(row['_id'], row['path']) for row in rows] == [
+        (error['_id'], error['path']) for error in live
+    ]
+
+
+def test_snapshot_files_discovery(snapshot_dir):
+    client = snapshot.SnapshotClient(snapshot_dir)
+    error_containers, error_log_files = run.find_error_log_files(
+        'all', client.get('p1'), client
+    )
+
+    assert [error_container['_id'] for error_container in error_containers] == [
+        'sub1', 'ses1', 'acq1', 'acq3'
+    ]
+    assert error_log_files['acq1'] == ['t1.dcm.zip.error.log.json']
+
+
+def test_snapshot_client(snapshot_dir):
+    client = snapshot.SnapshotClient(snapshot_dir)
+    session = client.get('ses1')
+
+    assert session.container_type == 'session'
+    assert session.parents.subject == 'sub1'
+    assert [acquisition.id for acquisition in session.acquisitions.find()] == ['acq1', 'acq2']
+    assert [acquisition.id for acquisition in session.acquisitions.find('tags=error')] == ['acq1']
+    assert json.loads(client.get('acq1').read_file('t1.dcm.zip.error.log.json'))[0]['item'] == \
+        'info.header.dicom.Modality'
+    with pytest.raises(ValueError):
+        session.acquisitions.find('label=T1w')
+    with pytest.raises(ValueError):
+        client.get('missing')
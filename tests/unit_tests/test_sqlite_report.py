@@ -0,0 +1,83 @@
+import io
+import sqlite3
+
+import pytest
+import run
+import sqlite_report
+
+
+ERRORS = [
+    {'_id': 'acq1', 'type': 'acquisition', 'path': 'g/p/sub/ses/acq1', 'url': 'url1',
+     'resolved': False, 'error': "'NM' is not one of ['MR']"},
+    {'_id': 'acq1', 'type': 'acquisition', 'path': 'g/p/sub/ses/acq1', 'url': 'url1',
+     'resolved': True},
+    {'_id': 'acq2', 'type': 'acquisition', 'path': 'g/p/sub/ses/acq2', 'url': 'url2',
+     'resolved': False, 'error': "'NM' is not one of ['MR']"},
+    {'_id': 'ses1', 'type': 'session', 'path': 'g/p/sub/ses', 'url': 'url3',
+     'resolved': 'False', 'error': 'Could not find info.Visit'}
+]
+
+
+def write(rows, tmp_path, **kwargs):
+    output_file = io.BytesIO()
+    sqlite_report.write_sqlite_report(iter(rows), output_file, **kwargs)
+    path = tmp_path / 'report.sqlite'
+    path.write_bytes(output_file.getvalue())
+    return path
+
+
+@pytest.mark.parametrize('batch_size', [1, 3, 1000])
+def test_round_trip(tmp_path, monkeypatch, batch_size):
+    monkeypatch.setattr(sqlite_report, 'INSERT_BATCH_SIZE', batch_size)
+    path = write(ERRORS, tmp_path)
+
+    rows = list(sqlite_report.read_sqlite_report(path.read_bytes()))
+    expected = []
+    for error in ERRORS:
+        expected.append(dict({'error': None}, **error))
+        expected[-1]['resolved'] = error['resolved'] in [True, 'True']
+    assert rows == expected
+
+
+def test_normalized_and_indexed(tmp_path):
+    connection = sqlite3.connect(str(write(ERRORS, tmp_path)))
+
+    assert connection.execute('SELECT count(*) FROM containers').fetchone() == (3,)
+    assert connection.execute('SELECT count(*) FROM messages').fetchone() == (2,)
+    assert connection.execute('SELECT count(*) FROM errors').fetchone() == (4,)
+    indexes = {name for name, in connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'"
+    )}
+    assert {'containers_path', 'containers_type', 'errors_container',
+            'errors_message', 'errors_resolved'} <= indexes
+    plan = ' '.join(str(row) for row in connection.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM report WHERE path = 'g/p/sub/ses'"
+    ))
+    assert 'containers_path' in plan
+    assert connection.execute(
+        "SELECT _id FROM report WHERE error = ? AND resolved = 0",
+        ("'NM' is not one of ['MR']",)
+    ).fetchall() == [('acq1',), ('acq2',)]
+
+
+def test_other_reports(tmp_path):
+    groups = run.group_errors(ERRORS, 'sqlite')
+    connection = sqlite3.connect(str(write(groups, tmp_path, fieldnames=run.GROUPED_HEADERS)))
+
+    assert connection.execute(
+        'SELECT error, count, container_ids FROM report'
+    ).fetchall()[0] == ("'NM' is not one of ['MR']", 2, '["acq1", "acq2"]')
+
+
+def test_create_output_file_sqlite(tmp_path):
+    class GearContext(object):
+        def open_output(self, name, mode):
+            return open(tmp_path / name, mode)
+
+    filename = run.create_output_file('label', ERRORS, 'sqlite', GearContext(), 'now')
+
+    assert filename == 'label-now.sqlite'
+    rows = list(sqlite_report.read_sqlite_report((tmp_path / filename).read_bytes()))
+    assert len(rows) == len(ERRORS)
+    assert run.get_shard_filename(filename, run.Shard(0, 2, 'subject')) == \
+        'label-now.shard-0-of-2.sqlite'
@@ -0,0 +1,160 @@
+import io
+import json
+import os
+from pathlib import Path
+
+import pytest
+import run
+import validation_pool
+
+
+DATA_ROOT = Path(__file__).parents[1] / 'data'
+
+
+class MockFile(object):
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+
+class MockContainer(object):
+    def __init__(self, error_log):
+        self.id = 'acquisition_id'
+        self.container_type = 'acquisition'
+        self.error_log = json.dumps(error_log, indent=4)
+        self.file_dict = {'name': 'test.dcm', 'info': {'header': {'dicom': {
+            'Modality': 'NM',
+            'ImageType': ['SCREEN SAVE'],
+            'Units': 'MLML'}
+        }}}
+        self.files = [MockFile('test.dcm', 100),
+                      MockFile('test.dcm.error.log.json', len(self.error_log))]
+        self.reads = 0
+        self.downloads = []
+
+    def to_dict(self):
+        return {'files': [self.file_dict, {'name': 'test.dcm.error.log.json'}]}
+
+    def read_file(self, name):
+        self.reads += 1
+        return self.error_log
+
+    def download_file(self, name, dest_file):
+        with open(dest_file, 'w') as f:
+            f.write(self.error_log)
+        self.downloads.append(dest_file)
+
+
+class MockClient(object):
+    def __init__(self, container):
+        self.container = container
+
+    def get_container(self, _id):
+        return self.container
+
+
+@pytest.fixture
+def error_list():
+    with open(DATA_ROOT / 'test_error_list.json') as err_data:
+        return json.load(err_data)
+
+
+@pytest.mark.parametrize('read_size', [1, 3, 7, 64 * 1024])
+def test_iter_json_array_error_list(error_list, read_size):
+    with open(DATA_ROOT / 'test_error_list.json') as err_data:
+        assert list(run.iter_json_array(err_data, read_size=read_size)) == error_list
+
+
+@pytest.mark.parametrize('text', [
+    '[]', ' [ ] ', '[1, 22, 333]', '[1.5e10,-2,true,false,null]',
+    '["a", "b\\"]", {"c": [1, {"d": "]"}]}]', '\n[\n  {}\n  ,\n  []\n]\n'
+])
+def test_iter_json_array_matches_json(text):
+    for read_size in [1, 2, 5]:
+        assert list(run.iter_json_array(io.StringIO(text), read_size=read_size)) == json.loads(text)
+
+
+@pytest.mark.parametrize('text', ['', '{}', '[1, 2', '[1 2]', '[1,]', '[{"a": }]'])
+def test_iter_json_array_invalid(text):
+    with pytest.raises(ValueError):
+        list(run.iter_json_array(io.StringIO(text), read_size=2))
+
+
+def test_iter_chunks():
+    assert list(run.iter_chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(run.iter_chunks([], 2)) == []
+
+
+def test_stream_error_log_removes_file(error_list):
+    container = MockContainer(error_list)
+    errors = list(run.stream_error_log(container, 'test.dcm.error.log.json'))
+
+    assert errors == error_list
+    assert not os.path.exists(container.downloads[0])
+
+
+def test_streamed_errors_match_read(error_list):
+    container_dictionary = {'_id': 'acquisition_id', 'type': 'acquisition'}
+    read_container = MockContainer(error_list)
+    expected = run.get_container_dictionary_errors(dict(container_dictionary),
+                                                   MockClient(read_container))
+    streamed_container = MockContainer(error_list)
+    streamed = run.get_container_dictionary_errors(dict(container_dictionary),
+                                                   MockClient(streamed_container),
+                                                   streaming_threshold=0)
+
+    assert streamed == expected
+    assert read_container.reads == 1 and not read_container.downloads
+    assert streamed_container.reads == 0 and len(streamed_container.downloads) == 1
+
+
+def test_streamed_errors_with_different_outcomes():
+    error_list = [
+        {'item': 'info.header.dicom.Modality', 'revalidate': True,
+         'schema': {'type': 'string', 'enum': ['CT', 'PT', 'MR']}},
+        {'item': 'info.header.dicom.Units', 'revalidate': True,
+         'schema': {'type': 'string', 'enum': ['MLML', 'BQML']}},
+        {'item': 'info.header.dicom.ImageType', 'revalidate': True,
+         'schema': {'type': 'array', 'maxItems': 0}}
+    ]
+    container_dictionary = {'_id': 'acquisition_id', 'type': 'acquisition'}
+    streamed = run.get_container_dictionary_errors(dict(container_dictionary),
+                                                   MockClient(MockContainer(error_list)),
+                                                   streaming_threshold=0)
+
+    assert [(error.get('error'), error['resolved']) for error in streamed] == [
+        ("'NM' is not one of ['CT', 'PT', 'MR']", False),
+        (None, True),
+        ("['SCREEN SAVE'] is too long", False)
+    ]
+    assert streamed == run.get_container_dictionary_errors(
+        dict(container_dictionary), MockClient(MockContainer(error_list))
+    )
+
+
+def test_streamed_errors_below_threshold(error_list):
+    container = MockContainer(error_list)
+    run.get_container_dictionary_errors({'_id': 'acquisition_id'},
+                                        MockClient(container),
+                                        streaming_threshold=1024 * 1024)
+    assert container.reads == 1 and not container.downloads
+
+
+def test_streamed_errors_with_pool(error_list, monkeypatch):
+    monkeypatch.setattr(run, 'STREAM_CHUNK_SIZE', 2)
+    container_dictionary = {'_id': 'acquisition_id', 'type': 'acquisition'}
+    expected = run.get_container_dictionary_errors(dict(container_dictionary),
+                                                   MockClient(MockContainer(error_list)))
+    with validation_pool.ValidationPool(2) as pool:
+        streamed = run.get_errors([dict(container_dictionary)],
+                                  MockClient(MockContainer(error_list)),
+                                  validation_pool=pool, streaming_threshold=0)
+
+    assert streamed == expected
+
+
+def test_get_streaming_threshold():
+    assert run.get_streaming_threshold({}) is None
+    assert run.get_streaming_threshold({'streaming_threshold_mb': -1}) is None
+    assert run.get_streaming_threshold({'streaming_threshold_mb': 0}) == 0
+    assert run.get_streaming_threshold({'streaming_threshold_mb': 2}) == 2 * 1024 * 1024
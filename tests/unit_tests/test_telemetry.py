@@ -0,0 +1,140 @@
+import io
+import json
+
+import pytest
+import replay
+import telemetry
+from test_replay import FIXTURE_DIR, replay_report
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_format_duration():
+    assert telemetry.format_duration(None) == 'unknown'
+    assert telemetry.format_duration(4.6) == '5s'
+    assert telemetry.format_duration(62) == '1m02s'
+    assert telemetry.format_duration(3723) == '1h02m03s'
+
+
+def test_progress_events():
+    clock = FakeClock()
+    api_calls = [0]
+    reporter = telemetry.ProgressReporter(clock=clock)
+    reporter.api_calls = lambda: api_calls[0]
+
+    error_containers = reporter.track_discovery(iter(['sub1', 'ses1', 'acq1', 'acq2']))
+    next(error_containers)
+    next(error_containers)
+    clock.now += 10
+    api_calls[0] = 20
+    event = reporter.get_event()
+    assert event['stage'] == 'discovery'
+    assert (event['containers_found'], event['discovery_complete']) == (2, False)
+    assert event['containers_remaining'] is None
+    assert event['eta_seconds'] is None
+    assert event['api_calls_per_second'] == 2
+
+    list(error_containers)
+    for _ in range(2):
+        reporter.container_processed()
+        reporter.error_log_read()
+    clock.now += 4
+    api_calls[0] = 40
+    event = reporter.get_event()
+    assert event['stage'] == 'processing'
+    assert event['elapsed_seconds'] == 14
+    assert event['containers_remaining'] == 2
+    assert event['error_logs_read'] == 2
+    # Rates are over the time since the previous event
+    assert event['containers_per_second'] == 0.5
+    assert event['api_calls_per_second'] == 5
+    assert event['eta_seconds'] == 4
+
+    # A stuck run has no throughput and no estimate
+    clock.now += 60
+    event = reporter.get_event()
+    assert event['containers_per_second'] == 0
+    assert event['api_calls_per_second'] == 0
+    assert event['eta_seconds'] is None
+
+
+def test_track_discovery_list():
+    reporter = telemetry.ProgressReporter()
+    error_containers = ['sub1', 'ses1']
+
+    assert reporter.track_discovery(error_containers) is error_containers
+    assert reporter.get_event()['containers_remaining'] == 2
+
+
+def test_start_stop():
+    output_file = io.StringIO()
+    reporter = telemetry.ProgressReporter()
+    reporter.start(interval=0.01, output_file=output_file, api_calls=lambda: 3)
+    reporter.track_discovery(['sub1'])
+    reporter.container_processed()
+    reporter.stop()
+    # Stopping again does not report
+    reporter.stop()
+
+    events = [json.loads(line) for line in output_file.getvalue().splitlines()]
+    assert events[-1]['stage'] == 'done'
+    assert events[-1]['containers_remaining'] == 0
+    assert events[-1]['eta_seconds'] == 0
+    assert events[-1]['api_calls'] == 3
+    assert [event['stage'] for event in events].count('done') == 1
+
+
+def test_rates_start_at_start():
+    clock = FakeClock()
+    api_calls = [30]
+    reporter = telemetry.ProgressReporter(clock=clock)
+    reporter.start(interval=3600, api_calls=lambda: api_calls[0])
+    clock.now += 10
+    api_calls[0] = 40
+    event = reporter.get_event()
+    reporter.stop()
+
+    assert event['api_calls'] == 40
+    assert event['api_calls_per_second'] == 1
+
+
+def read_progress(output_dir):
+    progress_path, = output_dir.glob('progress-*.jsonl')
+    with open(progress_path) as progress_file:
+        return [json.loads(line) for line in progress_file]
+
+
+@pytest.mark.parametrize('config,container_count', [
+    ({}, 5),
+    # The error container without error log is not found
+    ({'discovery': 'files'}, 4),
+    ({'pipeline': True}, 5),
+    ({'validation_workers': 1}, 5),
+    ({'count_only': True}, 5)
+])
+def test_replay_progress(tmp_path, config, container_count):
+    adapter = replay.ReplayAdapter(FIXTURE_DIR, latency=0)
+    replay_report(adapter, tmp_path, **config)
+
+    done, = read_progress(tmp_path)
+    assert done['stage'] == 'done'
+    assert done['discovery_complete']
+    assert done['containers_found'] == done['containers_processed'] == container_count
+    assert done['containers_remaining'] == 0
+    assert done['error_logs_read'] == 4
+    # Only requests are counted, all but the version request of the client
+    # and the analysis label update made after the report
+    assert done['api_calls'] == adapter.request_count - 2
+
+
+def test_replay_progress_disabled(tmp_path):
+    replay_report(replay.ReplayAdapter(FIXTURE_DIR, latency=0), tmp_path,
+                  progress_interval_seconds=0)
+
+    assert not list(tmp_path.glob('progress-*.jsonl'))
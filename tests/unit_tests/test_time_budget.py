@@ -0,0 +1,98 @@
+import json
+from unittest import mock
+
+import pytest
+import time_budget
+
+
+def get_budget(seconds, now):
+    clock = mock.MagicMock(side_effect=lambda: now[0])
+    return time_budget.TimeBudget(seconds, clock=clock)
+
+
+def test_limit_stops_at_deadline():
+    now = [0]
+    budget = get_budget(100, now)
+    processed = []
+    for item in budget.limit(range(5)):
+        processed.append(item)
+        # The margin keeps the last 10 seconds
+        now[0] += 45
+
+    assert processed == [0, 1]
+    assert budget.exhausted
+    assert budget.discovery_complete
+    assert budget.remaining == [2, 3, 4]
+
+
+def test_limit_stops_discovery():
+    now = [100]
+    budget = get_budget(10, now)
+    discovered = []
+
+    def containers():
+        for index in range(3):
+            discovered.append(index)
+            yield {'_id': str(index)}
+
+    limited = budget.limit(containers())
+    assert next(limited) == {'_id': '0'}
+    now[0] = 200
+    assert list(limited) == []
+    # The discovery is not traversed past the deadline
+    assert discovered == [0, 1]
+    assert not budget.discovery_complete
+    assert budget.scheduled == [{'_id': '0'}]
+    assert budget.remaining == [{'_id': '1'}]
+
+
+def test_limit_within_budget():
+    budget = time_budget.TimeBudget(60)
+    assert list(budget.limit(range(3))) == [0, 1, 2]
+    assert not budget.exhausted
+    assert budget.remaining == []
+
+
+@pytest.mark.parametrize('config, seconds', [
+    ({}, None), ({'time_budget_minutes': 0}, None),
+    ({'time_budget_minutes': -1}, None), ({'time_budget_minutes': 1.5}, 90)
+])
+def test_get_time_budget(config, seconds):
+    budget = time_budget.get_time_budget(config)
+    assert (budget and budget.seconds) == seconds
+
+
+def test_checkpoint_round_trip(tmp_path):
+    parent = mock.MagicMock(id='project_id')
+    gear_context = mock.MagicMock()
+    gear_context.open_output.side_effect = lambda name, mode: open(tmp_path / name, mode)
+    filename = time_budget.write_checkpoint(gear_context, parent, [
+        {'_id': 'acq1', 'type': 'acquisition', 'path': 'a/b/c', 'url': 'url'}
+    ], 'now')
+
+    assert filename == 'checkpoint-now.json'
+    with open(tmp_path / filename) as checkpoint_file:
+        assert json.load(checkpoint_file)['parent'] == 'project_id'
+    checkpoint = time_budget.read_checkpoint(tmp_path / filename, parent)
+    assert checkpoint.discovery_complete
+    assert checkpoint.containers == [{'_id': 'acq1', 'type': 'acquisition'}]
+    assert checkpoint.filter([{'_id': 'acq1'}, {'_id': 'acq2'}]) == [{'_id': 'acq1'}]
+    with pytest.raises(ValueError):
+        time_budget.read_checkpoint(tmp_path / filename,
+                                    mock.MagicMock(id='other_id'))
+
+
+def test_checkpoint_of_stopped_discovery(tmp_path):
+    parent = mock.MagicMock(id='project_id')
+    gear_context = mock.MagicMock()
+    gear_context.open_output.side_effect = lambda name, mode: open(tmp_path / name, mode)
+    filename = time_budget.write_checkpoint(
+        gear_context, parent, [{'_id': 'acq2', 'type': 'acquisition'}], 'now',
+        processed_ids={'sub1', 'acq1'}
+    )
+
+    checkpoint = time_budget.read_checkpoint(tmp_path / filename, parent)
+    assert not checkpoint.discovery_complete
+    assert checkpoint.processed_ids == {'sub1', 'acq1'}
+    discovered = iter([{'_id': 'sub1'}, {'_id': 'acq1'}, {'_id': 'acq2'}])
+    assert list(checkpoint.filter(discovered)) == [{'_id': 'acq2'}]
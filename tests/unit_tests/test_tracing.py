@@ -0,0 +1,108 @@
+import io
+import json
+import time
+from unittest import mock
+
+import pytest
+import run
+import tracing
+
+
+class MockGearContext(object):
+    def __init__(self):
+        self.outputs = {}
+
+    def open_output(self, name, mode):
+        output = io.BytesIO() if 'b' in mode else io.StringIO()
+        output.close = lambda: None
+        self.outputs[name] = output
+        return output
+
+
+def test_span_disabled_keeps_totals_only():
+    tracer = tracing.Tracer()
+    with tracer.span('get_errors', category='container'):
+        pass
+
+    assert tracer.events == []
+    assert 'get_errors' in tracer.totals
+
+
+def test_span_enabled_records_trace_event():
+    tracer = tracing.Tracer(enabled=True)
+    with tracer.span('get_errors', category='container', _id='acquisition_id'):
+        pass
+
+    output = io.StringIO()
+    tracer.dump(output)
+    trace = json.loads(output.getvalue())
+    assert len(trace['traceEvents']) == 1
+    event = trace['traceEvents'][0]
+    assert event['name'] == 'get_errors'
+    assert event['ph'] == 'X'
+    assert event['args'] == {'_id': 'acquisition_id'}
+
+
+def test_span_records_on_exception():
+    tracer = tracing.Tracer(enabled=True)
+    with pytest.raises(ValueError):
+        with tracer.span('find_error_containers'):
+            raise ValueError()
+
+    assert tracer.events[0]['name'] == 'find_error_containers'
+
+
+def test_profile_invalid():
+    with pytest.raises(ValueError):
+        with tracing.profile('perf'):
+            pass
+
+
+def test_profile_disabled():
+    with tracing.profile('') as profiler:
+        pass
+    assert profiler is None
+
+
+def test_write_cprofile():
+    gear_context = MockGearContext()
+    with tracing.profile('cprofile') as profiler:
+        sum(range(1000))
+
+    filename = tracing.write_profile(profiler, gear_context, 'now')
+    assert filename == 'profile-now.prof'
+    assert gear_context.outputs[filename].getvalue()
+
+
+def test_write_sampling_profile():
+    gear_context = MockGearContext()
+    with tracing.profile('sampling') as profiler:
+        time.sleep(0.05)
+
+    filename = tracing.write_profile(profiler, gear_context, 'now')
+    assert filename == 'profile-now.folded.txt'
+    assert 'test_write_sampling_profile' in gear_context.outputs[filename].getvalue()
+
+
+def test_main_writes_diagnostics_of_failed_run(monkeypatch):
+    gear_context = MockGearContext()
+    gear_context.config = {'trace': True, 'profiler': 'cprofile'}
+    gear_context.init_logging = lambda: None
+    gear_context.destination = {'id': 'an1'}
+    monkeypatch.setattr(run.flywheel, 'GearContext',
+                        mock.MagicMock(return_value=mock.MagicMock(
+                            __enter__=lambda self: gear_context)))
+    monkeypatch.setattr(run, 'tracer', tracing.Tracer())
+
+    def generate_report(gear_context):
+        with run.tracer.span('generate_report'):
+            raise RuntimeError('failed')
+    monkeypatch.setattr(run, 'generate_report', generate_report)
+
+    with pytest.raises(RuntimeError):
+        run.main()
+
+    trace_filename, = [name for name in gear_context.outputs
+                       if name.startswith('trace-')]
+    assert 'generate_report' in gear_context.outputs[trace_filename].getvalue()
+    assert any(name.endswith('.prof') for name in gear_context.outputs)
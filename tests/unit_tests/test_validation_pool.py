@@ -0,0 +1,118 @@
+import copy
+import json
+from pathlib import Path
+
+import pytest
+import run
+import validation_pool
+
+
+DATA_ROOT = Path(__file__).parents[1] / 'data'
+
+FILE_DICTS = [
+    {'name': 'fail.dcm', 'info': {'header': {'dicom': {
+        'Modality': 'NM',
+        'ImageType': ['SCREEN SAVE'],
+        'Units': 'MLML'}
+    }}},
+    {'name': 'fixed.dcm', 'info': {'header': {'dicom': {
+        'Modality': 'MR',
+        'ImageType': ['NORM'],
+        'StudyDate': 'defined'}
+    }}},
+    {'name': 'missing.dcm', 'info': {}}
+]
+
+
+class MockFile(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class MockContainer(object):
+    def __init__(self, _id, file_dict, error_log):
+        self.id = _id
+        self.container_type = 'acquisition'
+        self.file_dict = file_dict
+        self.error_log = error_log
+        self.error_log_name = '{}.error.log.json'.format(file_dict['name'])
+        self.files = [MockFile(file_dict['name']), MockFile(self.error_log_name)]
+        self.deleted_tags = []
+
+    def to_dict(self):
+        return {'files': [self.file_dict, {'name': self.error_log_name}]}
+
+    def read_file(self, name):
+        return json.dumps(self.error_log)
+
+    def delete_tag(self, tag):
+        self.deleted_tags.append(tag)
+
+
+class MockClient(object):
+    def __init__(self, containers):
+        self.containers = {container.id: container for container in containers}
+
+    def get_container(self, _id):
+        return self.containers[_id]
+
+
+@pytest.fixture
+def error_list():
+    with open(DATA_ROOT / 'test_error_list.json') as err_data:
+        return json.load(err_data)
+
+
+@pytest.fixture
+def pool():
+    with validation_pool.ValidationPool(2, batch_size=3) as pool:
+        yield pool
+
+
+def test_get_validation_pool_disabled():
+    assert validation_pool.get_validation_pool(0) is None
+    assert validation_pool.get_validation_pool(None) is None
+
+
+def test_submit_matches_serial(error_list, pool):
+    for file_dict in FILE_DICTS[:2]:
+        work = []
+        expected = []
+        for error in error_list:
+            if error.get('revalidate'):
+                _, value, schema = run.get_validation_target(file_dict, error)
+                work.append((run.get_schema_fingerprint(schema), value, schema))
+                expected.append(run.get_schema_errors(value, schema))
+
+        assert pool.submit(work).result() == expected
+
+
+def test_submit_error_log_matches_validate(error_list, pool):
+    for file_dict in FILE_DICTS:
+        get_error_statuses = run.submit_error_log(error_list, file_dict, pool)
+        expected = [run.validate(file_dict, error) for error in error_list]
+        assert get_error_statuses() == expected
+
+
+def test_get_errors_matches_serial(error_list, pool):
+    def get_client():
+        return MockClient([
+            MockContainer('acquisition_{}'.format(index), file_dict, error_list)
+            for index, file_dict in enumerate(FILE_DICTS)
+        ])
+
+    error_containers = [
+        {'_id': 'acquisition_{}'.format(index), 'type': 'acquisition'}
+        for index in range(len(FILE_DICTS))
+    ]
+    serial = run.get_errors(copy.deepcopy(error_containers), get_client())
+    pooled = run.get_errors(copy.deepcopy(error_containers), get_client(),
+                            validation_pool=pool)
+
+    assert pooled == serial
+
+
+def test_get_validator_cached():
+    schema = {'type': 'string'}
+    assert run.get_validator(schema) is run.get_validator(dict(schema))
+    assert run.get_validator(schema) is not run.get_validator({'type': 'integer'})
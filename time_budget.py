@@ -0,0 +1,192 @@
+"""Stops scheduling containers when the time budget of a job is nearly used
+up, so that the report of the processed containers and a checkpoint of the
+remaining ones can be written before the job is killed
+
+A discovery still in progress at the deadline is stopped rather than
+traversed to the end, the checkpoint then lists the containers processed so
+far and the next run discovers the containers again, skipping those.
+"""
+import collections.abc
+import json
+import logging
+import time
+
+
+log = logging.getLogger('grp-2')
+
+# Share of the budget kept to finish the containers in progress and write
+# the report and checkpoint
+DEFAULT_MARGIN = 0.1
+
+
+class TimeBudget(object):
+    """Deadline of a run, checked before each container is scheduled
+
+    Args:
+        seconds (float): The time budget of the run, from now
+        margin (float): Share of the budget kept after the deadline
+        clock (callable): Returns the current time in seconds
+    """
+    def __init__(self, seconds, margin=DEFAULT_MARGIN, clock=time.monotonic):
+        self.seconds = seconds
+        self.clock = clock
+        self.deadline = clock() + seconds * (1 - margin)
+        # Containers that were scheduled, and those that were not before the
+        # deadline
+        self.scheduled = []
+        self.remaining = []
+        self.exhausted = False
+        # False if the discovery was stopped at the deadline, remaining then
+        # only has the containers found so far
+        self.discovery_complete = True
+
+    def expired(self):
+        return self.clock() >= self.deadline
+
+    def limit(self, error_containers):
+        """Yields the containers until the deadline, the containers left are
+        collected in remaining
+
+        Args:
+            error_containers (iterable): The container dictionaries, a list
+                or a discovery generator, which is not consumed past the
+                deadline
+
+        Yields:
+            dict: The containers to process
+        """
+        iterator = iter(error_containers)
+        for error_container in iterator:
+            if self.expired():
+                self.exhausted = True
+                self.remaining.append(error_container)
+                if isinstance(error_containers, collections.abc.Sized):
+                    self.remaining.extend(iterator)
+                    log.warning('Time budget of %ds used, %d containers left '
+                                'for the next run', self.seconds,
+                                len(self.remaining))
+                else:
+                    self.discovery_complete = False
+                    log.warning('Time budget of %ds used, discovery stopped '
+                                'after %d containers, the next run discovers '
+                                'the containers left', self.seconds,
+                                len(self.scheduled) + 1)
+                return
+            self.scheduled.append(error_container)
+            yield error_container
+
+def get_time_budget(config):
+    """Returns the time budget of the run
+
+    Args:
+        config (dict): The gear config with time_budget_minutes
+
+    Returns:
+        TimeBudget|None: The budget, None if the run is not time budgeted
+    """
+    minutes = config.get('time_budget_minutes')
+    if not minutes or minutes <= 0:
+        return None
+    return TimeBudget(minutes * 60)
+
+
+class Checkpoint(object):
+    """Containers left by a time budgeted run
+
+    Args:
+        containers (list): The container dictionaries (_id and type) left,
+            None if the discovery was stopped, the containers are then
+            discovered again
+        processed_ids (set): Ids of the containers processed by the previous
+            runs, skipped when the containers are discovered again
+    """
+    def __init__(self, containers, processed_ids=None):
+        self.containers = containers
+        self.processed_ids = set(processed_ids or [])
+
+    @property
+    def discovery_complete(self):
+        return self.containers is not None
+
+    def filter(self, error_containers):
+        """Filters discovered containers to those left by the previous runs
+
+        Args:
+            error_containers (iterable): The container dictionaries, a list
+                or a generator
+
+        Returns:
+            iterable: A list of the containers left if given a list,
+                otherwise a generator
+        """
+        container_ids = None
+        if self.discovery_complete:
+            container_ids = {error_container['_id']
+                             for error_container in self.containers}
+
+        def is_left(error_container):
+            if container_ids is not None:
+                return error_container['_id'] in container_ids
+            return error_container['_id'] not in self.processed_ids
+
+        if isinstance(error_containers, list):
+            return [error_container for error_container in error_containers
+                    if is_left(error_container)]
+        return (error_container for error_container in error_containers
+                if is_left(error_container))
+
+
+def write_checkpoint(gear_context, parent, error_containers, timestamp,
+                     processed_ids=None):
+    """Writes the containers left by a time budgeted run as an analysis
+    output, to pass as the checkpoint input of the next run
+
+    Args:
+        gear_context (GearContext): the gear context so that we can write out
+            the file
+        parent (Container): The container the analysis is attached to
+        error_containers (list): The container dictionaries left
+        timestamp (datetime): timestamp used in the output filename
+        processed_ids (set): Ids of the containers processed so far, given
+            when the discovery was stopped so that the next run discovers
+            the containers again and skips those
+
+    Returns:
+        str: The filename that was used to write the checkpoint
+    """
+    checkpoint = {
+        'parent': parent.id,
+        'containers': [
+            {'_id': error_container['_id'], 'type': error_container['type']}
+            for error_container in error_containers
+        ]
+    }
+    if processed_ids is not None:
+        checkpoint['processed'] = sorted(processed_ids)
+    output_filename = 'checkpoint-{}.json'.format(timestamp)
+    with gear_context.open_output(output_filename, 'w') as output_file:
+        json.dump(checkpoint, output_file)
+    return output_filename
+
+
+def read_checkpoint(checkpoint_path, parent):
+    """Reads the containers left by a previous run
+
+    Args:
+        checkpoint_path (str): Path of a file written by write_checkpoint
+        parent (Container): The container the analysis is attached to, must
+            be the parent of the run that wrote the checkpoint
+
+    Returns:
+        Checkpoint: The containers (_id and type) to process, or the
+            containers to skip if the discovery was stopped
+    """
+    with open(checkpoint_path) as checkpoint_file:
+        checkpoint = json.load(checkpoint_file)
+    if checkpoint['parent'] != parent.id:
+        raise ValueError('Checkpoint of {} cannot be resumed on {}'.format(
+            checkpoint['parent'], parent.id
+        ))
+    if 'processed' in checkpoint:
+        return Checkpoint(None, checkpoint['processed'])
+    return Checkpoint(checkpoint['containers'])
@@ -0,0 +1,187 @@
+"""Timing spans and profilers used to diagnose slow report runs
+
+Spans are exported in the Chrome trace event format, which can be loaded in
+chrome://tracing, Perfetto or speedscope.
+"""
+import collections
+import contextlib
+import cProfile
+import json
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+
+
+log = logging.getLogger('grp-2')
+
+PROFILERS = ['cprofile', 'sampling']
+
+
+class Tracer(object):
+    """Records timing spans as complete ("X") trace events
+
+    Stage spans are always timed and logged; events are only kept in memory
+    when the tracer is enabled so that per-container spans do not grow memory
+    on runs that do not export a trace.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.events = []
+        self.totals = collections.defaultdict(float)
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    @contextlib.contextmanager
+    def span(self, name, category='stage', **args):
+        """Times the enclosed block
+
+        Args:
+            name (str): The name of the span, e.g. the stage function name
+            category (str): 'stage' spans are logged when they finish,
+                'container' spans are only recorded
+            **args: Extra values shown with the event in the trace viewer
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.totals[name] += end - start
+                if self.enabled:
+                    self.events.append({
+                        'name': name,
+                        'cat': category,
+                        'ph': 'X',
+                        'ts': (start - self._origin) * 1e6,
+                        'dur': (end - start) * 1e6,
+                        'pid': self._pid,
+                        'tid': threading.get_ident(),
+                        'args': args
+                    })
+            if category == 'stage':
+                log.info('%s took %.3fs', name, end - start)
+
+    def dump(self, output_file):
+        """Writes the recorded events as a json trace
+
+        Args:
+            output_file (file): A writable text file
+        """
+        with self._lock:
+            json.dump({
+                'traceEvents': self.events,
+                'displayTimeUnit': 'ms'
+            }, output_file)
+
+
+class SamplingProfiler(object):
+    """Periodically samples the stacks of all other threads and aggregates
+    them as folded stacks (one "frame;frame;frame count" line per stack), the
+    format read by flamegraph.pl and speedscope
+
+    Args:
+        interval (float): Seconds between samples
+    """
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('{}:{}'.format(
+                        os.path.basename(code.co_filename), code.co_name
+                    ))
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def dump(self, output_file):
+        """Writes the folded stacks, most frequent first
+
+        Args:
+            output_file (file): A writable text file
+        """
+        for stack, count in self.samples.most_common():
+            output_file.write('{} {}\n'.format(stack, count))
+
+
+@contextlib.contextmanager
+def profile(profiler_name):
+    """Runs the enclosed block under the named profiler
+
+    Args:
+        profiler_name (str): 'cprofile' (deterministic), 'sampling' or a
+            falsy value to disable profiling
+
+    Yields:
+        cProfile.Profile|SamplingProfiler|None: The profiler that ran
+    """
+    if not profiler_name:
+        yield None
+        return
+    if profiler_name not in PROFILERS:
+        raise ValueError('Profiler {} not valid, must be one of {}'.format(
+            profiler_name, PROFILERS
+        ))
+    if profiler_name == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+    else:
+        profiler = SamplingProfiler()
+        profiler.start()
+        try:
+            yield profiler
+        finally:
+            profiler.stop()
+
+
+def write_profile(profiler, gear_context, timestamp):
+    """Writes the profile collected by a profiler as an analysis output
+
+    Args:
+        profiler (cProfile.Profile|SamplingProfiler): A finished profiler
+        gear_context (GearContext): the gear context so that we can write out
+            the file
+        timestamp (datetime): timestamp used in the output filename
+
+    Returns:
+        str: The filename that was used to write the profile
+    """
+    if isinstance(profiler, SamplingProfiler):
+        output_filename = 'profile-{}.folded.txt'.format(timestamp)
+        with gear_context.open_output(output_filename, 'w') as output_file:
+            profiler.dump(output_file)
+    else:
+        # Same content as pstats.Stats.dump_stats, loadable with pstats or
+        # snakeviz
+        stats = pstats.Stats(profiler)
+        output_filename = 'profile-{}.prof'.format(timestamp)
+        with gear_context.open_output(output_filename, 'wb') as output_file:
+            marshal.dump(stats.stats, output_file)
+    return output_filename
@@ -0,0 +1,103 @@
+"""Validates schemas in worker processes for CPU-bound revalidation"""
+import concurrent.futures
+
+
+DEFAULT_BATCH_SIZE = 200
+
+
+def _validate_batch(schemas, work):
+    """Runs in a worker process, validates a batch of values
+
+    Args:
+        schemas (dict): schemas of the batch by fingerprint
+        work (list): list of (fingerprint, value) tuples
+
+    Returns:
+        list: the validation error messages of each value
+    """
+    # Imported here so that the worker compiles validators into its own copy
+    # of the validator cache
+    import run
+
+    return [
+        run.get_schema_errors(value, schemas[fingerprint], fingerprint)
+        for fingerprint, value in work
+    ]
+
+
+class _PendingBatches(object):
+    """The result of ValidationPool.submit, joins the results of its batches
+    """
+    def __init__(self, futures):
+        self.futures = futures
+
+    def result(self):
+        results = []
+        for future in self.futures:
+            results += future.result()
+        return results
+
+
+class ValidationPool(object):
+    """Process pool running run.get_schema_errors, only plain data (schemas,
+    values and messages) crosses the process boundaries and each worker keeps
+    its own compiled validators by schema fingerprint
+
+    Args:
+        workers (int): Number of worker processes
+        batch_size (int): Maximum number of values sent to a worker at once
+    """
+    def __init__(self, workers, batch_size=DEFAULT_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = batch_size
+        # Number of containers to keep in flight, see run.get_errors
+        self.window = workers * 2
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def submit(self, work):
+        """Submits values to validate in batches
+
+        Args:
+            work (list): list of (fingerprint, value, schema) tuples, see
+                run.get_schema_fingerprint
+
+        Returns:
+            _PendingBatches: object whose result() returns the validation
+                error messages of each value, in order
+        """
+        futures = []
+        for start in range(0, len(work), self.batch_size):
+            schemas = {}
+            batch = []
+            for fingerprint, value, schema in work[start:start + self.batch_size]:
+                schemas[fingerprint] = schema
+                batch.append((fingerprint, value))
+            futures.append(
+                self._executor.submit(_validate_batch, schemas, batch)
+            )
+        return _PendingBatches(futures)
+
+
+def get_validation_pool(workers):
+    """Returns a validation pool, or None to validate serially
+
+    Args:
+        workers (int): Number of worker processes, 0 or None for serial
+
+    Returns:
+        ValidationPool|None: the pool
+    """
+    if not workers:
+        return None
+    return ValidationPool(workers)